@@ -1,27 +1,26 @@
 import os
 import re
+import copy
 import requests
-import json
 import tempfile
 import subprocess
-import threading
 import time
 from datetime import datetime
+from concurrent.futures import as_completed
 import logging
 from io import BytesIO
 import platform
-import pygame  # 用于音频播放控制
-from PIL import Image, ImageTk  # 用于图片处理
-
-# 初始化pygame音频模块
-pygame.mixer.init()
-
-# 配置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename="agent_client.log",
+from audio_engine import AudioEngine  # 用于音频播放控制
+from media_items import MEDIA_MARKERS, extract_media_items
+from downloader import ResumableDownload
+from download_manager import DownloadManager, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_PREFETCH
+from log_pipeline import mask_secret
+from app_config import scene_for_key
+from tracing import traced, span, instant, current_flow, is_enabled
+from stream_events import (
+    MessageChunk, MessageEnd, StreamError, get_decoder, TextData, MediaDirective, PreviewData, ProgressData, MediaResult,
 )
+
 logger = logging.getLogger(__name__)
 
 # 文件类型映射表，用于确定下载文件的扩展名
@@ -37,8 +36,12 @@ CONTENT_TYPE_MAPPING = {
 
 class AgentAPIClient:
     """Dify API客户端类，负责与Dify API通信，处理文件上传、音频播放等功能"""
-    def __init__(self, base_url, api_key):
-        """初始化API客户端，加载配置并设置基本参数"""
+    def __init__(self, base_url, api_key, http=None, download_manager=None, audio_engine=None, download_dir=None):
+        """初始化API客户端，加载配置并设置基本参数
+
+        http、download_manager、audio_engine和download_dir可传入与其他客户端共享的实例
+        （如网关中各屏幕的客户端），未提供时创建新的实例
+        """
         self.base_url = base_url  # API基础URL
         self.api_key = api_key  # API密钥
         self.tools = {}  # 清空工具配置
@@ -47,10 +50,19 @@ class AgentAPIClient:
         self.timeout = 120  # 请求超时时间(秒)
         self.current_conversation_id = None  # 当前会话ID
         self.files = []  # 上传文件列表
-        self.playing_files = {}  # 存储正在播放的文件及其状态
-        self.audio_playback_completed = threading.Event()  # 音频播放完成事件
+        self.audio_engine = audio_engine or AudioEngine()  # 独占pygame.mixer的音频引擎
         self.image_cache = {}  # 缓存下载的图片
-        self.download_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads"))
+        # 媒体下载服务
+        self.download_manager = download_manager or DownloadManager(max_workers=4, per_host_limit=2)
+        self.http = http or requests.Session()  # 复用到Dify的连接（网关中多个客户端共享同一个会话）
+        self.prefetch_audio = True  # 下载完成后预解码音频（不在本机播放时关闭）
+        self.background = False  # 为True时媒体按后台预取的优先级下载（如非当前标签页的会话）
+        self.recorder = None  # session_archive.SessionRecorder，设置后录制每轮的SSE字节流和媒体
+        self.cancelled = False  # cancel()后不再发送请求和下载媒体
+        self._active_response = None  # 正在读取的流式响应
+        self.download_dir = download_dir or os.path.normpath(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+        )
         # 确保下载目录存在
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir, exist_ok=True)
@@ -101,7 +113,7 @@ class AgentAPIClient:
                 }
                 data = {"user": "default_user"}
 
-                response = requests.post(
+                response = self.http.post(
                     upload_url, files=files, data=data, headers=headers, timeout=30
                 )
                 response.raise_for_status()
@@ -123,6 +135,7 @@ class AgentAPIClient:
             logger.error(error_msg)
             return None
 
+    @traced("call_agent")
     def call_agent(
         self,
         input_text,
@@ -132,8 +145,16 @@ class AgentAPIClient:
         files=None,
         on_data=None,
         on_end=None,
+        turn=None,
     ):
-        """调用Dify智能体API，支持会话持久化和流式响应"""
+        """调用Dify智能体API，支持会话持久化和流式响应
+
+        turn为turn_metrics.TurnTimer时记录本轮各阶段的时间
+        """
+        if turn:
+            turn.scene = scene_for_key(self.api_key)
+        if self.cancelled:
+            return {"type": "text", "content": "请求已取消"}
         request_body = {
             "query": input_text,
             "user": user_id,
@@ -162,163 +183,163 @@ class AgentAPIClient:
             "Content-Type": "application/json",
         }
 
+        recording = self.recorder.start(request_body) if self.recorder else None
+        result = None
         try:
             url = f"{self.base_url}{self.chat_endpoint}"
-            logger.info("发送API请求，URL：%s，请求体：%s", url, request_body)
+            logger.info("发送API请求，URL：%s", url)
+            # 每轮的请求内容只按比例采样记录
+            logger.info("请求体：%s", request_body, extra={"sampled": True})
 
             # 发送POST请求，设置流式响应
-            response = requests.post(
+            if turn:
+                turn.mark("request_sent")
+            response = self.http.post(
                 url,
                 json=request_body,
                 headers=headers,
                 stream=True,
                 timeout=self.timeout,
             )
+            # 先登记到归档再检查状态码，错误响应的状态和正文也会被记录
+            if recording:
+                recording.attach(response)
             response.raise_for_status()
 
-            return self._process_stream_response(response, on_data, on_end)
+            self._active_response = response
+            result = self._process_stream_response(response, on_data, on_end, turn)
+            return result
 
         except requests.exceptions.HTTPError as e:
             error_data = response.json() if response.content else {"message": str(e)}
             error_msg = f"HTTP错误 {e.response.status_code}: {error_data.get('message', '未知错误')}"
             logger.error(error_msg)
+            if recording:
+                recording.error = error_msg
             if on_end:
                 on_end({"type": "text", "content": error_msg})
             return {"type": "text", "content": error_msg}
         except requests.exceptions.RequestException as e:
-            logger.error("API请求失败: %s", e)
+            if self.cancelled:
+                logger.info("请求已取消: %s", e)
+            else:
+                logger.error("API请求失败: %s", e)
+            if recording:
+                recording.error = str(e)
             if on_end:
                 on_end({"type": "text", "content": f"API请求失败: {str(e)}"})
             return {"type": "text", "content": f"API请求失败: {str(e)}"}
         except Exception as e:
-            logger.error("处理请求时发生异常: %s", e)
+            if self.cancelled:
+                # cancel()关闭了正在读取的响应
+                logger.info("请求已取消: %s", e)
+            else:
+                logger.error("处理请求时发生异常: %s", e)
             if on_end:
                 on_end({"type": "text", "content": f"处理请求异常: {str(e)}"})
             return {"type": "text", "content": f"处理请求异常: {str(e)}"}
+        finally:
+            self._active_response = None
+            if recording:
+                recording.save(result)
 
-    def _process_stream_response(self, response, on_data, on_end):
+    @traced("process_stream_response")
+    def _process_stream_response(self, response, on_data, on_end, turn=None):
         """处理流式响应，解析SSE事件并实时回调"""
-        messages = []
         conversation_id = None
         task_id = None
         is_complete = False
-        full_response = ""
         is_streaming = False  # 标记是否为流式响应
-        audio_file_path = None  # 存储音频文件路径
-        image_file_path = None  # 存储图片文件路径
+        audio_file_path = None  # 存储第一个音频文件路径
+        image_file_path = None  # 存储第一个图片文件路径
         audio_detected = False  # 标记是否检测到音频
         image_detected = False  # 标记是否检测到图片
+        media_items = []  # 回复中的全部媒体项
         original_content = ""  # 存储原始内容
+        decode = get_decoder().decode
+        trace_events = is_enabled()  # 未开启追踪时跳过逐行的instant，免去每行构造参数
 
         # 逐行处理流式响应
         for line in response.iter_lines():
-            if line:
-                try:
-                    data_line = line.decode("utf-8")
-                    if data_line.startswith("data: "):
-                        event_data = json.loads(data_line[6:])
-                        event_type = event_data.get("event")
-
-                        task_id = event_data.get("task_id")
-                        is_streaming = True  # 确认是流式响应
-
-                        if event_type == "message":
-                            message_chunk = event_data.get("answer", "")
-                            messages.append(message_chunk)
-                            full_response += message_chunk
-                            original_content += message_chunk  # 保存原始内容
-
-                            # 检测响应中的音频或图片标记
-                            if "[音频]" in message_chunk and not audio_detected and not image_detected:
-                                audio_detected = True
-                                # 立即通知UI切换到标准输出
-                                if on_data:
-                                    on_data({"type": "audio_detected", "content": message_chunk})
-                            elif "[图片]" in message_chunk and not image_detected and not audio_detected:
-                                image_detected = True
-                                # 立即通知UI切换到标准输出
-                                if on_data:
-                                    on_data({"type": "image_detected", "content": message_chunk})
-
-                            # 通知UI更新流式响应内容
-                            if on_data and not audio_detected and not image_detected:
-                                on_data(
-                                    {
-                                        "type": "text",
-                                        "content": message_chunk,
-                                        "is_chunk": True,
-                                    }
-                                )
-
-                        elif event_type == "error":
-                            error_msg = (
-                                f"API错误: {event_data.get('message', '未知错误')}"
-                            )
-                            logger.error(error_msg)
-                            if on_end:
-                                on_end({"type": "text", "content": error_msg})
-                            return {"type": "text", "content": error_msg}
-
-                        elif event_type == "message_end":
-                            conversation_id = event_data.get("conversation_id")
-                            is_complete = True
-                            break
-
-                except json.JSONDecodeError:
-                    logger.warning("解析流式响应失败: %s", data_line)
-                    continue
-
-        # 处理音频响应
-        if audio_detected:
-            try:
-                # 从响应中提取音频URL
-                url_match = re.search(r"\((https?://[^\)]+)\)", full_response)
-                if url_match:
-                    url = url_match.group(1).strip()
-                    logger.info(f"检测到音频URL: {url}")
-
-                    # 下载音频文件
-                    audio_file_path = self._download_url_content(url)
-                    if audio_file_path:
-                        # 构建新的响应内容，包含文件路径标记
-                        full_response = f"[AUDIO:{audio_file_path}]"
-                    else:
-                        logger.warning("音频文件下载失败")
-                        full_response = "音频文件下载失败，请检查网络连接"
-                else:
-                    logger.warning("未找到有效的音频URL")
-                    full_response = "未找到有效的音频下载链接"
-            except Exception as e:
-                logger.error(f"处理音频响应失败: {e}")
-                full_response = f"处理音频响应时出错: {str(e)}"
-
-        # 处理图片响应
-        elif image_detected:
+            if turn:
+                turn.mark("first_byte")
+            if not line.startswith(b"data: "):
+                continue
             try:
-                # 从响应中提取图片URL
-                url_match = re.search(r"\((https?://[^\)]+)\)", full_response)
-                if url_match:
-                    url = url_match.group(1).strip()
-                    logger.info(f"检测到图片URL: {url}")
-
-                    # 下载图片文件
-                    image_file_path = self._download_image_content(url)
-                    if image_file_path:
-                        # 构建新的响应内容，包含文件路径标记
-                        full_response = f"[IMAGE:{image_file_path}]"
+                event = decode(line[6:])
+            except ValueError:
+                logger.warning("解析流式响应失败: %s", line.decode("utf-8", "replace"))
+                continue
+            if trace_events:
+                instant("sse_event", event=event.event)
+
+            task_id = event.task_id
+            is_streaming = True  # 确认是流式响应
+
+            if type(event) is MessageChunk:
+                if turn:
+                    turn.mark("first_message")
+                    turn.tokens += 1
+                message_chunk = event.answer
+                original_content += message_chunk  # 保存原始内容
+
+                # 检测响应中的音频或图片标记（向前多取几个字符，防止标记被拆分到两个片段）
+                tail = original_content[-(len(message_chunk) + 3):]
+                for marker, kind in MEDIA_MARKERS.items():
+                    if marker not in tail:
+                        continue
+                    if kind == "audio" and not audio_detected:
+                        audio_detected = True
+                    elif kind == "image" and not image_detected:
+                        image_detected = True
                     else:
-                        logger.warning("图片文件下载失败")
-                        full_response = "图片文件下载失败，请检查网络连接"
-                else:
-                    logger.warning("未找到有效的图片URL")
-                    full_response = "未找到有效的图片下载链接"
-            except Exception as e:
-                logger.error(f"处理图片响应失败: {e}")
-                full_response = f"处理图片响应时出错: {str(e)}"
+                        continue
+                    # 立即通知UI切换到标准输出
+                    if on_data:
+                        on_data(MediaDirective(kind, message_chunk))
+
+                # 通知UI更新流式响应内容
+                if on_data and not audio_detected and not image_detected:
+                    on_data(TextData(message_chunk, time.monotonic()))
+
+            elif type(event) is StreamError:
+                error_msg = f"API错误: {event.message}"
+                logger.error(error_msg)
+                if on_end:
+                    on_end({"type": "text", "content": error_msg})
+                return {"type": "text", "content": error_msg}
+
+            elif type(event) is MessageEnd:
+                if turn:
+                    turn.mark("message_end")
+                    # 服务器返回用量时以实际生成的token数代替message事件数
+                    turn.tokens = event.completion_tokens or turn.tokens
+                conversation_id = event.conversation_id
+                is_complete = True
+                break
+
+        full_response = original_content
+
+        # 处理媒体响应：提取全部媒体项并行下载（请求已取消时不再下载）
+        if (audio_detected or image_detected) and not self.cancelled:
+            media_items = extract_media_items(full_response)
+            if media_items:
+                self._download_media_items(media_items, on_data)
+                if turn:
+                    turn.mark("media_ready")
+                audio_file_path = next((item.file_path for item in media_items if item.kind == "audio" and item.ok), None)
+                image_file_path = next((item.file_path for item in media_items if item.kind == "image" and item.ok), None)
+                full_response = "".join(
+                    f"[{item.kind.upper()}:{item.file_path}]" for item in media_items if item.ok
+                ) or "媒体文件下载失败，请检查网络连接"
+            else:
+                logger.warning("未找到有效的媒体URL")
+                full_response = "未找到有效的媒体下载链接"
 
         # 更新会话ID
         if conversation_id:
             self.current_conversation_id = conversation_id
+        logger.info("响应内容：%s", original_content, extra={"sampled": True})
 
         # 构建最终响应
         final_response = {
@@ -330,6 +351,7 @@ class AgentAPIClient:
             "type": "text",
             "audio_detected": audio_detected,  # 添加音频检测标记
             "image_detected": image_detected,  # 添加图片检测标记
+            "media_items": media_items,  # 全部媒体项及下载结果
             "original_content": original_content  # 添加原始内容
         }
 
@@ -339,83 +361,137 @@ class AgentAPIClient:
 
         return final_response
 
-    def change_api_key(self, new_api_key):
-           """修改 API 密钥"""
-           self.api_key = new_api_key
+    @traced("download_media_items")
+    def _download_media_items(self, media_items, on_data=None):
+        """通过下载管理器并行下载媒体项，每完成一项立即通知UI渲染"""
+        start = time.perf_counter()
+        futures = {self._submit_media_item(item, on_data): item for item in media_items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                item.file_path = future.result()
+            except Exception as e:
+                logger.error(f"处理媒体项失败: {e}")
+            if not item.ok:
+                item.error = "图片文件下载失败，请检查网络连接" if item.kind == "image" else "音频文件下载失败，请检查网络连接"
+            if on_data:
+                on_data(MediaResult(item))
+
+        # 与串行下载（各项耗时之和）对比，记录并行带来的延迟收益
+        wall_time = time.perf_counter() - start
+        sequential_time = sum(item.elapsed for item in media_items)
+        logger.info(
+            f"媒体下载完成: {len(media_items)}项, 并行耗时 {wall_time:.2f}s, 串行累计 {sequential_time:.2f}s"
+        )
+        return media_items
+
+    def _submit_media_item(self, item, on_data=None):
+        """把单个媒体项提交给下载管理器，音频优先于图片；返回结果为文件路径的Future"""
+        logger.info(f"检测到{item.kind}URL: {item.url}")
+        on_progress = None
+        if on_data:
+            on_progress = lambda downloaded, total: on_data(ProgressData(item.index, downloaded, total))
+        if item.kind == "image":
+            # 下载过程中推送渐进式预览
+            on_preview = None
+            if on_data:
+                on_preview = lambda preview: on_data(PreviewData(item.index, preview))
+            download = lambda: self._download_image_content(item.url, on_preview, on_progress)
+            priority = PRIORITY_NORMAL
+        else:
+            download = lambda: self._download_url_content(item.url, on_progress)
+            priority = PRIORITY_INTERACTIVE
+        if self.background:
+            # 用户没有在看这个会话，让出给当前会话的下载
+            priority = PRIORITY_PREFETCH
+
+        flow = current_flow()  # 下载在下载管理器的线程中执行，追踪时沿用当前请求的流
+
+        def timed_download():
+            # 只统计实际下载耗时，复用其他请求的下载时耗时为0
+            start = time.perf_counter()
+            try:
+                with span("download", flow=flow, kind=item.kind, index=item.index):
+                    return download()
+            finally:
+                item.elapsed = time.perf_counter() - start
+
+        return self.download_manager.submit(item.url, timed_download, priority)
+
+    def fork(self, api_key=None):
+        """创建拥有独立会话的客户端（可使用其他API密钥），连接、下载管理器、音频引擎和录制器与本客户端共享
+
+        用于同时进行的多个会话（标签页）
+        """
+        client = copy.copy(self)
+        client.api_key = api_key or self.api_key
+        client.current_conversation_id = None
+        client.files = []
+        client.cancelled = False
+        client._active_response = None
+        return client
+
+    def cancel(self):
+        """放弃进行中的请求（会话关闭时，可在其他线程中调用）：关闭正在读取的响应，之后不再发送请求和下载媒体"""
+        self.cancelled = True
+        response = self._active_response
+        if response is not None:
+            response.close()
 
-    def _download_url_content(self, url):
-        """下载URL内容到指定目录，强制使用.mp3格式"""
-        print(f"[调试信息] 下载音频: {url}")
+    def change_api_key(self, new_api_key):
+        """修改 API 密钥"""
+        self.api_key = new_api_key
+        logger.info("已切换API密钥: %s", mask_secret(new_api_key))
+
+    @staticmethod
+    def _filename_from_response(response, prefix):
+        """从Content-Disposition解析文件名，没有时使用时间戳生成"""
+        content_disposition = response.headers.get("content-disposition", "")
+        if content_disposition:
+            match = re.search(r'filename="(.*?)"', content_disposition)
+            if match:
+                return match.group(1)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return f"{prefix}_{timestamp}"
+
+    def _download_url_content(self, url, on_progress=None):
+        """下载URL内容到指定目录，强制使用.mp3格式
+
+        数据写入临时文件并在校验长度后原子重命名，连接中断时自动断点续传；
+        on_progress按(已下载字节数, 总字节数)回调下载进度
+        """
+        logger.debug("下载音频: %s", url)
+
+        def audio_name(response):
+            # 强制使用.mp3扩展名
+            return os.path.splitext(self._filename_from_response(response, "audio"))[0] + ".mp3"
 
         try:
-            # 确保下载目录存在
-            if not os.path.exists(self.download_dir):
-                os.makedirs(self.download_dir, exist_ok=True)
-
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=30, stream=True)
-            response.raise_for_status()
-
-            # 计算文件总大小用于进度显示
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-
-            # 从响应头获取Content-Type和Content-Disposition
-            content_type = response.headers.get("content-type", "")
-            content_disposition = response.headers.get("content-disposition", "")
-
-            # 尝试从Content-Disposition解析文件名
-            filename = None
-            if content_disposition:
-                match = re.search(r'filename="(.*?)"', content_disposition)
-                if match:
-                    filename = match.group(1)
-            # 如果没有从Content-Disposition获取到文件名，则使用时间戳生成文件名
-            if not filename:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"audio_{timestamp}"
-            # 强制使用.mp3扩展名
-            filename = os.path.splitext(filename)[0] + ".mp3"
-            # 保存文件到指定目录
-            file_path = os.path.join(self.download_dir, filename)
-            with open(file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-            logger.info(f"音频文件已下载到: {file_path}")
-            print(f"[文件下载] 已下载音频到: {file_path}")
+            download = ResumableDownload(
+                url,
+                self.download_dir,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                on_progress=on_progress,
+                session=self.http,
+            )
+            file_path = download.run(audio_name)
+            logger.info("音频文件已下载到: %s", file_path)
+            # 下载完成后立即在后台预解码，首次播放无需等待解码
+            if self.prefetch_audio:
+                self.audio_engine.prefetch(file_path)
             return file_path
         except Exception as e:
-            logger.error(f"下载音频文件失败: {e}")
-            print(f"[错误] 音频下载失败: {str(e)}")
+            logger.error("下载音频文件失败: %s", e)
             return None
 
-    def _download_image_content(self, url):
-        """下载图片URL内容到与音频相同的目录，返回文件路径"""
-        print(f"[调试信息] 下载图片: {url}")
+    def _download_image_content(self, url, on_preview=None, on_progress=None):
+        """下载图片URL内容到与音频相同的目录，返回文件路径
 
-        try:
-            # 确保下载目录存在
-            if not os.path.exists(self.download_dir):
-                os.makedirs(self.download_dir, exist_ok=True)
-
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-
-            # 从响应头获取Content-Disposition解析文件名
-            content_disposition = response.headers.get("content-disposition", "")
-            filename = None
-            if content_disposition:
-                match = re.search(r'filename="(.*?)"', content_disposition)
-                if match:
-                    filename = match.group(1)
-            # 如果没有文件名，使用时间戳生成
-            if not filename:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"image_{timestamp}"
+        指定on_preview时在下载过程中回调低分辨率预览图，续传、原子重命名与音频下载相同
+        """
+        logger.debug("下载图片: %s", url)
 
+        def image_name(response):
             # 确定文件扩展名
             content_type = response.headers.get("content-type", "")
             if "image/jpeg" in content_type:
@@ -426,20 +502,39 @@ class AgentAPIClient:
                 ext = "gif"
             else:
                 ext = "jpg"  # 默认使用jpg
+            return f"{os.path.splitext(self._filename_from_response(response, 'image'))[0]}.{ext}"
+
+        # 下载数据同时送入增量解码器生成预览，从头重新下载时换用新的解码器
+        # （首次下载图片时才导入PIL）
+        from progressive_image import ProgressiveImageDecoder
+        decoders = []
 
-            filename = f"{os.path.splitext(filename)[0]}.{ext}"
+        def reset_decoder():
+            decoders[:] = [ProgressiveImageDecoder(on_preview=on_preview)] if on_preview else []
 
-            # 保存到下载目录
-            file_path = os.path.join(self.download_dir, filename)
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            logger.info(f"图片文件已下载到: {file_path}")
-            print(f"[文件下载] 已下载图片到: {file_path}")
+        def feed_decoder(chunk):
+            for decoder in decoders:
+                decoder.feed(chunk)
+
+        try:
+            reset_decoder()
+            download = ResumableDownload(
+                url,
+                self.download_dir,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                on_chunk=feed_decoder if on_preview else None,
+                on_reset=reset_decoder,
+                on_progress=on_progress,
+                session=self.http,
+            )
+            file_path = download.run(image_name)
+            for decoder in decoders:
+                decoder.close()
+            logger.info("图片文件已下载到: %s", file_path)
             return file_path
 
         except Exception as e:
-            logger.error(f"下载图片文件失败: {e}")
-            print(f"[错误] 图片下载失败: {str(e)}")
+            logger.error("下载图片文件失败: %s", e)
             return None
 
     def _open_image(self, file_path):
@@ -463,109 +558,57 @@ class AgentAPIClient:
             logger.error(f"打开图片时出错: {e}")
             return False
 
-    def _play_file(self, file_path, start_time=0):
-        """播放音频文件，支持从指定时间开始播放"""
-        if not os.path.exists(file_path):
-            logger.warning(f"音频文件不存在，无法播放: {file_path}")
-            return False
-
-        try:
-            # 如果已在播放同一文件，先暂停
-            if file_path in self.playing_files:
-                self._resume_file(file_path)
-                return True
-
-            # 加载音频文件
-            pygame.mixer.music.load(file_path)
-
-            # 从指定时间开始播放
-            pygame.mixer.music.play(0, start_time)
-
-            # 记录播放状态
-            self.playing_files[file_path] = {
-                "is_playing": True,
-                "start_time": start_time,
-                "paused": False
-            }
+    @property
+    def playing_files(self):
+        """正在播放或已暂停的文件及其状态（音频引擎状态的快照）"""
+        with self.audio_engine._lock:
+            return {path: dict(state) for path, state in self.audio_engine.states.items()}
 
-            # 启动线程监控播放完成
-            threading.Thread(target=self._monitor_playback, args=(file_path,), daemon=True).start()
+    def add_playback_listener(self, callback):
+        """注册音频状态监听器，回调在音频引擎线程中执行"""
+        self.audio_engine.add_listener(callback)
 
-            logger.info(f"已开始播放音频: {file_path}")
-            return True
+    def remove_playback_listener(self, callback):
+        self.audio_engine.remove_listener(callback)
 
-        except Exception as e:
-            logger.error(f"播放音频文件时出错: {e}")
+    def _play_file(self, file_path, start_time=0):
+        """播放音频文件，支持从指定时间开始播放，已暂停的文件从暂停位置继续"""
+        if not os.path.exists(file_path):
+            logger.warning(f"音频文件不存在，无法播放: {file_path}")
             return False
 
-    def _monitor_playback(self, file_path):
-        """监控音频播放状态，播放完成后设置事件"""
-        while self.playing_files.get(file_path, {}).get("is_playing", False) and not self.playing_files[file_path].get("paused", True):
-            time.sleep(0.5)
-
-        # 播放完成或停止后设置事件
-        self.audio_playback_completed.set()
-        logger.info(f"音频播放完成: {file_path}")
+        self.audio_engine.play(file_path, start_time)
+        return True
 
     def _pause_file(self, file_path):
-        """暂停音频播放"""
-        if file_path not in self.playing_files:
-            return False
-
-        try:
-            if not self.playing_files[file_path]["paused"]:
-                pygame.mixer.music.pause()
-                self.playing_files[file_path]["paused"] = True
-                logger.info(f"已暂停播放音频: {file_path}")
-                return True
-            return False
-
-        except Exception as e:
-            logger.error(f"暂停音频播放时出错: {e}")
-            return False
+        """暂停音频播放（命令按顺序执行，刚提交的播放命令也能被暂停）"""
+        self.audio_engine.pause(file_path)
+        return True
 
     def _resume_file(self, file_path):
         """恢复音频播放"""
-        if file_path not in self.playing_files:
+        state = self.audio_engine.get_state(file_path)
+        if not state or not state["paused"]:
             return False
+        self.audio_engine.resume(file_path)
+        return True
 
-        try:
-            if self.playing_files[file_path]["paused"]:
-                pygame.mixer.music.unpause()
-                self.playing_files[file_path]["paused"] = False
-                logger.info(f"已恢复播放音频: {file_path}")
-                return True
-            return False
-
-        except Exception as e:
-            logger.error(f"恢复音频播放时出错: {e}")
+    def _seek_file(self, file_path, position):
+        """跳转到指定播放位置(秒)"""
+        if not os.path.exists(file_path):
             return False
+        self.audio_engine.seek(file_path, position)
+        return True
 
     def _stop_file(self, file_path):
         """停止音频播放"""
-        if file_path not in self.playing_files:
-            return False
-
-        try:
-            pygame.mixer.music.stop()
-            if file_path in self.playing_files:
-                del self.playing_files[file_path]
-            logger.info(f"已停止播放音频: {file_path}")
-
-            # 重置播放完成事件
-            self.audio_playback_completed.clear()
-            return True
-
-        except Exception as e:
-            logger.error(f"停止音频播放时出错: {e}")
-            return False
+        self.audio_engine.stop(file_path)
+        return True
 
     def is_playing(self, file_path):
         """检查音频文件是否正在播放"""
-        return file_path in self.playing_files and self.playing_files[file_path]["is_playing"] and not self.playing_files[file_path]["paused"]
+        return self.audio_engine.is_playing(file_path)
 
     def get_playback_time(self, file_path):
-        """获取当前播放时间（秒）"""
-        if file_path in self.playing_files and not self.playing_files[file_path]["paused"]:
-            return pygame.mixer.music.get_pos() / 1000  # 转换为秒
-        return 0
\ No newline at end of file
+        """获取当前播放时间（秒），暂停和恢复不会导致位置漂移"""
+        return self.audio_engine.get_position(file_path)
@@ -0,0 +1,42 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "config.json"
+
+_config = None
+_missing = False  # 已报告过缺少配置文件，不再重复读取
+
+
+def load_config():
+    """加载 config.json 文件（首次调用时读取并缓存），缺少文件时返回None"""
+    global _config, _missing
+    if _config is None and not _missing:
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                _config = json.load(f)
+        except FileNotFoundError:
+            _missing = True
+            print("错误：缺少 config.json 文件！请复制 config.example.json 并填写密钥")
+            logger.error(f"缺少配置文件: {os.path.abspath(CONFIG_FILE)}")
+            return None
+    return _config
+
+
+def get_api_key(name):
+    """获取指定场景的API密钥，配置缺失时返回None"""
+    config = load_config()
+    if not config:
+        return None
+    return config.get("api_keys", {}).get(name)
+
+
+def scene_for_key(api_key):
+    """根据API密钥查找对应的场景名，用于统计标签（不暴露密钥本身）"""
+    config = load_config()
+    for name, key in ((config or {}).get("api_keys") or {}).items():
+        if key == api_key:
+            return name
+    return "default"
@@ -0,0 +1,249 @@
+"""场景图片资源包：把背景图和人物照片打包为一个带索引的文件，运行时内存映射读取
+
+资源包格式：
+    8字节魔数 b"AFPKBNDL" | 4字节版本 | 4字节索引长度 | JSON索引 | 按64字节对齐的数据块
+
+每个资源保存原始文件内容和若干预缩放尺寸的PPM(P6)数据。运行时通过mmap访问，
+预缩放尺寸直接交给Tk的PhotoImage，不需要导入PIL、解码JPEG或缩放；
+其他尺寸通过Image.frombuffer在映射内存上零拷贝构造图像后再缩放。
+
+打包：
+    python asset_bundle.py [输出路径]
+"""
+import os
+import io
+import sys
+import json
+import mmap
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b"AFPKBNDL"
+BUNDLE_VERSION = 1
+BUNDLE_FILENAME = "assets.bundle"
+HEADER_FORMAT = "<8sII"
+ALIGNMENT = 64
+
+# 打包的资源及其预缩放尺寸：背景按窗口尺寸，人物照片按信息面板尺寸
+BACKGROUND_SIZES = [(1200, 800), (1920, 1080)]
+PORTRAIT_SIZES = [(140, 140)]
+ASSET_MANIFEST = {
+    "background.jpg": BACKGROUND_SIZES,
+    "bk1.jpg": BACKGROUND_SIZES,
+    "swtsdx.jpg": BACKGROUND_SIZES,
+    "wmlake.jpg": BACKGROUND_SIZES,
+    "pm.jpg": PORTRAIT_SIZES,
+    "zgq.jpg": PORTRAIT_SIZES,
+    "swts.jpg": PORTRAIT_SIZES,
+    "thisisphoto.png": PORTRAIT_SIZES,
+}
+
+
+def base_dirs():
+    """资源查找目录：打包后的解压目录/程序目录，以及源码目录"""
+    dirs = []
+    if getattr(sys, "frozen", False):
+        if hasattr(sys, "_MEIPASS"):
+            dirs.append(sys._MEIPASS)
+        dirs.append(os.path.dirname(sys.executable))
+    dirs.append(os.path.dirname(os.path.abspath(__file__)))
+    return dirs
+
+
+def resolve_resource(path):
+    """解析资源路径：优先当前工作目录（与原有相对路径行为一致），其次程序所在目录"""
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    for directory in base_dirs():
+        candidate = os.path.join(directory, path)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+class AssetBundle:
+    """内存映射的图片资源包"""
+    def __init__(self, path):
+        """打开资源包并读取索引"""
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._map)
+        magic, version, index_length = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.close()
+            raise ValueError(f"无效的资源包: {path}")
+        header_size = struct.calcsize(HEADER_FORMAT)
+        self.index = json.loads(bytes(self._view[header_size:header_size + index_length]).decode("utf-8"))
+
+    def has(self, name):
+        """资源包中是否包含指定资源"""
+        return os.path.basename(name) in self.index
+
+    def variant_sizes(self, name):
+        """资源的预缩放尺寸列表"""
+        entry = self.index.get(os.path.basename(name), {})
+        return [tuple(variant["size"]) for variant in entry.get("variants", [])]
+
+    def _variant(self, name, size):
+        """查找指定尺寸的预缩放数据"""
+        entry = self.index.get(os.path.basename(name))
+        if not entry:
+            return None
+        for variant in entry["variants"]:
+            if tuple(variant["size"]) == tuple(size):
+                return variant
+        return None
+
+    def raw(self, name):
+        """原始文件内容（内存映射视图，不复制）"""
+        entry = self.index.get(os.path.basename(name))
+        if not entry:
+            return None
+        return self._view[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def photo_image(self, name, size, master=None):
+        """返回指定尺寸的Tk图片，不经过PIL；没有该尺寸的预缩放数据时返回None"""
+        variant = self._variant(name, size)
+        if not variant:
+            return None
+        import tkinter as tk
+        data = self._view[variant["offset"]:variant["offset"] + variant["length"]]
+        return tk.PhotoImage(master=master, data=data.tobytes(), format="PPM")
+
+    def open_image(self, name, size=None):
+        """返回PIL图像：有预缩放尺寸时在映射内存上零拷贝构造，否则解码原始文件"""
+        from PIL import Image
+        if size:
+            variant = self._variant(name, size)
+            if variant:
+                pixels = self._view[variant["pixel_offset"]:variant["offset"] + variant["length"]]
+                return Image.frombuffer("RGB", tuple(size), pixels, "raw", "RGB", 0, 1)
+        data = self.raw(name)
+        if data is None:
+            return None
+        return Image.open(io.BytesIO(data))
+
+    def close(self):
+        """关闭资源包"""
+        try:
+            self._view.release()
+            self._map.close()
+        finally:
+            self._file.close()
+
+
+_bundle = None
+_bundle_loaded = False
+_bundle_lock = threading.Lock()
+
+
+def get_bundle():
+    """获取全局资源包（首次调用时查找并映射），没有资源包时返回None"""
+    global _bundle, _bundle_loaded
+    with _bundle_lock:
+        if not _bundle_loaded:
+            _bundle_loaded = True
+            path = os.environ.get("AGENT_ASSET_BUNDLE") or resolve_resource(BUNDLE_FILENAME)
+            if os.path.exists(path):
+                try:
+                    _bundle = AssetBundle(path)
+                    logger.info(f"已加载资源包: {path}")
+                except Exception as e:
+                    logger.error(f"加载资源包失败: {e}")
+        return _bundle
+
+
+def load_bundled_photo(name, size, master=None):
+    """从资源包获取指定尺寸的Tk图片，不可用时返回None"""
+    bundle = get_bundle()
+    if bundle is None or not bundle.has(name):
+        return None
+    try:
+        return bundle.photo_image(name, size, master)
+    except Exception as e:
+        logger.error(f"读取资源包图片失败: {e}")
+        return None
+
+
+def open_image(name):
+    """打开原始图片：优先资源包，其次磁盘文件"""
+    bundle = get_bundle()
+    if bundle is not None and bundle.has(name):
+        return bundle.open_image(name)
+    from PIL import Image
+    return Image.open(resolve_resource(name))
+
+
+def build_bundle(output_path, manifest=None, source_dir=None):
+    """根据清单打包资源，缺失的文件跳过；返回写入的资源数"""
+    from PIL import Image
+    manifest = manifest or ASSET_MANIFEST
+    source_dir = source_dir or os.path.dirname(os.path.abspath(__file__))
+
+    blobs = []
+    index = {}
+    for name, sizes in manifest.items():
+        path = os.path.join(source_dir, name)
+        if not os.path.exists(path):
+            logger.warning(f"资源不存在，跳过: {path}")
+            continue
+        with open(path, "rb") as f:
+            original = f.read()
+        image = Image.open(io.BytesIO(original)).convert("RGB")
+        entry = {"length": len(original), "size": list(image.size), "variants": []}
+        blobs.append((entry, None, original))
+        for size in sizes:
+            header = f"P6\n{size[0]} {size[1]}\n255\n".encode("ascii")
+            pixels = image.resize(size, Image.LANCZOS).tobytes()
+            variant = {"size": list(size), "length": len(header) + len(pixels), "header_length": len(header)}
+            entry["variants"].append(variant)
+            blobs.append((variant, header, pixels))
+        index[name] = entry
+
+    # 索引中的偏移量依赖索引自身长度，先用占位值计算长度再回填
+    header_size = struct.calcsize(HEADER_FORMAT)
+    index_bytes = b""
+    while True:
+        offset = _align(header_size + len(index_bytes))
+        for record, _header, _data in blobs:
+            record["offset"] = offset
+            if "header_length" in record:
+                record["pixel_offset"] = offset + record["header_length"]
+            offset = _align(offset + record["length"])
+        new_index_bytes = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        converged = len(new_index_bytes) == len(index_bytes)
+        index_bytes = new_index_bytes
+        if converged:
+            break
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, BUNDLE_MAGIC, BUNDLE_VERSION, len(index_bytes)))
+        f.write(index_bytes)
+        for record, header, data in blobs:
+            f.write(b"\0" * (record["offset"] - f.tell()))
+            if header:
+                f.write(header)
+            f.write(data)
+    os.replace(tmp_path, output_path)
+    return len(index)
+
+
+def _align(offset):
+    """按ALIGNMENT字节对齐"""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    output = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), BUNDLE_FILENAME)
+    count = build_bundle(output)
+    print(f"已打包 {count} 个资源到 {output} ({os.path.getsize(output) / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,179 @@
+import os
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class DecodedClip:
+    """解码后的PCM音频片段，格式与mixer输出格式一致"""
+    __slots__ = ("file_path", "mtime", "raw", "frequency", "channels", "frame_bytes")
+
+    def __init__(self, file_path, mtime, raw, frequency, channels, frame_bytes):
+        self.file_path = file_path
+        self.mtime = mtime
+        self.raw = raw
+        self.frequency = frequency
+        self.channels = channels
+        self.frame_bytes = frame_bytes  # 每个采样帧(所有声道)占用的字节数
+
+    @property
+    def size(self):
+        """PCM数据字节数"""
+        return len(self.raw)
+
+    @property
+    def duration(self):
+        """时长(秒)"""
+        return self.size / (self.frame_bytes * self.frequency)
+
+    def byte_offset(self, seconds):
+        """将时间换算为对齐到采样帧边界的字节偏移"""
+        frame = int(max(0, seconds) * self.frequency)
+        return min(frame * self.frame_bytes, self.size)
+
+
+class DecodedAudioCache:
+    """解码音频的LRU缓存，按字节预算淘汰最久未使用的片段
+
+    下载完成后可通过prefetch在后台线程中提前解码，播放、恢复和跳转时直接使用内存中的PCM数据。
+    """
+    def __init__(self, max_bytes=128 * 1024 * 1024, ensure_mixer=None):
+        """初始化缓存
+        Args:
+            max_bytes: 缓存的PCM数据字节预算
+            ensure_mixer: 解码前调用的mixer初始化函数（解码依赖mixer的输出格式）
+        """
+        self.max_bytes = max_bytes
+        self.ensure_mixer = ensure_mixer
+        self.clips = OrderedDict()  # 文件路径 -> DecodedClip，按最近使用排序
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # 文件路径 -> 正在解码的完成事件
+        self._prefetch_queue = queue.Queue()
+        self._prefetch_thread = None
+
+    def get(self, file_path):
+        """获取已缓存的片段，文件被修改过则视为未命中"""
+        with self._lock:
+            clip = self.clips.get(file_path)
+            if clip and clip.mtime == self._mtime(file_path):
+                self.clips.move_to_end(file_path)
+                self.hits += 1
+                return clip
+            if clip:
+                self._evict_locked(file_path)
+            self.misses += 1
+            return None
+
+    def get_or_decode(self, file_path):
+        """获取片段，未缓存时同步解码；同一文件正在后台解码时等待其完成"""
+        clip = self.get(file_path)
+        if clip:
+            return clip
+
+        with self._lock:
+            event = self._inflight.get(file_path)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._inflight[file_path] = event
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                clip = self.clips.get(file_path)
+            return clip or self._decode(file_path)
+
+        try:
+            clip = self._decode(file_path)
+            if clip:
+                self._put(clip)
+            return clip
+        finally:
+            with self._lock:
+                self._inflight.pop(file_path, None)
+            event.set()
+
+    def prefetch(self, file_path, on_ready=None):
+        """在后台线程中提前解码文件，on_ready(clip)在解码结束后（在解码线程中）调用，失败时clip为None"""
+        if self._prefetch_thread is None or not self._prefetch_thread.is_alive():
+            self._prefetch_thread = threading.Thread(target=self._prefetch_worker, name="AudioPrefetch", daemon=True)
+            self._prefetch_thread.start()
+        self._prefetch_queue.put((file_path, on_ready))
+
+    def store(self, clip):
+        """放入在其他地方（如解码子进程）解码好的片段"""
+        self._put(clip)
+
+    def _prefetch_worker(self):
+        """后台解码线程"""
+        while True:
+            file_path, on_ready = self._prefetch_queue.get()
+            clip = None
+            try:
+                clip = self.get_or_decode(file_path)
+            except Exception as e:
+                logger.error(f"预解码音频失败: {e}")
+            if on_ready:
+                on_ready(clip)
+
+    def _decode(self, file_path):
+        """将音频文件解码为mixer输出格式的PCM数据，失败时返回None"""
+        try:
+            import pygame  # 首次解码时才加载，与音频引擎的延迟导入一致
+            if self.ensure_mixer:
+                self.ensure_mixer()
+            mtime = self._mtime(file_path)
+            sound = pygame.mixer.Sound(file_path)
+            raw = sound.get_raw()
+            frequency, fmt, channels = pygame.mixer.get_init()
+            frame_bytes = (abs(fmt) // 8) * channels
+            logger.info(f"已解码音频: {file_path}, {len(raw)} 字节")
+            return DecodedClip(file_path, mtime, raw, frequency, channels, frame_bytes)
+        except Exception as e:
+            logger.warning(f"解码音频失败，改用流式播放: {file_path}, {e}")
+            return None
+
+    def _put(self, clip):
+        """写入缓存并按预算淘汰，超过整体预算的片段不缓存"""
+        if clip.size > self.max_bytes:
+            return
+        with self._lock:
+            if clip.file_path in self.clips:
+                self._evict_locked(clip.file_path)
+            self.clips[clip.file_path] = clip
+            self.total_bytes += clip.size
+            while self.total_bytes > self.max_bytes and self.clips:
+                oldest = next(iter(self.clips))
+                self._evict_locked(oldest)
+                logger.debug(f"淘汰解码音频: {oldest}")
+
+    def _evict_locked(self, file_path):
+        """移除片段（需持有锁）"""
+        clip = self.clips.pop(file_path, None)
+        if clip:
+            self.total_bytes -= clip.size
+
+    def invalidate(self, file_path):
+        """移除指定文件的缓存"""
+        with self._lock:
+            self._evict_locked(file_path)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.clips.clear()
+            self.total_bytes = 0
+
+    @staticmethod
+    def _mtime(file_path):
+        """获取文件修改时间，文件不存在时返回None"""
+        try:
+            return os.path.getmtime(file_path)
+        except OSError:
+            return None
@@ -0,0 +1,408 @@
+import os
+import time
+import queue
+import logging
+import threading
+from audio_cache import DecodedAudioCache
+
+logger = logging.getLogger(__name__)
+
+pygame = None  # 首次使用音频时才导入，避免启动时加载SDL
+
+
+def _load_pygame():
+    """延迟导入pygame"""
+    global pygame
+    if pygame is None:
+        import pygame as pygame_module
+        pygame = pygame_module
+    return pygame
+
+# 播放状态
+STATE_PLAYING = "playing"
+STATE_PAUSED = "paused"
+STATE_STOPPED = "stopped"
+STATE_ENDED = "ended"
+STATE_ERROR = "error"
+
+
+class AudioEngine:
+    """音频引擎，由单个后台线程独占pygame.mixer，通过命令队列控制播放
+
+    播放、暂停、跳转、停止命令通过队列交给引擎线程执行。引擎线程阻塞等待命令，等待的超时时间
+    为当前音频的剩余时长，到期时才检查mixer的结束事件，不再定时轮询；状态变化通过监听器回调发布
+    （回调在引擎线程中执行）。
+    已解码的音频保存在LRU缓存中，通过保留声道从内存播放，跳转按采样帧对齐；
+    未缓存的文件先用mixer.music流式播放，同时交给预解码线程解码（引擎线程不等待解码），
+    解码完成后的跳转和重新播放改用内存数据；无法解码为PCM的文件一直流式播放。
+    """
+    def __init__(self, tick_interval=0.05, cache_bytes=128 * 1024 * 1024):
+        """初始化音频引擎
+        Args:
+            tick_interval: 时长未知（流式播放）或到达预计结束时间后仍在输出时，再次检查的间隔(秒)
+            cache_bytes: 解码音频缓存的字节预算
+        """
+        self.tick_interval = tick_interval
+        self.cache = DecodedAudioCache(cache_bytes, ensure_mixer=self.ensure_mixer)
+        self.channel = None  # 内存播放使用的保留声道
+        self.clip = None  # 当前内存播放的解码片段
+        self.duration = None  # 当前文件的时长(秒)，未知时为None
+        self._mixer_lock = threading.Lock()
+        self.commands = queue.Queue()
+        self.states = {}  # 文件路径 -> 播放状态
+        self.listeners = []
+        self.current_file = None  # mixer中当前加载的文件
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._use_end_event = True  # 事件系统不可用时在预计结束时间检查输出状态
+        self.end_event = None  # 播放结束时pygame投递的事件类型
+
+    def start(self):
+        """启动引擎线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="AudioEngine", daemon=True)
+            self._thread.start()
+
+    def ensure_mixer(self):
+        """初始化mixer并保留内存播放声道（可在任意线程调用）"""
+        with self._mixer_lock:
+            _load_pygame()
+            if self.end_event is None:
+                self.end_event = pygame.USEREVENT + 1
+            # 与原先在入口处调用pygame.init()一致，初始化事件系统以接收播放结束事件
+            if not pygame.get_init():
+                pygame.init()
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            if self.channel is None:
+                pygame.mixer.set_reserved(1)
+                self.channel = pygame.mixer.Channel(0)
+
+    def prefetch(self, file_path):
+        """下载完成后在后台预解码音频，后续播放直接使用内存数据"""
+        self.cache.prefetch(file_path)
+
+    def mixer_format(self):
+        """mixer的输出格式(频率, 采样格式, 声道数)，其他进程按此格式解码后可直接放入缓存"""
+        self.ensure_mixer()
+        return pygame.mixer.get_init()
+
+    def shutdown(self, timeout=1.0):
+        """停止播放并结束引擎线程"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        self.commands.put(("shutdown", None, None))
+        self._thread.join(timeout)
+
+    def add_listener(self, callback):
+        """注册状态监听器，回调参数为(file_path, state)，state为状态字典的副本"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """移除状态监听器"""
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    # ---- 对外命令接口（任意线程调用） ----
+
+    def play(self, file_path, start_time=0):
+        """播放音频，已暂停的文件会从暂停位置继续"""
+        self.start()
+        self.commands.put(("play", file_path, start_time))
+
+    def pause(self, file_path):
+        """暂停音频"""
+        self.commands.put(("pause", file_path, None))
+
+    def resume(self, file_path):
+        """恢复播放"""
+        self.commands.put(("resume", file_path, None))
+
+    def seek(self, file_path, position):
+        """跳转到指定位置(秒)"""
+        self.start()
+        self.commands.put(("seek", file_path, position))
+
+    def stop(self, file_path):
+        """停止播放"""
+        self.commands.put(("stop", file_path, None))
+
+    # ---- 状态查询（任意线程调用） ----
+
+    def get_state(self, file_path):
+        """获取文件播放状态字典的副本，不存在时返回None"""
+        with self._lock:
+            state = self.states.get(file_path)
+            return dict(state) if state else None
+
+    def get_summary(self):
+        """返回播放状态计数和解码缓存占用，用于性能面板"""
+        with self._lock:
+            states = [state["state"] for state in self.states.values()]
+        return {
+            "playing": states.count(STATE_PLAYING),
+            "paused": states.count(STATE_PAUSED),
+            "cache_bytes": self.cache.total_bytes,
+            "cache_clips": len(self.cache.clips),
+        }
+
+    def is_playing(self, file_path):
+        """检查文件是否正在播放"""
+        state = self.get_state(file_path)
+        return bool(state) and state["state"] == STATE_PLAYING
+
+    def get_position(self, file_path):
+        """获取当前播放位置(秒)，暂停期间保持不变，恢复后继续累计"""
+        with self._lock:
+            state = self.states.get(file_path)
+            if not state:
+                return 0
+            return self._position_locked(state)
+
+    def _position_locked(self, state):
+        """根据起播偏移和单调时钟计算播放位置（需持有锁）"""
+        if state["state"] == STATE_PLAYING:
+            return state["offset"] + (time.monotonic() - state["resumed_at"])
+        return state["offset"]
+
+    # ---- 引擎线程 ----
+
+    def _run(self):
+        """引擎主循环：执行命令并检测播放结束"""
+        try:
+            self.ensure_mixer()
+            pygame.mixer.music.set_endevent(self.end_event)
+            self.channel.set_endevent(self.end_event)
+        except Exception as e:
+            logger.error(f"初始化音频设备失败: {e}")
+
+        while self._running:
+            timeout = self._wait_timeout()
+            if timeout is not None and timeout <= 0:
+                self._check_finished()
+                continue
+            try:
+                command, file_path, arg = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                # 到达当前音频的预计结束时间
+                self._check_finished()
+                continue
+
+            if command == "shutdown":
+                self._do_stop(self.current_file)
+                self._running = False
+                break
+
+            handler = getattr(self, f"_do_{command}")
+            try:
+                if arg is None:
+                    handler(file_path)
+                else:
+                    handler(file_path, arg)
+            except Exception as e:
+                logger.error(f"执行音频命令{command}失败: {e}")
+                self._set_state(file_path, STATE_ERROR)
+
+    def _wait_timeout(self):
+        """等待命令的超时时间(秒)：当前音频的剩余时长，没有在播放时返回None（一直等待命令）"""
+        if not self.current_file:
+            return None
+        with self._lock:
+            state = self.states.get(self.current_file)
+            if not state or state["state"] != STATE_PLAYING:
+                return None
+            position = self._position_locked(state)
+        if self.duration is None:
+            return self.tick_interval
+        remaining = self.duration - position
+        # 已过预计结束时间但还没有结束（输出有延迟）时，按间隔再次检查
+        return remaining if remaining > 0 else self.tick_interval
+
+    def _check_finished(self):
+        """到达预计结束时间时检查当前音频是否播放结束"""
+        if not self.current_file or not self.is_playing(self.current_file):
+            return
+
+        finished = False
+        if self._use_end_event:
+            try:
+                finished = bool(pygame.event.get(self.end_event))
+            except pygame.error:
+                # 未初始化显示系统时事件队列不可用
+                self._use_end_event = False
+                logger.info("pygame事件队列不可用，播放结束改为在预计结束时间检查输出状态")
+        # 没有显示系统时结束事件可能延迟投递，输出已停止同样视为结束
+        if finished or not self._output_busy():
+            file_path = self.current_file
+            self.current_file = None
+            self.clip = None
+            self.duration = None
+            self._set_state(file_path, STATE_ENDED, remove=True)
+            logger.info(f"音频播放完成: {file_path}")
+
+    def _discard_end_events(self):
+        """丢弃由引擎自身的停止/切换操作产生的结束事件"""
+        if self._use_end_event:
+            try:
+                pygame.event.clear(self.end_event)
+            except pygame.error:
+                self._use_end_event = False
+
+    def _do_play(self, file_path, start_time=0):
+        """播放文件，已暂停的同一文件改为恢复播放"""
+        state = self.get_state(file_path)
+        if state and file_path == self.current_file:
+            if state["state"] == STATE_PAUSED:
+                self._do_resume(file_path)
+            return
+
+        if not os.path.exists(file_path):
+            logger.warning(f"音频文件不存在，无法播放: {file_path}")
+            self._set_state(file_path, STATE_ERROR, remove=True)
+            return
+
+        # 同一时刻只有一个音乐通道，切换文件前停止当前文件
+        if self.current_file and self.current_file != file_path:
+            self._do_stop(self.current_file)
+
+        self.clip = self.cache.get(file_path)
+        self.duration = self.clip.duration if self.clip else None
+        if not self.clip:
+            # 未缓存时先流式播放，不在引擎线程中解码，以免阻塞暂停、停止等命令
+            pygame.mixer.music.load(file_path)
+            self.cache.prefetch(file_path, lambda clip: self._on_decoded(file_path, clip))
+        self._start_output(start_time)
+        self.current_file = file_path
+        self._set_state(file_path, STATE_PLAYING, offset=start_time)
+        logger.info(f"已开始播放音频: {file_path}")
+
+    def _on_decoded(self, file_path, clip):
+        """预解码线程：解码成功后通知引擎线程"""
+        if clip:
+            self.commands.put(("decoded", file_path, None))
+
+    def _do_decoded(self, file_path):
+        """流式播放中的文件解码完成：记录时长，之后的跳转改用内存数据"""
+        if file_path == self.current_file and not self.clip:
+            clip = self.cache.get(file_path)
+            if clip:
+                self.duration = clip.duration
+
+    def _do_pause(self, file_path):
+        """暂停当前文件并冻结播放位置"""
+        if file_path != self.current_file or not self.is_playing(file_path):
+            return
+        self._output_pause()
+        self._set_state(file_path, STATE_PAUSED, offset=self.get_position(file_path))
+        logger.info(f"已暂停播放音频: {file_path}")
+
+    def _do_resume(self, file_path):
+        """从暂停位置恢复播放"""
+        state = self.get_state(file_path)
+        if file_path != self.current_file or not state or state["state"] != STATE_PAUSED:
+            return
+        self._output_unpause()
+        self._set_state(file_path, STATE_PLAYING, offset=state["offset"])
+        logger.info(f"已恢复播放音频: {file_path}")
+
+    def _do_seek(self, file_path, position):
+        """跳转到指定位置，暂停状态下跳转后保持暂停"""
+        position = max(0, position)
+        state = self.get_state(file_path)
+        if file_path != self.current_file or not state:
+            self._do_play(file_path, position)
+            return
+        if not self.clip:
+            # 解码已完成时从流式播放切换到内存播放，跳转按采样帧对齐
+            self.clip = self.cache.get(file_path)
+        if self.clip:
+            position = min(position, self.clip.duration)
+        self._start_output(position)
+        if state["state"] == STATE_PAUSED:
+            self._output_pause()
+            self._set_state(file_path, STATE_PAUSED, offset=position)
+        else:
+            self._set_state(file_path, STATE_PLAYING, offset=position)
+
+    def _do_stop(self, file_path):
+        """停止播放并移除文件状态"""
+        if not file_path:
+            return
+        if file_path == self.current_file:
+            self._output_stop()
+            self._discard_end_events()
+            self.current_file = None
+            self.clip = None
+            self.duration = None
+        if self.get_state(file_path):
+            self._set_state(file_path, STATE_STOPPED, remove=True)
+            logger.info(f"已停止播放音频: {file_path}")
+
+    # ---- 输出：内存片段走保留声道，否则走mixer.music ----
+
+    def _start_output(self, position):
+        """从指定位置开始输出当前文件"""
+        if self.clip:
+            pygame.mixer.music.stop()
+            # 按采样帧对齐截取PCM数据，实现精确跳转
+            start = self.clip.byte_offset(position)
+            sound = pygame.mixer.Sound(buffer=memoryview(self.clip.raw)[start:])
+            self.channel.play(sound)
+        else:
+            self.channel.stop()
+            pygame.mixer.music.play(0, position)
+        self._discard_end_events()
+
+    def _output_pause(self):
+        """暂停输出"""
+        if self.clip:
+            self.channel.pause()
+        else:
+            pygame.mixer.music.pause()
+
+    def _output_unpause(self):
+        """恢复输出"""
+        if self.clip:
+            self.channel.unpause()
+        else:
+            pygame.mixer.music.unpause()
+
+    def _output_stop(self):
+        """停止输出"""
+        if self.clip:
+            self.channel.stop()
+        else:
+            pygame.mixer.music.stop()
+
+    def _output_busy(self):
+        """检查是否仍在输出"""
+        if self.clip:
+            return self.channel.get_busy()
+        return pygame.mixer.music.get_busy()
+
+    def _set_state(self, file_path, new_state, offset=0, remove=False):
+        """更新文件状态并通知监听器"""
+        with self._lock:
+            state = {
+                "file_path": file_path,
+                "state": new_state,
+                "offset": offset,
+                "resumed_at": time.monotonic(),
+                "paused": new_state == STATE_PAUSED,
+                "is_playing": new_state in (STATE_PLAYING, STATE_PAUSED),
+            }
+            if remove:
+                self.states.pop(file_path, None)
+            else:
+                self.states[file_path] = state
+            snapshot = dict(state)
+
+        for listener in list(self.listeners):
+            try:
+                listener(file_path, snapshot)
+            except Exception as e:
+                logger.error(f"音频状态回调失败: {e}")
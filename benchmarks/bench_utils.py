@@ -0,0 +1,65 @@
+"""基准测试公用工具：虚拟显示、统计汇总"""
+import os
+import sys
+import time
+import shutil
+import atexit
+import statistics
+import subprocess
+
+# 仓库根目录，基准脚本需要从这里导入模块并读取相对路径的图片资源
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_repo_path():
+    """把仓库根目录加入导入路径并切换工作目录"""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(REPO_ROOT)
+
+
+def ensure_display(display=":99", screen="1280x900x24"):
+    """Linux下没有DISPLAY时启动Xvfb虚拟显示，返回使用的DISPLAY"""
+    if os.environ.get("DISPLAY") or not sys.platform.startswith("linux"):
+        return os.environ.get("DISPLAY")
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        raise RuntimeError("未找到DISPLAY，也未安装Xvfb（apt install xvfb）")
+    process = subprocess.Popen([xvfb, display, "-screen", "0", screen, "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    atexit.register(process.terminate)
+    time.sleep(0.5)
+    os.environ["DISPLAY"] = display
+    return display
+
+
+def percentile(samples, pct):
+    """计算百分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """汇总样本：次数、中位数、p95、最小值、最大值"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "median": statistics.median(samples),
+        "p95": percentile(samples, 95),
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def format_ms(summary):
+    """以毫秒格式化汇总结果"""
+    if not summary.get("count"):
+        return "无数据"
+    return "median {median:.1f} ms | p95 {p95:.1f} ms | min {min:.1f} ms | max {max:.1f} ms (n={count})".format(
+        count=summary["count"],
+        **{key: summary[key] * 1000 for key in ("median", "p95", "min", "max")}
+    )
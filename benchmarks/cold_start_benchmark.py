@@ -0,0 +1,105 @@
+"""打包程序冷启动基准：对比onefile打包与onedir+资源包打包的启动耗时
+
+用法:
+    pyinstaller main.spec            # onefile -> dist/AgentFromPku(.exe)
+    python asset_bundle.py           # 生成 assets.bundle
+    pyinstaller main_onedir.spec     # onedir  -> dist/AgentFromPku/AgentFromPku(.exe)
+    python benchmarks/cold_start_benchmark.py --onefile dist/AgentFromPku --onedir dist/AgentFromPku/AgentFromPku
+
+被测程序通过环境变量 AGENT_STARTUP_PROBE=1 启用启动探针，在首次绘制和可交互时输出标记。
+--drop-caches 在每次运行前清空操作系统文件缓存以测量真正的冷启动（Linux下需要root权限）；
+不清空缓存时第一次运行为冷启动，其余为热启动。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import ensure_display, summarize, format_ms
+
+
+def drop_caches():
+    """清空系统文件缓存，失败时返回False"""
+    if sys.platform.startswith("linux"):
+        try:
+            subprocess.run(["sync"], check=True)
+            with open("/proc/sys/vm/drop_caches", "w") as f:
+                f.write("3\n")
+            return True
+        except OSError:
+            return False
+    return False
+
+
+def run_once(executable, timeout=60):
+    """启动一次打包程序，返回各标记相对进程启动的耗时(秒)"""
+    env = dict(os.environ, AGENT_STARTUP_PROBE="1")
+    start = time.perf_counter()
+    process = subprocess.Popen([executable], cwd=os.path.dirname(os.path.abspath(executable)),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    timings = {}
+    try:
+        for line in process.stdout:
+            line = line.strip()
+            if line in ("first_paint", "interactive"):
+                timings[line] = time.perf_counter() - start
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    timings["exit"] = time.perf_counter() - start
+    return timings
+
+
+def measure(executable, runs, cold):
+    """多次运行同一程序，返回首帧和可交互耗时的统计"""
+    results = {"first_paint": [], "interactive": []}
+    for i in range(runs):
+        if cold and not drop_caches():
+            print("无法清空文件缓存（需要Linux root权限），改为测量热启动")
+            cold = False
+        timings = run_once(executable)
+        for key in results:
+            if key in timings:
+                results[key].append(timings[key])
+        if i == 0:
+            results["first_run"] = {key: timings.get(key) for key in ("first_paint", "interactive")}
+    first_run = results.pop("first_run", {})
+    report = {key: summarize(samples) for key, samples in results.items()}
+    report["first_run"] = first_run
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentFromPku 打包程序冷启动基准")
+    parser.add_argument("--onefile", help="onefile打包的可执行文件")
+    parser.add_argument("--onedir", help="onedir打包（含资源包）的可执行文件")
+    parser.add_argument("--runs", type=int, default=5, help="每个程序的运行次数")
+    parser.add_argument("--drop-caches", action="store_true", help="每次运行前清空文件缓存")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    targets = {name: path for name, path in (("onefile", args.onefile), ("onedir", args.onedir)) if path}
+    if not targets:
+        parser.error("至少需要指定 --onefile 或 --onedir")
+
+    ensure_display()
+    reports = {}
+    for name, path in targets.items():
+        report = measure(path, args.runs, args.drop_caches)
+        reports[name] = report
+        first = report["first_run"]
+        print(f"[{name}] {path}")
+        print(f"  首次运行           : first_paint={first.get('first_paint')}, interactive={first.get('interactive')}")
+        print(f"  time-to-first-paint : {format_ms(report['first_paint'])}")
+        print(f"  time-to-interactive : {format_ms(report['interactive'])}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
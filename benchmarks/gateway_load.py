@@ -0,0 +1,294 @@
+"""网关负载测试：N个模拟屏幕通过WebSocket连接网关（gateway.py），网关连接本地模拟Dify服务
+
+用法:
+    python benchmarks/gateway_load.py --clients 10,50,100
+    python benchmarks/gateway_load.py --clients 50 --slow-clients 5 --max-active-turns 20 --json gateway.json
+
+模拟服务和网关各在独立子进程中运行，本进程只运行屏幕客户端（asyncio）。每个屏幕按
+load_generator的对话脚本进行多轮对话，收到媒体消息后通过网关的HTTP接口下载媒体；
+收到busy时等待retry_after后重试。--slow-clients个屏幕每条消息后暂停--slow-delay秒，
+用来观察背压（消息合并、断开积压过多的连接）对其他屏幕的影响。
+每个并发级别报告TTFT/整轮耗时/媒体延迟的p50/p95/p99、被拒绝的连接、busy次数，
+以及网关进程的峰值线程数、峰值内存和回复缓存、媒体缓存命中次数。
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import REPO_ROOT, setup_repo_path, summarize, percentile
+from sse_benchmark import add_server_arguments, start_mock_server, free_port, SERVER_OPTIONS
+from load_generator import DIALOGUE, SCENE_KEYS, format_latency
+
+# 网关统计中按级别计算差值的计数
+GATEWAY_COUNTERS = ("accepted", "rejected", "busy", "dropped", "coalesced")
+
+
+def start_gateway(base_url, args, media_dir):
+    """在子进程中启动网关，就绪后返回(进程, 网关地址)"""
+    port = free_port()
+    scene_keys = ",".join(f"{key_name}=app-load-{key_name}" for key_name in SCENE_KEYS.values())
+    command = [
+        sys.executable, os.path.join(REPO_ROOT, "gateway.py"),
+        "--port", str(port),
+        "--base-url", f"{base_url}/v1",
+        "--api-key", "app-load-default",
+        "--scene-keys", scene_keys,
+        "--media-dir", media_dir,
+        "--max-clients", str(args.max_clients),
+        "--max-active-turns", str(args.max_active_turns),
+        "--max-pending", str(args.max_pending),
+        "--response-cache-ttl", str(args.response_cache_ttl),
+    ]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    gateway_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{gateway_url}/health", timeout=0.5)
+            return process, gateway_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("网关启动超时")
+
+
+def gateway_stats(gateway_url):
+    return requests.get(f"{gateway_url}/health", timeout=5).json()
+
+
+async def run_turn(websocket, gateway_url, query, slow_delay, counters):
+    """发送一轮请求并接收到本轮结束，返回本轮测量结果（连接断开时返回None）"""
+    loop = asyncio.get_running_loop()
+    result = {"ok": False, "ttft": None, "total": None, "media": [], "media_failed": 0, "scene": None,
+              "cached": False}
+    started = time.perf_counter()
+    await websocket.send(json.dumps({"type": "submit", "text": query}, ensure_ascii=False))
+    downloads = []
+    while True:
+        raw = await websocket.recv()
+        if raw is None:
+            return None
+        message = json.loads(raw)
+        kind = message["type"]
+        if slow_delay:
+            await asyncio.sleep(slow_delay)
+        if kind == "busy":
+            counters["busy"] += 1
+            result["busy"] = message.get("retry_after", 1)
+            return result
+        if kind == "text" and result["ttft"] is None:
+            result["ttft"] = time.perf_counter() - started
+        elif kind == "media":
+            if message["ok"]:
+                url = gateway_url + message["url"]
+                downloads.append(loop.run_in_executor(
+                    None, lambda url=url: (requests.get(url, timeout=30).content, time.perf_counter() - started)[1]
+                ))
+            else:
+                result["media_failed"] += 1
+        elif kind == "scene":
+            result["scene"] = message["garden"]
+        elif kind == "turn_finished":
+            result["total"] = time.perf_counter() - started
+            result["ok"] = message["status"] == "ok"
+            result["cached"] = message.get("cached", False)
+            break
+    for download in downloads:
+        try:
+            result["media"].append(await download)
+        except requests.exceptions.RequestException:
+            result["media_failed"] += 1
+    return result
+
+
+async def run_client(index, gateway_url, args, results, counters, slow):
+    """一个模拟屏幕：连接网关并按脚本完成rounds轮对话"""
+    from websocket_protocol import connect, WebSocketError
+
+    rng = random.Random(f"{args.seed}-{index}")
+    ws_url = gateway_url.replace("http://", "ws://") + "/ws"
+    try:
+        websocket = await connect(ws_url)
+    except (WebSocketError, OSError):
+        counters["rejected"] += 1
+        return
+    slow_delay = args.slow_delay if slow else 0
+    try:
+        hello = json.loads(await websocket.recv())
+        assert hello["type"] == "hello"
+        for _ in range(args.rounds):
+            for query in DIALOGUE:
+                for _ in range(args.busy_retries + 1):
+                    result = await run_turn(websocket, gateway_url, query, slow_delay, counters)
+                    if result is None:
+                        counters["disconnected"] += 1
+                        return
+                    if "busy" not in result:
+                        break
+                    await asyncio.sleep(result["busy"] * rng.uniform(0.5, 1.5))
+                else:
+                    result["ok"] = False
+                result["slow"] = slow
+                results.append(result)
+                if args.think:
+                    await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+    finally:
+        await websocket.close()
+
+
+async def run_clients(gateway_url, clients, args, results, counters):
+    tasks = []
+    for index in range(clients):
+        tasks.append(asyncio.create_task(
+            run_client(index, gateway_url, args, results, counters, slow=index < args.slow_clients)
+        ))
+        # 在ramp时间内逐个连接
+        if args.ramp and clients > 1:
+            await asyncio.sleep(args.ramp / (clients - 1))
+    await asyncio.gather(*tasks)
+
+
+async def sample_gateway(gateway_url, peaks, stop):
+    """定期读取网关统计，记录峰值线程数和内存"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        try:
+            stats = await loop.run_in_executor(None, gateway_stats, gateway_url)
+            peaks["threads"] = max(peaks["threads"], stats["threads"])
+            peaks["rss"] = max(peaks["rss"], stats["rss"] or 0)
+            peaks["active_turns"] = max(peaks["active_turns"], stats["active_turns"])
+        except requests.exceptions.RequestException:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level_async(gateway_url, clients, args):
+    results = []
+    counters = {"rejected": 0, "busy": 0, "disconnected": 0}
+    peaks = {"threads": 0, "rss": 0, "active_turns": 0}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_gateway(gateway_url, peaks, stop))
+    started = time.perf_counter()
+    await run_clients(gateway_url, clients, args, results, counters)
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+    return results, counters, peaks, wall
+
+
+def run_level(gateway_url, clients, args):
+    """以指定屏幕数运行一轮负载，返回汇总结果"""
+    before = gateway_stats(gateway_url)
+    results, counters, peaks, wall = asyncio.run(run_level_async(gateway_url, clients, args))
+    after = gateway_stats(gateway_url)
+
+    ok = [result for result in results if result["ok"]]
+    normal = [result for result in ok if not result["slow"]]
+
+    def stats(samples):
+        summary = summarize(samples)
+        if summary.get("count"):
+            summary["p99"] = percentile(samples, 99)
+        return summary
+
+    cache_before = before["response_cache"] or {}
+    cache_after = after["response_cache"] or {}
+    return {
+        "clients": clients,
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "rejected_clients": counters["rejected"],
+        "disconnected_clients": counters["disconnected"],
+        "busy": counters["busy"],
+        "media_failed": sum(result["media_failed"] for result in ok),
+        "scene_switches": sum(1 for result in ok if result["scene"]),
+        "cached_turns": sum(1 for result in ok if result["cached"]),
+        "wall": wall,
+        "turns_per_second": len(results) / wall if wall else 0.0,
+        "gateway": {
+            **{name: after[name] - before[name] for name in GATEWAY_COUNTERS},
+            "peak_threads": peaks["threads"],
+            "peak_rss": peaks["rss"],
+            "peak_active_turns": peaks["active_turns"],
+            "response_cache_hits": cache_after.get("hits", 0) - cache_before.get("hits", 0),
+            "media_cache_hits": after["downloads"]["cache_hits"] - before["downloads"]["cache_hits"],
+        },
+        # 慢速屏幕的耗时包含它自己的读取延迟，只统计正常屏幕
+        "ttft": stats([result["ttft"] for result in normal if result["ttft"] is not None]),
+        "total": stats([result["total"] for result in normal if result["total"] is not None]),
+        "media": stats([latency for result in normal for latency in result["media"]]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关负载测试（本地模拟Dify服务）")
+    parser.add_argument("--clients", default="10,50,100", help="逗号分隔的屏幕数，依次运行")
+    parser.add_argument("--rounds", type=int, default=1, help="每个屏幕重复对话脚本的次数")
+    parser.add_argument("--think", type=float, default=0.5, help="两轮之间的平均思考时间(秒)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="逐个连接全部屏幕所用的时间(秒)")
+    parser.add_argument("--slow-clients", type=int, default=0, help="读取缓慢的屏幕数")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="慢速屏幕每条消息后的暂停(秒)")
+    parser.add_argument("--busy-retries", type=int, default=10, help="收到busy后的最大重试次数")
+    parser.add_argument("--max-clients", type=int, default=200, help="网关: 最大连接数")
+    parser.add_argument("--max-active-turns", type=int, default=32, help="网关: 同时进行的最大请求数")
+    parser.add_argument("--max-pending", type=int, default=256, help="网关: 每个连接允许积压的消息数")
+    parser.add_argument("--response-cache-ttl", type=float, default=0,
+                        help="网关: 首轮回复缓存有效期(秒)，默认不缓存以测量上游路径")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    levels = [int(value) for value in args.clients.split(",") if value.strip()]
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    setup_repo_path()
+
+    process, base_url = start_mock_server(args)
+    reports = []
+    with tempfile.TemporaryDirectory() as media_dir:
+        gateway, gateway_url = start_gateway(base_url, args, media_dir)
+        try:
+            for clients in levels:
+                report = run_level(gateway_url, clients, args)
+                reports.append(report)
+                stats = report["gateway"]
+                print(f"[{clients}屏幕] {report['turns']}轮, 错误率 {report['error_rate']:.1%}, "
+                      f"拒绝连接 {report['rejected_clients']}, 断开 {report['disconnected_clients']}, "
+                      f"busy {report['busy']}, {report['turns_per_second']:.1f} 轮/s")
+                print(f"  TTFT      {format_latency(report['ttft'])}")
+                print(f"  整轮耗时  {format_latency(report['total'])}")
+                print(f"  媒体延迟  {format_latency(report['media'])}")
+                print(f"  网关: 峰值线程 {stats['peak_threads']}, 峰值内存 {stats['peak_rss'] / 1048576:.0f} MB, "
+                      f"峰值并发请求 {stats['peak_active_turns']}, 合并消息 {stats['coalesced']}, "
+                      f"断开慢连接 {stats['dropped']}, 回复缓存命中 {stats['response_cache_hits']}, "
+                      f"媒体缓存命中 {stats['media_cache_hits']}")
+        finally:
+            gateway.terminate()
+            gateway.wait()
+            process.terminate()
+            process.wait()
+
+    if json_path:
+        options = {name: getattr(args, name) for name in SERVER_OPTIONS}
+        options.update(rounds=args.rounds, think=args.think, ramp=args.ramp, slow_clients=args.slow_clients,
+                       slow_delay=args.slow_delay, max_active_turns=args.max_active_turns,
+                       max_pending=args.max_pending, response_cache_ttl=args.response_cache_ttl)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "levels": reports}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""群聊基准：同一个问题依次问各场景智能体 vs 同时问（GroupChat），比较总耗时
+
+用法:
+    python benchmarks/group_chat_benchmark.py --rounds 5 --jitter 0.3
+    python benchmarks/group_chat_benchmark.py --query "介绍一下你自己" --json group.json
+
+每轮先依次单独询问每个智能体，得到各自的耗时（其最大值为"最慢智能体"，总和为"串行合计"），
+再用GroupChat同时询问所有智能体。报告：
+    首个回复    群聊开始到最先回复的智能体的首个文本片段
+    群聊总耗时  群聊开始到所有智能体回复结束
+    总耗时/最慢 每轮群聊总耗时与同轮最慢单个智能体耗时之比，接近1表示回复完全并行
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import setup_repo_path, summarize, format_ms
+from load_generator import SCENE_KEYS
+from sse_benchmark import add_server_arguments, start_mock_server, SERVER_OPTIONS
+
+
+def ask(group, query, agents, timeout):
+    """运行一轮群聊并等待结束，返回GroupFinished事件（超时返回None）"""
+    from group_chat import GroupFinished
+
+    finished = []
+    done = threading.Event()
+
+    def on_event(event):
+        # 各轮依次进行，等待期间收到的GroupFinished就是本轮的
+        if isinstance(event, GroupFinished):
+            finished.append(event)
+            done.set()
+
+    group.subscribe(on_event)
+    try:
+        if group.submit(query, agents) is not None:
+            done.wait(timeout)
+    finally:
+        group.unsubscribe(on_event)
+    return finished[0] if finished else None
+
+
+def run_rounds(base_url, args):
+    from api_client import AgentAPIClient
+    from group_chat import GroupChat
+
+    client = AgentAPIClient(f"{base_url}/v1", "app-group-default")
+    client.prefetch_audio = False
+    api_keys = {key_name: f"app-group-{key_name}" for key_name in SCENE_KEYS.values()}
+    agents = list(SCENE_KEYS)
+    rows = []
+    with tempfile.TemporaryDirectory() as download_dir:
+        client.download_dir = download_dir
+        group = GroupChat(client, user_id="group_benchmark", api_keys=api_keys)
+        for index in range(args.warmup + args.rounds):
+            singles = {}
+            for garden in agents:
+                event = ask(group, args.query, [garden], args.timeout)
+                singles[garden] = event.wall_time if event else None
+            event = ask(group, args.query, agents, args.timeout)
+            if index < args.warmup or event is None or None in singles.values():
+                continue
+            slowest = max(singles.values())
+            rows.append({
+                "first_response": event.first_response,
+                "wall_time": event.wall_time,
+                "slowest_single": slowest,
+                "sequential": sum(singles.values()),
+                "ratio": event.wall_time / slowest,
+            })
+            print(f"  第{len(rows)}轮: 群聊 {event.wall_time * 1000:.0f} ms, 最慢单个 {slowest * 1000:.0f} ms, "
+                  f"串行合计 {sum(singles.values()) * 1000:.0f} ms")
+        client.download_manager.shutdown()
+        client.audio_engine.shutdown()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="群聊并行回复基准（本地模拟Dify服务）")
+    parser.add_argument("--query", default="介绍一下北京大学", help="发给各智能体的问题")
+    parser.add_argument("--rounds", type=int, default=5, help="计入统计的轮数")
+    parser.add_argument("--warmup", type=int, default=1, help="预热的轮数（不计入统计）")
+    parser.add_argument("--timeout", type=float, default=120, help="每轮等待的最长时间(秒)")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务（如 http://127.0.0.1:8765），不再启动子进程")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    setup_repo_path()
+    process = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        process, base_url = start_mock_server(args)
+
+    try:
+        rows = run_rounds(base_url, args)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "agents": len(SCENE_KEYS),
+        "rounds": len(rows),
+        "first_response": summarize([row["first_response"] for row in rows if row["first_response"] is not None]),
+        "wall_time": summarize([row["wall_time"] for row in rows]),
+        "slowest_single": summarize([row["slowest_single"] for row in rows]),
+        "sequential": summarize([row["sequential"] for row in rows]),
+        "ratio": summarize([row["ratio"] for row in rows]),
+    }
+    print(f"[群聊] {report['agents']}个智能体, {report['rounds']}轮")
+    print(f"  首个回复    {format_ms(report['first_response'])}")
+    print(f"  群聊总耗时  {format_ms(report['wall_time'])}")
+    print(f"  最慢单个    {format_ms(report['slowest_single'])}")
+    print(f"  串行合计    {format_ms(report['sequential'])}")
+    if report["ratio"].get("count"):
+        print("  总耗时/最慢 median {median:.2f} | p95 {p95:.2f} | max {max:.2f}".format(**report["ratio"]))
+
+    if json_path:
+        options = {name: getattr(args, name) for name in SERVER_OPTIONS}
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "report": report, "rounds": rows}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {json_path}")
+
+
+if __name__ == "__main__":
+    main()
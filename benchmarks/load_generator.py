@@ -0,0 +1,215 @@
+"""无界面多用户负载测试：N个模拟用户并发通过AgentAPIClient与本地模拟Dify服务对话
+
+用法:
+    python benchmarks/load_generator.py --users 1,5,10,25 --rounds 2 --think 0.5
+    python benchmarks/load_generator.py --users 50 --failure-rate 0.05 --drop-rate 0.05 --json load.json
+
+每个用户有独立的user_id、会话和API客户端（下载管理器和音频引擎在进程内共享，与单进程服务相同），
+按脚本进行多轮对话，其中包含图片、音频回复和场景切换；回复中出现 [园名] 时与界面中的
+scene_switcher.switch_client_scene一样切换API密钥并开始新会话。
+每个并发级别报告：TTFT/整轮耗时/媒体延迟的p50/p95/p99、错误率、吞吐，以及客户端进程的
+CPU占用、峰值内存、线程数和下载队列深度。模拟服务在独立子进程中运行（也可用--base-url指定），
+并发很高时它本身可能成为瓶颈，可用模拟服务的 /health 查看其统计。
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import setup_repo_path, summarize, percentile
+from sse_benchmark import add_server_arguments, start_mock_server, SERVER_OPTIONS
+
+# 多轮对话脚本（模拟服务根据关键词附加媒体和场景切换指令）
+DIALOGUE = (
+    "你好，介绍一下北京大学",
+    "给我看看博雅塔的图片",
+    "带我切换到燕南园",
+    "播放一段朱光潜讲美学的音频",
+    "用音频和图片介绍勺园，然后切换到勺园",
+    "塞万提斯写过哪些作品",
+    "切换到未名湖，顺便发几张图片",
+)
+
+SCENE_KEYS = {"燕南园": "yannanyuan", "勺园": "shaoyuan", "未名湖": "weiminghu"}
+
+
+class ResourceSampler:
+    """定期采样进程资源占用，记录峰值"""
+    def __init__(self, download_manager, interval=0.2):
+        self.download_manager = download_manager
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self.peak_queue = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ResourceSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        from perf_stats import process_rss
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, process_rss() or 0)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_queue = max(self.peak_queue, self.download_manager.get_metrics()["queue_depth"])
+            self._stop.wait(self.interval)
+
+
+def simulated_user(index, base_url, registry, shared, args, results, download_dir):
+    """一个模拟用户：按脚本完成rounds轮对话"""
+    from api_client import AgentAPIClient
+    from sse_benchmark import run_turn
+
+    client = AgentAPIClient(f"{base_url}/v1", "app-load-default")
+    client.download_manager, client.audio_engine = shared
+    client.download_dir = download_dir
+    user_id = f"load_user_{index}"
+    rng = random.Random(f"{args.seed}-{index}")
+    scene = "default"
+
+    for _ in range(args.rounds):
+        for query in DIALOGUE:
+            result = run_turn(client, registry, query, user_id)
+            result["scene"] = scene
+            results.append(result)
+            # 与switch_client_scene相同：切换场景的密钥，清空会话和已上传文件
+            for garden, key_name in SCENE_KEYS.items():
+                if f"[{garden}]" in result["original_content"]:
+                    client.change_api_key(f"app-load-{key_name}")
+                    client.current_conversation_id = None
+                    client.files = []
+                    scene = key_name
+                    break
+            if args.think:
+                time.sleep(rng.uniform(0.5, 1.5) * args.think)
+
+
+def run_level(base_url, users, args, shared):
+    """以指定并发用户数运行一轮负载，返回汇总结果"""
+    from turn_metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    results = []  # list.append是线程安全的
+    sampler = ResourceSampler(shared[0])
+    with tempfile.TemporaryDirectory() as download_dir:
+        sampler.start()
+        cpu_start = time.process_time()
+        started = time.perf_counter()
+        threads = []
+        for index in range(users):
+            thread = threading.Thread(target=simulated_user, name=f"LoadUser-{index}",
+                                      args=(index, base_url, registry, shared, args, results, download_dir))
+            threads.append(thread)
+            thread.start()
+            # 在ramp时间内逐个启动用户
+            if args.ramp and users > 1:
+                time.sleep(args.ramp / (users - 1))
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu_start
+        sampler.stop()
+
+    ok = [result for result in results if result["ok"]]
+
+    def stats(samples):
+        summary = summarize(samples)
+        if summary.get("count"):
+            summary["p99"] = percentile(samples, 99)
+        return summary
+
+    return {
+        "users": users,
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "media_failed": sum(result["media_failed"] for result in ok),
+        "scene_turns": {scene: sum(1 for result in results if result["scene"] == scene)
+                        for scene in sorted({result["scene"] for result in results})},
+        "wall": wall,
+        "turns_per_second": len(results) / wall if wall else 0.0,
+        "cpu_percent": cpu / wall * 100 if wall else 0.0,
+        "cpu_per_turn": cpu / len(results) if results else 0.0,
+        "peak_rss": sampler.peak_rss,
+        "peak_threads": sampler.peak_threads,
+        "peak_download_queue": sampler.peak_queue,
+        "ttft": stats([result["ttft"] for result in ok if result["ttft"] is not None]),
+        "total": stats([result["total"] for result in ok if result["total"] is not None]),
+        "media": stats([latency for result in ok for latency in result["media"]]),
+        "throughput": stats([result["throughput"] for result in ok if result["throughput"]]),
+    }
+
+
+def format_latency(summary):
+    if not summary.get("count"):
+        return "无数据"
+    return "p50 {:.0f} ms | p95 {:.0f} ms | p99 {:.0f} ms | max {:.0f} ms (n={})".format(
+        summary["median"] * 1000, summary["p95"] * 1000, summary["p99"] * 1000, summary["max"] * 1000, summary["count"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面多用户负载测试（本地模拟Dify服务）")
+    parser.add_argument("--users", default="1,5,10,25", help="逗号分隔的并发用户数，依次运行")
+    parser.add_argument("--rounds", type=int, default=1, help="每个用户重复对话脚本的次数")
+    parser.add_argument("--think", type=float, default=0.5, help="两轮之间的平均思考时间(秒)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="逐个启动全部用户所用的时间(秒)")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务，不再启动子进程")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    levels = [int(value) for value in args.users.split(",") if value.strip()]
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    setup_repo_path()
+    from audio_engine import AudioEngine
+    from download_manager import DownloadManager
+
+    process = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        process, base_url = start_mock_server(args)
+
+    reports = []
+    shared = (DownloadManager(max_workers=4, per_host_limit=2), AudioEngine())
+    try:
+        for users in levels:
+            report = run_level(base_url, users, args, shared)
+            reports.append(report)
+            print(f"[{users}用户] {report['turns']}轮, 错误率 {report['error_rate']:.1%}, "
+                  f"媒体下载失败 {report['media_failed']}, {report['turns_per_second']:.1f} 轮/s")
+            print(f"  TTFT      {format_latency(report['ttft'])}")
+            print(f"  整轮耗时  {format_latency(report['total'])}")
+            print(f"  媒体延迟  {format_latency(report['media'])}")
+            print(f"  CPU {report['cpu_percent']:.0f}% ({report['cpu_per_turn'] * 1000:.1f} ms/轮), "
+                  f"峰值内存 {report['peak_rss'] / 1048576:.0f} MB, 峰值线程 {report['peak_threads']}, "
+                  f"下载队列峰值 {report['peak_download_queue']}")
+    finally:
+        shared[0].shutdown()
+        shared[1].shutdown()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if json_path:
+        options = {name: getattr(args, name) for name in SERVER_OPTIONS}
+        options.update(rounds=args.rounds, think=args.think, ramp=args.ramp)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "levels": reports}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {json_path}")
+
+
+if __name__ == "__main__":
+    main()
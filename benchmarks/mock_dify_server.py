@@ -0,0 +1,364 @@
+"""本地模拟Dify服务，用于在不访问 api.dify.ai 的情况下测量客户端性能
+
+实现的接口（路径与Dify一致，base_url 使用 http://127.0.0.1:端口/v1）:
+    POST /v1/chat-messages                 流式(SSE)回复
+    POST /v1/chat-messages/<task_id>/stop  停止生成
+    POST /v1/files/upload                  上传文件
+    GET  /files/<file_id>/file-preview     带签名的媒体文件下载（支持Range续传，--media-drops时中途断开）
+    GET  /health                           就绪检查
+
+回复内容由请求文本中的关键词决定：
+    含"音频"  追加 [音频](签名URL)
+    含"图片"  追加 --images 个 [图片](签名URL)
+    含"切换"  追加 *切换地点*[园名]（请求中提到的勺园/未名湖，默认燕南园）
+
+用法:
+    python benchmarks/mock_dify_server.py --port 8765 --token-rate 200 --chunk-size 4 --jitter 0.2
+"""
+import io
+import os
+import sys
+import json
+import hmac
+import time
+import uuid
+import wave
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+FILLER = "北京大学的园林景观融合了中国古典园林与现代校园的特点，未名湖畔四季风景各不相同。"
+SIGN_TTL = 300  # 签名有效期(秒)
+GARDENS = ("燕南园", "勺园", "未名湖")
+
+
+class MockDifyServer(ThreadingHTTPServer):
+    """模拟Dify服务，参数见 build_parser"""
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, MockDifyHandler)
+        self.options = options
+        self.secret = os.urandom(16)
+        self.random = random.Random(options.seed)
+        self.tasks = {}  # task_id -> 停止事件
+        self.files = {}  # file_id -> (内容, Content-Type)
+        self.media_drops = {}  # file_id -> 已经中途断开的下载次数
+        self.lock = threading.Lock()
+        self.stats = {"chat": 0, "stopped": 0, "failed": 0, "dropped": 0, "downloads": 0, "uploads": 0,
+                      "media_dropped": 0, "resumed": 0}
+
+    def handle_error(self, request, client_address):
+        # 客户端复用或关闭长连接时的断开不是错误
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def should_drop_media(self, file_id):
+        """该文件的本次下载是否中途断开（每个文件前--media-drops次下载断开）"""
+        with self.lock:
+            dropped = self.media_drops.get(file_id, 0)
+            if dropped >= self.options.media_drops:
+                return False
+            self.media_drops[file_id] = dropped + 1
+            self.stats["media_dropped"] += 1
+            return True
+
+    def chance(self, probability):
+        with self.lock:
+            return self.random.random() < probability
+
+    def jittered(self, seconds):
+        """按抖动比例随机化间隔"""
+        jitter = self.options.jitter
+        with self.lock:
+            factor = 1 + self.random.uniform(-jitter, jitter) if jitter else 1
+        return max(0.0, seconds * factor)
+
+    # ---- 签名文件 ----
+
+    def sign(self, file_id, timestamp, nonce):
+        message = f"file-preview|{file_id}|{timestamp}|{nonce}".encode("utf-8")
+        return base64.urlsafe_b64encode(hmac.new(self.secret, message, hashlib.sha256).digest()).decode("ascii")
+
+    def create_file(self, kind):
+        """生成媒体文件并返回带签名的下载URL"""
+        if kind == "audio":
+            content, content_type = make_wav(self.options.audio_seconds), "audio/wav"
+        else:
+            content, content_type = make_jpeg(self.options.image_size), "image/jpeg"
+        return self.add_file(content, content_type)
+
+    def add_file(self, content, content_type):
+        """登记文件内容并返回带签名的下载URL"""
+        file_id = uuid.uuid4().hex
+        with self.lock:
+            self.files[file_id] = (content, content_type)
+        timestamp = str(int(time.time()))
+        nonce = uuid.uuid4().hex[:16]
+        sign = self.sign(file_id, timestamp, nonce)
+        return f"{self.base_url}/files/{file_id}/file-preview?timestamp={timestamp}&nonce={nonce}&sign={sign}"
+
+    def build_reply(self, query):
+        """根据请求文本生成回复内容"""
+        length = self.options.reply_tokens
+        text = (FILLER * (length // len(FILLER) + 1))[:length]
+        if "音频" in query:
+            text += f"[音频]({self.create_file('audio')})"
+        if "图片" in query:
+            for _ in range(self.options.images):
+                text += f"[图片]({self.create_file('image')})"
+        if "切换" in query:
+            garden = next((name for name in GARDENS if name in query), GARDENS[0])
+            text += f"*切换地点*[{garden}]"
+        return text
+
+
+class MockDifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/health":
+            self._send_json(200, {"status": "ok", "stats": self.server.stats})
+        elif parts.path.startswith("/files/") and parts.path.endswith("/file-preview"):
+            self._serve_file(parts.path.split("/")[2], parse_qs(parts.query))
+        else:
+            self._send_json(404, {"message": "not found"})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == "/v1/chat-messages":
+            self._chat(json.loads(self._read_body() or b"{}"))
+        elif path.startswith("/v1/chat-messages/") and path.endswith("/stop"):
+            self._read_body()
+            event = self.server.tasks.get(path.split("/")[3])
+            if event is not None:
+                event.set()
+                self.server.count("stopped")
+            self._send_json(200, {"result": "success"})
+        elif path == "/v1/files/upload":
+            body = self._read_body()
+            self.server.count("uploads")
+            self._send_json(201, {"id": uuid.uuid4().hex, "name": "upload", "size": len(body),
+                                  "extension": "txt", "mime_type": "text/plain", "created_at": int(time.time())})
+        else:
+            self._send_json(404, {"message": "not found"})
+
+    # ---- 流式回复 ----
+
+    def _write_chunk(self, data):
+        """以chunked编码写出一块数据"""
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _chat(self, request):
+        server = self.server
+        options = server.options
+        server.count("chat")
+        if server.chance(options.failure_rate):
+            server.count("failed")
+            self._send_json(500, {"message": "mock upstream failure"})
+            return
+
+        task_id = uuid.uuid4().hex
+        conversation_id = request.get("conversation_id") or uuid.uuid4().hex
+        message_id = uuid.uuid4().hex
+        stop = threading.Event()
+        server.tasks[task_id] = stop
+        reply = server.build_reply(request.get("query", ""))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            time.sleep(server.jittered(options.ttft))
+            base = {"task_id": task_id, "conversation_id": conversation_id, "message_id": message_id}
+            interval = options.chunk_size / options.token_rate if options.token_rate else 0
+            drop_at = len(reply) // 2 if server.chance(options.drop_rate) else None
+            sent = 0
+            for start in range(0, len(reply), options.chunk_size):
+                if stop.is_set():
+                    break
+                if drop_at is not None and start >= drop_at:
+                    # 模拟连接中断
+                    server.count("dropped")
+                    self.close_connection = True
+                    return
+                chunk = reply[start:start + options.chunk_size]
+                self._send_event(dict(base, event="message", answer=chunk, created_at=int(time.time())))
+                sent += len(chunk)
+                if interval:
+                    time.sleep(server.jittered(interval))
+            self._send_event(dict(base, event="message_end",
+                                  metadata={"usage": {"completion_tokens": sent, "prompt_tokens": len(request.get("query", ""))}}))
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            server.tasks.pop(task_id, None)
+
+    # ---- 签名文件下载 ----
+
+    def _serve_file(self, file_id, query):
+        server = self.server
+        timestamp = query.get("timestamp", [""])[0]
+        nonce = query.get("nonce", [""])[0]
+        sign = query.get("sign", [""])[0]
+        if not hmac.compare_digest(sign, server.sign(file_id, timestamp, nonce)):
+            self._send_json(403, {"message": "invalid signature"})
+            return
+        if not timestamp.isdigit() or time.time() - int(timestamp) > SIGN_TTL:
+            self._send_json(403, {"message": "signature expired"})
+            return
+        entry = server.files.get(file_id)
+        if entry is None:
+            self._send_json(404, {"message": "file not found"})
+            return
+        content, content_type = entry
+        server.count("downloads")
+        time.sleep(server.jittered(server.options.media_latency))
+
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        start, status = 0, 200
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and self.headers.get("If-Range", etag) == etag:
+            start = int(range_header[6:].split("-", 1)[0] or 0)
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+            server.count("resumed")
+
+        body = content[start:]
+        # 中途断开时只发送剩余数据的一半，每次续传都有进展
+        limit = max(1, len(body) // 2) if server.should_drop_media(file_id) else len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Content-Disposition", f'inline; filename="{file_id}.{content_type.split("/")[1]}"')
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+        self.end_headers()
+
+        bandwidth = server.options.media_bandwidth
+        block = 16 * 1024
+        try:
+            for offset in range(0, limit, block):
+                self.wfile.write(body[offset:min(offset + block, limit)])
+                if bandwidth:
+                    time.sleep(block / bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        if limit < len(body):
+            # 已声明完整的Content-Length，关闭连接后客户端收到的数据不完整
+            self.close_connection = True
+
+
+def make_wav(seconds, rate=22050):
+    """生成单声道正弦波WAV"""
+    import math
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        value = int(8000 * math.sin(2 * math.pi * 440 * i / rate))
+        frames += value.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def make_jpeg(size):
+    """生成渐进式JPEG（未安装Pillow时返回随机字节）"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return os.urandom(size[0] * size[1] // 4)
+    width, height = size
+    image = Image.radial_gradient("L").resize((width, height)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85, progressive=True)
+    return buffer.getvalue()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地模拟Dify服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-rate", type=float, default=200, help="每秒生成的token(字符)数，0表示不限速")
+    parser.add_argument("--chunk-size", type=int, default=4, help="每个message事件的token数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="间隔随机抖动比例(0~1)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="首个token前的延迟(秒)")
+    parser.add_argument("--reply-tokens", type=int, default=300, help="回复的文本长度")
+    parser.add_argument("--images", type=int, default=1, help="含\"图片\"的请求返回的图片数")
+    parser.add_argument("--image-size", type=lambda value: tuple(int(v) for v in value.split("x")), default=(800, 600))
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument("--media-latency", type=float, default=0.05, help="媒体下载的首字节延迟(秒)")
+    parser.add_argument("--media-bandwidth", type=float, default=0, help="媒体下载带宽(字节/秒)，0表示不限速")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="直接返回500的请求比例")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="流式回复中途断开的比例")
+    parser.add_argument("--media-drops", type=int, default=0, help="每个媒体文件的前N次下载在中途断开")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+    parser.add_argument("--verbose", action="store_true", help="输出访问日志")
+    return parser
+
+
+def start_server(options):
+    """在后台线程中启动服务，返回服务实例（port为0时自动选择端口）"""
+    server = MockDifyServer((options.host, options.port), options)
+    threading.Thread(target=server.serve_forever, name="MockDify", daemon=True).start()
+    return server
+
+
+def main():
+    options = build_parser().parse_args()
+    server = MockDifyServer((options.host, options.port), options)
+    print(f"模拟Dify服务: {server.base_url}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""回放录制的SSE会话，检查解析和渲染在真实数据上的表现
+
+录制：设置环境变量 AGENT_RECORD=sessions（或config.json中 "recording": {"dir": "sessions"}）后正常使用程序，
+每轮对话保存为 sessions/session_*.zip。
+
+用法:
+    python benchmarks/replay_session.py sessions/*.zip                  # 无界面，按录制速度
+    python benchmarks/replay_session.py sessions/*.zip --speed 0        # 尽快回放
+    python benchmarks/replay_session.py sessions/*.zip --dump out.json  # 输出回调记录，用于对比不同版本
+    python benchmarks/replay_session.py sessions/*.zip --ui --speed 0   # 在完整界面中回放（Linux下自动启动Xvfb）
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import setup_repo_path, ensure_display, summarize, format_ms
+
+
+def describe(data):
+    """回调数据的可比较形式（去掉时间戳、文件路径等每次运行都不同的字段）
+
+    类型名沿用回调数据改为StreamData对象之前的名称，新旧版本的--dump输出可以直接对比
+    """
+    from stream_events import TextData, MediaDirective, PreviewData, ProgressData, MediaResult
+
+    if type(data) is MediaResult:
+        item = data.item
+        return {"type": "media_ready", "kind": item.kind, "index": item.index, "ok": item.ok}
+    if type(data) is PreviewData:
+        return {"type": "image_preview", "media_index": data.media_index}
+    if type(data) is ProgressData:
+        return {"type": "download_progress", "media_index": data.media_index}
+    if type(data) is MediaDirective:
+        return {"type": f"{data.kind}_detected", "content": data.text}
+    if type(data) is TextData:
+        return {"type": "text", "content": data.text}
+    return {"type": type(data).__name__}
+
+
+def replay_headless(client, sessions):
+    """逐个回放会话，返回每个会话的回调记录和耗时"""
+    from turn_metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    reports = []
+    for session in sessions:
+        callbacks = []
+        end = []
+        turn = registry.start_turn()
+        cpu_start = time.process_time()
+        client.replay(session, on_data=lambda data: callbacks.append(describe(data)), on_end=end.append, turn=turn)
+        cpu = time.process_time() - cpu_start
+        # 同一类型的连续进度回调次数与下载速度有关，不计入对比
+        transcript = [entry for entry in callbacks if entry["type"] not in ("image_preview", "download_progress")]
+        text = "".join(entry["content"] for entry in transcript if entry["type"] == "text")
+        result = end[0] if end else {}
+        reports.append({
+            "session": os.path.basename(session.path),
+            "query": session.query,
+            "complete": bool(result.get("conversation_id")),
+            "elapsed": turn.elapsed("enqueue"),
+            "ttft": turn.elapsed("request_sent", "first_message"),
+            "cpu": cpu,
+            "callbacks": transcript,
+            "text": text,
+            "original_content": result.get("original_content"),
+            "media": [entry for entry in transcript if entry["type"] == "media_ready"],
+        })
+    return reports
+
+
+def replay_ui(replay_client, sessions):
+    """在完整界面中依次回放全部会话，返回总耗时(秒)"""
+    import tkinter as tk
+    from gui import AgentGUI
+
+    root = tk.Tk()
+    root.geometry("1200x800")
+    app = AgentGUI(root, replay_client, 1200, 800)
+    handler = app.stream_handler
+    started = time.perf_counter()
+    pending = list(sessions)
+
+    def send_next():
+        # 上一轮结束后再发送下一轮，与用户操作相同
+        if handler.is_streaming or handler.request_queue:
+            root.after(50, send_next)
+            return
+        if not pending:
+            root.after(200, root.destroy)
+            return
+        session = pending.pop(0)
+        app.ui_builder.input_text.delete("1.0", tk.END)
+        app.ui_builder.input_text.insert("1.0", session.query or "回放")
+        handler._enqueue_request()
+        root.after(50, send_next)
+
+    root.after_idle(send_next)
+    root.mainloop()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的SSE会话")
+    parser.add_argument("archives", nargs="+", help="会话归档(session_*.zip)")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0表示尽快回放")
+    parser.add_argument("--repeat", type=int, default=1, help="重复回放次数")
+    parser.add_argument("--ui", action="store_true", help="在完整界面中回放")
+    parser.add_argument("--dump", help="把回调记录写入JSON文件")
+    args = parser.parse_args()
+
+    archives = [os.path.abspath(path) for path in args.archives]
+    dump_path = os.path.abspath(args.dump) if args.dump else None
+    setup_repo_path()
+    from api_client import AgentAPIClient
+    from session_archive import Session, ReplayClient
+
+    sessions = [Session(path) for path in archives] * args.repeat
+    api_client = AgentAPIClient("http://replay.invalid/v1", "app-replay")
+    with tempfile.TemporaryDirectory() as download_dir:
+        api_client.download_dir = download_dir
+        client = ReplayClient(api_client, sessions, speed=args.speed)
+        try:
+            if args.ui:
+                ensure_display()
+                elapsed = replay_ui(client, sessions)
+                print(f"界面回放 {len(sessions)} 个会话: {elapsed:.2f}s")
+                return
+            reports = replay_headless(client, sessions)
+        finally:
+            client.close()
+            api_client.download_manager.shutdown()
+            api_client.audio_engine.shutdown()
+
+    for report in reports:
+        status = "完成" if report["complete"] else "未完成"
+        print(f"{report['session']}: {status}, {len(report['callbacks'])}个回调, {len(report['text'])}字, "
+              f"{len(report['media'])}个媒体, 耗时 {report['elapsed'] * 1000:.1f} ms, CPU {report['cpu'] * 1000:.1f} ms")
+    print(f"TTFT    {format_ms(summarize([r['ttft'] for r in reports if r['ttft'] is not None]))}")
+    print(f"CPU/轮  {format_ms(summarize([r['cpu'] for r in reports]))}")
+
+    if dump_path:
+        with open(dump_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=1)
+        print(f"回调记录已写入: {dump_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""断点续传检查：模拟服务在媒体下载中途断开连接，验证ResumableDownload用Range/If-Range续传且结果逐字节一致
+
+用法:
+    python benchmarks/resume_download_check.py
+    python benchmarks/resume_download_check.py --size 307200 --drops 2 --seed 1 --json resume.json
+
+在本进程的后台线程中启动模拟Dify服务（--media-drops），登记一个--size字节的随机文件，
+服务对该文件的前--drops次下载只发送剩余数据的一半就关闭连接。检查:
+    - 请求次数为 drops+1，续传请求的Range等于已下载的字节数，If-Range等于首个响应的ETag
+    - 服务端每次续传都返回206，没有从头下载
+    - 最终文件和on_chunk按顺序收到的数据都与原始内容一致
+任一检查失败时以非零状态退出。
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import setup_repo_path
+import mock_dify_server
+
+
+class RecordingSession:
+    """记录每次请求头的Session"""
+    def __init__(self):
+        self.session = requests.Session()
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        return self.session.get(url, headers=headers, **kwargs)
+
+
+def run_check(args):
+    setup_repo_path()
+    from downloader import ResumableDownload
+
+    options = mock_dify_server.build_parser().parse_args(
+        ["--port", "0", "--media-latency", "0", "--media-drops", str(args.drops)])
+    server = mock_dify_server.start_server(options)
+    content = random.Random(args.seed).randbytes(args.size)
+    url = server.add_file(content, "application/octet-stream")
+    etag = f'"{hashlib.md5(content).hexdigest()}"'
+
+    session = RecordingSession()
+    received = bytearray()
+    with tempfile.TemporaryDirectory() as download_dir:
+        download = ResumableDownload(
+            url, download_dir, max_retries=args.drops + 1, session=session,
+            on_chunk=received.extend, on_reset=received.clear,
+        )
+        started = time.perf_counter()
+        try:
+            file_path = download.run(lambda response: "resume-check.bin")
+            with open(file_path, "rb") as f:
+                data = f.read()
+        finally:
+            elapsed = time.perf_counter() - started
+            server.shutdown()
+            session.session.close()
+
+    offsets = []
+    checks = {"requests": len(session.requests) == args.drops + 1}
+    for headers in session.requests[1:]:
+        range_header = headers.get("Range", "")
+        offsets.append(int(range_header[6:].rstrip("-")) if range_header.startswith("bytes=") else None)
+        checks.setdefault("if_range", True)
+        checks["if_range"] &= headers.get("If-Range") == etag
+    checks["range_progress"] = all(offset for offset in offsets) and offsets == sorted(set(offsets))
+    checks["server_resumed"] = server.stats["resumed"] == args.drops
+    checks["server_dropped"] = server.stats["media_dropped"] == args.drops
+    checks["file_bytes"] = data == content
+    checks["chunk_bytes"] = bytes(received) == content
+    return {
+        "size": args.size,
+        "drops": args.drops,
+        "attempts": download.attempts,
+        "range_offsets": offsets,
+        "elapsed": elapsed,
+        "checks": checks,
+        "ok": all(checks.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="媒体下载断点续传检查（本地模拟服务中途断开连接）")
+    parser.add_argument("--size", type=int, default=300 * 1024, help="文件字节数")
+    parser.add_argument("--drops", type=int, default=2, help="中途断开的次数")
+    parser.add_argument("--seed", type=int, default=1, help="文件内容的随机种子")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    report = run_check(args)
+    print(f"{report['size']} 字节, 断开 {report['drops']} 次, 重试 {report['attempts']} 次, "
+          f"续传位置 {report['range_offsets']}, 耗时 {report['elapsed']:.2f} s")
+    for name, passed in report["checks"].items():
+        print(f"  {name:<15}{'通过' if passed else '失败'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
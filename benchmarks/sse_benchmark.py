@@ -0,0 +1,206 @@
+"""流式对话基准：在本地模拟Dify服务上测量AgentAPIClient的每轮性能
+
+用法:
+    python benchmarks/sse_benchmark.py --turns 20 --token-rate 200 --chunk-size 4 --seed 1
+    python benchmarks/sse_benchmark.py --scenarios text,image --jitter 0.3 --json sse.json
+
+模拟服务在独立子进程中运行，本进程的CPU时间只包含客户端（SSE解析、媒体下载、预解码等）。
+每个场景报告：
+    TTFT        发出请求到收到第一个message事件
+    吞吐        message事件期间每秒的token数
+    CPU/轮      客户端进程每轮消耗的CPU时间
+    媒体延迟    message_end到每个媒体项下载完成（media_ready）
+"""
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import tempfile
+import subprocess
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import setup_repo_path, summarize, format_ms
+
+# 场景名 -> 请求文本（模拟服务根据关键词附加媒体和场景切换指令）
+SCENARIOS = {
+    "text": "介绍一下未名湖",
+    "image": "给我看看博雅塔的图片",
+    "audio": "播放一段讲解音频",
+    "mixed": "用音频和图片介绍燕南园，然后切换过去",
+}
+
+# 透传给模拟服务的参数
+SERVER_OPTIONS = ("token_rate", "chunk_size", "jitter", "ttft", "reply_tokens", "images", "image_size",
+                  "audio_seconds", "media_latency", "media_bandwidth", "failure_rate", "drop_rate", "media_drops", "seed")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def add_server_arguments(parser):
+    """添加透传给模拟服务的参数"""
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--reply-tokens", type=int, default=300)
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--image-size", default="800x600")
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument("--media-latency", type=float, default=0.05)
+    parser.add_argument("--media-bandwidth", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--media-drops", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def start_mock_server(args):
+    """在子进程中启动模拟服务，就绪后返回(进程, 服务地址)"""
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_dify_server.py"),
+               "--port", str(port)]
+    for name in SERVER_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/health", timeout=0.5)
+            return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("模拟服务启动超时")
+
+
+def run_turn(client, registry, query, user_id="default_user"):
+    """运行一轮对话，返回本轮测量结果"""
+    media_ready = []
+    chunks = []
+
+    from stream_events import TextData, MediaResult
+
+    def on_data(data):
+        if type(data) is MediaResult:
+            media_ready.append(time.monotonic())
+        elif type(data) is TextData:
+            chunks.append(data)
+
+    turn = registry.start_turn()
+    cpu_start = time.process_time()
+    result = client.call_agent(query, user_id=user_id, on_data=on_data, turn=turn)
+    cpu = time.process_time() - cpu_start
+    turn.finish("ok" if result and result.get("conversation_id") else "error")
+
+    stream_duration = turn.elapsed("first_message", "message_end")
+    end = turn.marks.get("message_end")
+    return {
+        "ok": bool(result and result.get("conversation_id")),
+        "ttft": turn.elapsed("request_sent", "first_message"),
+        "throughput": turn.tokens / stream_duration if turn.tokens and stream_duration else None,
+        "cpu": cpu,
+        "total": turn.elapsed("enqueue", "media_ready") or turn.elapsed("enqueue", "message_end"),
+        "media": [ready - end for ready in media_ready] if end else [],
+        "media_failed": sum(1 for item in (result or {}).get("media_items") or [] if not item.ok),
+        "chunks": len(chunks),
+        "original_content": (result or {}).get("original_content") or "",
+    }
+
+
+def run_scenario(base_url, name, query, turns, warmup):
+    """在一个新的客户端上运行一个场景，返回汇总结果"""
+    from api_client import AgentAPIClient
+    from turn_metrics import MetricsRegistry
+
+    client = AgentAPIClient(f"{base_url}/v1", "app-benchmark")
+    registry = MetricsRegistry()
+    results = []
+    with tempfile.TemporaryDirectory() as download_dir:
+        client.download_dir = download_dir
+        for i in range(warmup + turns):
+            result = run_turn(client, registry, query)
+            if i >= warmup:
+                results.append(result)
+        client.download_manager.shutdown()
+        client.audio_engine.shutdown()
+
+    ok = [result for result in results if result["ok"]]
+    return {
+        "scenario": name,
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "media_failed": sum(result["media_failed"] for result in ok),
+        "ttft": summarize([result["ttft"] for result in ok if result["ttft"] is not None]),
+        "throughput": summarize([result["throughput"] for result in ok if result["throughput"]]),
+        "cpu": summarize([result["cpu"] for result in results]),
+        "total": summarize([result["total"] for result in ok if result["total"] is not None]),
+        "media": summarize([latency for result in ok for latency in result["media"]]),
+    }
+
+
+def format_rate(summary):
+    if not summary.get("count"):
+        return "无数据"
+    return "median {median:.0f} | p95 {p95:.0f} | min {min:.0f} | max {max:.0f} tokens/s (n={count})".format(**summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式对话基准（本地模拟Dify服务）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔的场景: {', '.join(SCENARIOS)}")
+    parser.add_argument("--turns", type=int, default=10, help="每个场景计入统计的轮数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个场景预热的轮数（不计入统计）")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务（如 http://127.0.0.1:8765），不再启动子进程")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    setup_repo_path()
+    process = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        process, base_url = start_mock_server(args)
+
+    reports = []
+    try:
+        for name in names:
+            report = run_scenario(base_url, name, SCENARIOS[name], args.turns, args.warmup)
+            reports.append(report)
+            print(f"[{name}] {report['turns']}轮, 失败 {report['errors']}, 媒体下载失败 {report['media_failed']}")
+            print(f"  TTFT      {format_ms(report['ttft'])}")
+            print(f"  吞吐      {format_rate(report['throughput'])}")
+            print(f"  CPU/轮    {format_ms(report['cpu'])}")
+            print(f"  整轮耗时  {format_ms(report['total'])}")
+            if name != "text":
+                print(f"  媒体延迟  {format_ms(report['media'])}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if json_path:
+        options = {name: getattr(args, name) for name in SERVER_OPTIONS}
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "scenarios": reports}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {json_path}")
+
+
+if __name__ == "__main__":
+    main()
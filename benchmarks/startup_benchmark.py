@@ -0,0 +1,88 @@
+"""启动耗时基准：测量首帧绘制时间(time-to-first-paint)和可交互时间(time-to-interactive)
+
+用法（Linux下自动启动Xvfb）:
+    python benchmarks/startup_benchmark.py --runs 10
+
+每次运行启动一个新的Python进程创建完整界面（使用模拟API客户端，不访问网络），
+父进程从启动子进程开始计时，子进程在根窗口首次绘制和背景、头像等资源加载完成并空闲时输出标记。
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import REPO_ROOT, setup_repo_path, ensure_display, summarize, format_ms
+
+
+class MockAPIClient:
+    """模拟API客户端，只提供界面初始化需要的接口"""
+    def __init__(self):
+        self.tools = {}
+        self.playing_files = {}
+
+    def call_agent(self, *args, **kwargs):
+        pass
+
+    def add_playback_listener(self, callback):
+        pass
+
+
+def run_child():
+    """子进程：创建界面并在关键时间点输出标记"""
+    setup_repo_path()
+    import tkinter as tk
+    from gui import AgentGUI, install_startup_probe
+
+    root = tk.Tk()
+    root.geometry("1200x800")
+    app = AgentGUI(root, MockAPIClient(), 1200, 800)
+    install_startup_probe(root, app)
+    root.mainloop()
+
+
+def run_once(python=sys.executable):
+    """运行一次子进程，返回各标记相对进程启动的耗时(秒)"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    process = subprocess.Popen([python, os.path.abspath(__file__), "--child"], cwd=REPO_ROOT,
+                               stdout=subprocess.PIPE, text=True, env=env)
+    timings = {}
+    for line in process.stdout:
+        timings[line.strip()] = time.perf_counter() - start
+    process.wait()
+    timings["exit"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentFromPku 启动耗时基准")
+    parser.add_argument("--runs", type=int, default=10, help="运行次数")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    ensure_display()
+    if args.child:
+        run_child()
+        return
+
+    results = {"first_paint": [], "interactive": []}
+    for _ in range(args.runs):
+        timings = run_once()
+        for key in results:
+            if key in timings:
+                results[key].append(timings[key])
+
+    report = {key: summarize(samples) for key, samples in results.items()}
+    print(f"time-to-first-paint : {format_ms(report['first_paint'])}")
+    print(f"time-to-interactive : {format_ms(report['interactive'])}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
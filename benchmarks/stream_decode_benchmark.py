@@ -0,0 +1,317 @@
+"""SSE解码基准：比较各JSON解码后端（以及改为事件对象之前按dict处理的方式）每个事件的CPU和内存分配
+
+用法:
+    python benchmarks/stream_decode_benchmark.py
+    python benchmarks/stream_decode_benchmark.py --events 50000 --backends json,orjson --json decode.json
+
+模式（每种在新的子进程中运行，通过AGENT_JSON_BACKEND选择后端）:
+    dict     改为事件对象之前的处理方式：整行decode为str，json.loads为dict，再逐个get字段
+    msgspec / orjson / json   stream_events.StreamDecoder的各后端（未安装的跳过）
+
+负载（按Dify的事件格式生成，message事件含task_id、message_id、conversation_id、created_at等字段）:
+    decode  逐行解码，报告每个事件的CPU时间、解码过程中的峰值分配（tracemalloc，含中间的dict），
+            以及保留解码结果时每个事件占用的内存
+    stream  完整的一轮处理（含回调和标记检测），报告每轮的CPU时间；dict模式运行改为事件对象之前的
+            _process_stream_response（legacy_process_stream_response，on_data收到dict），
+            其余模式运行当前的AgentAPIClient._process_stream_response
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tracemalloc
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import REPO_ROOT, setup_repo_path, summarize
+
+MODES = ("dict", "msgspec", "orjson", "json")
+
+REPLY = "未名湖畔的博雅塔建于1924年，原为燕京大学的水塔，仿照通州燎沉塔的样式建造。"
+
+
+def build_lines(events, chunk_size):
+    """生成一轮回复的SSE行（bytes，与iter_lines的输出相同）"""
+    task_id, conversation_id, message_id = uuid.uuid4().hex, uuid.uuid4().hex, uuid.uuid4().hex
+    base = {"task_id": task_id, "id": message_id, "message_id": message_id, "conversation_id": conversation_id}
+    text = REPLY * (events * chunk_size // len(REPLY) + 1)
+    lines = []
+    for index in range(events - 1):
+        payload = dict(base, event="message", answer=text[index * chunk_size:(index + 1) * chunk_size],
+                       created_at=int(time.time()))
+        lines.append(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        lines.append(b"")
+    payload = dict(base, event="message_end", metadata={
+        "usage": {"prompt_tokens": 12, "completion_tokens": events - 1, "total_tokens": events + 11,
+                  "latency": 1.23, "currency": "USD", "total_price": "0.0001"},
+        "retriever_resources": [],
+    })
+    lines.append(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    return lines
+
+
+def legacy_decode(line):
+    """改为事件对象之前每行的处理（只保留解析和取字段的部分）"""
+    data_line = line.decode("utf-8")
+    if not data_line.startswith("data: "):
+        return None
+    event_data = json.loads(data_line[6:])
+    event_data.get("event")
+    event_data.get("task_id")
+    event_data.get("answer", "")
+    return event_data
+
+
+def legacy_process_stream_response(client, response, on_data, on_end, turn=None):
+    """改为事件对象之前的AgentAPIClient._process_stream_response（省略基准负载中不出现的媒体下载）"""
+    import logging
+    from tracing import instant
+    from media_items import MEDIA_MARKERS
+
+    logger = logging.getLogger("api_client")
+    messages = []
+    conversation_id = None
+    task_id = None
+    is_complete = False
+    full_response = ""
+    is_streaming = False
+    audio_detected = False
+    image_detected = False
+    original_content = ""
+
+    for line in response.iter_lines():
+        if turn:
+            turn.mark("first_byte")
+        if line:
+            try:
+                data_line = line.decode("utf-8")
+                if data_line.startswith("data: "):
+                    event_data = json.loads(data_line[6:])
+                    event_type = event_data.get("event")
+                    instant("sse_event", event=event_type)
+
+                    task_id = event_data.get("task_id")
+                    is_streaming = True
+
+                    if event_type == "message":
+                        if turn:
+                            turn.mark("first_message")
+                            turn.tokens += 1
+                        message_chunk = event_data.get("answer", "")
+                        messages.append(message_chunk)
+                        full_response += message_chunk
+                        original_content += message_chunk
+
+                        tail = original_content[-(len(message_chunk) + 3):]
+                        for marker, kind in MEDIA_MARKERS.items():
+                            if marker not in tail:
+                                continue
+                            if kind == "audio" and not audio_detected:
+                                audio_detected = True
+                            elif kind == "image" and not image_detected:
+                                image_detected = True
+                            else:
+                                continue
+                            if on_data:
+                                on_data({"type": f"{kind}_detected", "content": message_chunk})
+
+                        if on_data and not audio_detected and not image_detected:
+                            on_data(
+                                {
+                                    "type": "text",
+                                    "content": message_chunk,
+                                    "is_chunk": True,
+                                    "emitted_at": time.monotonic(),
+                                }
+                            )
+
+                    elif event_type == "error":
+                        error_msg = f"API错误: {event_data.get('message', '未知错误')}"
+                        logger.error(error_msg)
+                        if on_end:
+                            on_end({"type": "text", "content": error_msg})
+                        return {"type": "text", "content": error_msg}
+
+                    elif event_type == "message_end":
+                        if turn:
+                            turn.mark("message_end")
+                            usage = (event_data.get("metadata") or {}).get("usage") or {}
+                            turn.tokens = usage.get("completion_tokens") or turn.tokens
+                        conversation_id = event_data.get("conversation_id")
+                        is_complete = True
+                        break
+
+            except json.JSONDecodeError:
+                logger.warning("解析流式响应失败: %s", data_line)
+                continue
+
+    if conversation_id:
+        client.current_conversation_id = conversation_id
+    logger.info("响应内容：%s", original_content, extra={"sampled": True})
+
+    final_response = {
+        "conversation_id": conversation_id,
+        "task_id": task_id,
+        "audio_file_path": None,
+        "image_file_path": None,
+        "content": full_response if not is_streaming else None,
+        "type": "text",
+        "audio_detected": audio_detected,
+        "image_detected": image_detected,
+        "media_items": [],
+        "original_content": original_content
+    }
+    if on_end and is_complete:
+        on_end(final_response)
+    return final_response
+
+
+def make_decode(mode):
+    if mode == "dict":
+        return legacy_decode
+    from stream_events import get_decoder
+    decode = get_decoder().decode
+
+    def decode_line(line):
+        return decode(line[6:]) if line.startswith(b"data: ") else None
+    return decode_line
+
+
+def measure_decode(decode, lines, repeat):
+    """返回每个事件的CPU时间样本(秒)、峰值分配和保留内存(字节/事件)"""
+    count = sum(1 for line in lines if line)
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for line in lines:
+            decode(line)
+        samples.append((time.process_time() - started) / count)
+
+    # 逐个解码并丢弃：峰值即单个事件解码过程中的分配（含中间对象）
+    tracemalloc.start()
+    peaks = []
+    for line in lines:
+        if not line:
+            continue
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        decode(line)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+
+    # 保留全部解码结果：每个事件对象（及其字段）占用的内存
+    baseline = tracemalloc.get_traced_memory()[0]
+    results = [decode(line) for line in lines if line]
+    retained = (tracemalloc.get_traced_memory()[0] - baseline) / len(results)
+    tracemalloc.stop()
+    return samples, sum(peaks) / len(peaks), retained
+
+
+class _Response:
+    """只提供iter_lines的响应对象"""
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def measure_stream(mode, lines, repeat):
+    from api_client import AgentAPIClient
+
+    client = AgentAPIClient("http://127.0.0.1:9/v1", "app-decode-benchmark")
+    if mode == "dict":
+        process = lambda *args: legacy_process_stream_response(client, *args)
+    else:
+        process = client._process_stream_response
+    samples = []
+    callbacks = []
+    try:
+        for _ in range(repeat):
+            callbacks.clear()
+            started = time.process_time()
+            process(_Response(lines), callbacks.append, callbacks.append)
+            samples.append(time.process_time() - started)
+    finally:
+        client.download_manager.shutdown()
+        client.audio_engine.shutdown()
+    return samples
+
+
+def run_child(mode, args):
+    setup_repo_path()
+    import logging
+    logging.disable(logging.WARNING)  # 每轮的响应内容日志不计入
+    lines = build_lines(args.events, args.chunk_size)
+    decode = make_decode(mode)
+    decode(lines[0])  # 预热（选择后端、创建结构体类型）
+    samples, peak, retained = measure_decode(decode, lines, args.repeat)
+    report = {
+        "mode": mode,
+        "decode_cpu": summarize(samples),
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+        "stream_cpu": summarize(measure_stream(mode, lines, args.repeat)),
+    }
+    print(json.dumps(report))
+
+
+def available(mode):
+    if mode in ("dict", "json"):
+        return True
+    try:
+        __import__(mode)
+    except ImportError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE事件解码基准")
+    parser.add_argument("--backends", default=",".join(MODES), help=f"逗号分隔的模式: {', '.join(MODES)}")
+    parser.add_argument("--events", type=int, default=20000, help="每轮的SSE事件数")
+    parser.add_argument("--chunk-size", type=int, default=4, help="每个message事件的字符数")
+    parser.add_argument("--repeat", type=int, default=7, help="重复次数")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    names = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in names if name not in MODES]
+    if unknown:
+        parser.error(f"未知模式: {', '.join(unknown)}")
+
+    reports = {}
+    for name in names:
+        if not available(name):
+            print(f"[{name}] 未安装，跳过")
+            continue
+        env = dict(os.environ)
+        if name != "dict":
+            env["AGENT_JSON_BACKEND"] = name
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", name],
+            cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True, check=True,
+        ).stdout
+        report = reports[name] = json.loads(output.strip().splitlines()[-1])
+        decode_cpu = report["decode_cpu"]
+        print(f"[{name}] 解码 {decode_cpu['median'] * 1e6:.2f} us/事件 (min {decode_cpu['min'] * 1e6:.2f}), "
+              f"峰值分配 {report['peak_bytes']:.0f} B/事件, 保留 {report['retained_bytes']:.0f} B/事件")
+        stream_cpu = report["stream_cpu"]
+        print(f"  整轮处理 {stream_cpu['median'] * 1000:.1f} ms/轮 "
+              f"({stream_cpu['median'] / args.events * 1e6:.2f} us/事件)")
+
+    if args.json:
+        options = {"events": args.events, "chunk_size": args.chunk_size, "repeat": args.repeat}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "modes": reports}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""界面渲染基准：在真实Tk控件上测量聊天记录和流式更新的渲染开销
+
+用法（Linux下自动启动Xvfb）:
+    python benchmarks/ui_render_benchmark.py
+    python benchmarks/ui_render_benchmark.py --workloads stream --stream-rates 50,200,0 --json render.json
+
+负载（每项在新的子进程中创建完整界面运行，互不影响）:
+    transcript  逐条添加聊天消息（默认10000条），按每1000条分段报告耗时，观察随记录增长的变化
+    stream      通过对话引擎和StreamHandler的事件处理更新一条回复（默认50000字），按多个片段速率运行
+    resize      在已有聊天记录时连续改变窗口尺寸
+    media       成批添加图片和音频气泡
+
+报告两类数据：
+    单次操作耗时  界面线程中执行一次操作（含其中的update_idletasks）的时间
+    帧延迟        操作预定时间到界面空闲（本次更新的重绘完成）的时间，包含事件循环排队
+同时统计聊天区滚动范围更新（<Configure>回调）的次数和耗时，以及卡顿监测记录的事件循环最大延迟。
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import REPO_ROOT, setup_repo_path, ensure_display, summarize, format_ms
+
+WORKLOADS = ("transcript", "stream", "resize", "media")
+
+SAMPLE_TEXTS = (
+    "你好",
+    "燕南园在哪里？",
+    "未名湖畔的博雅塔建于1924年，原为燕京大学的水塔，仿照通州燎沉塔的样式建造。",
+    "朱光潜先生晚年住在燕南园66号，常在园中与学生谈论美学。他主张“人生的艺术化”，" * 4,
+)
+
+
+class Recorder:
+    """收集单次操作耗时和帧延迟"""
+    def __init__(self, root):
+        self.root = root
+        self.samples = {}
+
+    def add(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def run(self, name, func, *args, scheduled=None):
+        """执行一次操作并记录耗时；scheduled为预定时间时，界面空闲后记录帧延迟"""
+        start = time.perf_counter()
+        result = func(*args)
+        self.add(name, time.perf_counter() - start)
+        origin = scheduled if scheduled is not None else start
+        self.root.after_idle(lambda: self.add(f"{name}_frame", time.perf_counter() - origin))
+        return result
+
+
+def instrument_scrollregion():
+    """统计聊天区滚动范围更新的耗时（需在创建界面前调用）"""
+    from chat_bubble import ChatBubble
+    samples = []
+    original = ChatBubble._on_chat_frame_configure
+
+    def timed(self, event):
+        start = time.perf_counter()
+        original(self, event)
+        samples.append(time.perf_counter() - start)
+
+    ChatBubble._on_chat_frame_configure = timed
+    return samples
+
+
+def build_app():
+    """创建完整界面（使用模拟API客户端），返回(root, app)"""
+    import tkinter as tk
+    from gui import AgentGUI
+    from startup_benchmark import MockAPIClient
+
+    root = tk.Tk()
+    root.geometry("1200x800")
+    app = AgentGUI(root, MockAPIClient(), 1200, 800)
+    root.update()
+    return root, app
+
+
+def drain(root):
+    """处理完所有待处理事件"""
+    root.update()
+
+
+def workload_transcript(root, app, recorder, args):
+    ui = app.ui_builder
+    for i in range(args.messages):
+        recorder.run("add_chat_message", ui.add_chat_message, SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)], i % 2 == 0)
+        if i % 50 == 49:
+            drain(root)
+    drain(root)
+    # 按每1000条分段的中位数，反映耗时随记录长度的增长
+    samples = recorder.samples["add_chat_message"]
+    step = 1000
+    return {"scaling": [
+        {"messages": min(start + step, len(samples)), "median": summarize(samples[start:start + step])["median"]}
+        for start in range(0, len(samples), step)
+    ]}
+
+
+def workload_stream(root, app, recorder, args):
+    """按固定速率把片段送入对话引擎，经StreamHandler的事件处理渲染"""
+    from stream_events import TextData
+
+    handler = app.stream_handler
+    text = (SAMPLE_TEXTS[3] * (args.stream_chars // len(SAMPLE_TEXTS[3]) + 1))[:args.stream_chars]
+    chunks = [text[i:i + args.chunk_chars] for i in range(0, len(text), args.chunk_chars)]
+    results = {}
+
+    for rate in args.stream_rates:
+        name = f"stream@{rate or 'max'}"
+        engine = handler.engine
+        engine.current_request_id += 1
+        request_id = engine.current_request_id
+        handler.current_bubble = None
+        engine.response_buffer = ""
+        state = {"index": 0, "done": False}
+        started = time.perf_counter()
+
+        def deliver():
+            index = state["index"]
+            scheduled = started + index / rate if rate else None
+            data = TextData(chunks[index], time.monotonic())
+            recorder.run(name, engine._handle_data, data, request_id, scheduled=scheduled)
+            state["index"] = index + 1
+            if state["index"] >= len(chunks):
+                state["done"] = True
+                return
+            if rate:
+                # 按起始时间计算下一次的预定时间，避免误差累积
+                delay = started + state["index"] / rate - time.perf_counter()
+                root.after(max(0, int(delay * 1000)), deliver)
+            else:
+                root.after(0, deliver)
+
+        root.after(0, deliver)
+        while not state["done"]:
+            root.update()
+            time.sleep(0.001)
+        drain(root)
+        results[name] = {"chunks": len(chunks), "wall": time.perf_counter() - started}
+    return results
+
+
+def workload_resize(root, app, recorder, args):
+    ui = app.ui_builder
+    for i in range(args.resize_messages):
+        ui.add_chat_message(SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)], i % 2 == 0)
+    drain(root)
+    sizes = ("1200x800", "1000x700", "1400x900", "900x650", "1280x860")
+
+    def resize(geometry):
+        root.geometry(geometry)
+        root.update_idletasks()
+
+    for i in range(args.resizes):
+        recorder.run("resize", resize, sizes[i % len(sizes)])
+        drain(root)
+    return {}
+
+
+def workload_media(root, app, recorder, args):
+    """成批添加图片和音频气泡，每批之后处理一次事件"""
+    import tempfile
+    from PIL import Image
+
+    handler = app.stream_handler
+    with tempfile.TemporaryDirectory() as media_dir:
+        image_paths = []
+        for i in range(8):
+            path = os.path.join(media_dir, f"image_{i}.jpg")
+            Image.new("RGB", (1024, 768), (40 * i % 256, 120, 200)).save(path, quality=85)
+            image_paths.append(path)
+        audio_path = os.path.join(media_dir, "audio.mp3")
+        with open(audio_path, "wb") as f:
+            f.write(b"\0" * 1024)
+
+        for burst in range(args.bursts):
+            burst_start = time.perf_counter()
+            for i in range(args.burst_size):
+                index = burst * args.burst_size + i
+                if i % 2 == 0:
+                    recorder.run("image_bubble", handler._add_image_message,
+                                 image_paths[index % len(image_paths)], "", index)
+                else:
+                    recorder.run("audio_bubble", handler._add_audio_message, audio_path, "")
+            drain(root)
+            recorder.add("burst", time.perf_counter() - burst_start)
+        handler._clear_all()
+        drain(root)
+    return {"images": app.ui_builder.image_registry.get_stats()}
+
+
+def run_child(workload, args):
+    """子进程：创建界面运行一项负载，以JSON输出结果"""
+    setup_repo_path()
+    scrollregion = instrument_scrollregion()
+    root, app = build_app()
+    recorder = Recorder(root)
+    extra = globals()[f"workload_{workload}"](root, app, recorder, args)
+    drain(root)
+    report = {name: summarize(samples) for name, samples in recorder.samples.items()}
+    report["scrollregion"] = summarize(scrollregion)
+    report["max_loop_lag"] = app.watchdog.get_stats()["max_lag"]
+    report.update(extra)
+    root.destroy()
+    print(json.dumps(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="界面渲染基准")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"逗号分隔的负载: {', '.join(WORKLOADS)}")
+    parser.add_argument("--messages", type=int, default=10000, help="transcript: 消息条数")
+    parser.add_argument("--stream-chars", type=int, default=50000, help="stream: 回复字数")
+    parser.add_argument("--chunk-chars", type=int, default=20, help="stream: 每个片段的字数")
+    parser.add_argument("--stream-rates", type=lambda value: [float(v) for v in value.split(",")], default=[50, 200, 0],
+                        help="stream: 逗号分隔的片段速率(个/秒)，0表示不限速")
+    parser.add_argument("--resize-messages", type=int, default=300, help="resize: 预先添加的消息条数")
+    parser.add_argument("--resizes", type=int, default=100, help="resize: 改变尺寸的次数")
+    parser.add_argument("--bursts", type=int, default=10, help="media: 批数")
+    parser.add_argument("--burst-size", type=int, default=20, help="media: 每批的气泡数")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    ensure_display()
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    names = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知负载: {', '.join(unknown)}")
+
+    # 子进程使用相同的参数
+    child_args = list(sys.argv[1:])
+    reports = {}
+    for name in names:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *child_args, "--child", name],
+                                cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True, check=True).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        reports[name] = report
+
+        print(f"[{name}] 事件循环最大延迟 {report['max_loop_lag'] * 1000:.0f} ms")
+        for key, summary in report.items():
+            if isinstance(summary, dict) and "count" in summary:
+                print(f"  {key:<24} {format_ms(summary)}")
+        for point in report.get("scaling", []):
+            print(f"  前{point['messages']:>6}条  add_chat_message 中位数 {point['median'] * 1000:.2f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
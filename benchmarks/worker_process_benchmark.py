@@ -0,0 +1,216 @@
+"""解码子进程基准：流式回复（含图片）期间界面帧延迟，对比进程内处理与解码子进程
+
+用法（Linux下自动启动Xvfb）:
+    python benchmarks/worker_process_benchmark.py --turns 6 --images 4 --image-size 2048x1536
+    python benchmarks/worker_process_benchmark.py --headless --json worker.json
+
+每种模式在新的子进程中运行：
+    inprocess  AgentAPIClient，SSE解析、下载和图片解码与界面在同一进程中
+    worker     ProcessAPIClient，这些工作在解码子进程中进行
+
+默认创建完整界面（AgentGUI），通过StreamHandler发送请求；界面线程每帧（--frame-ms）用after()
+预定一次回调，实际执行时间与预定时间之差即帧延迟。--headless时不创建Tk界面，主线程按相同的帧间隔
+运行一个简单的事件循环，执行对话引擎的回调并完成界面中相应的图片工作（缩略图解码缩放、像素复制），
+用于没有显示环境时比较两种模式的GIL竞争。
+报告帧延迟的中位数/p95/p99/最大值、超过--jank-ms的帧数，以及每轮耗时。
+"""
+import os
+import sys
+import time
+import json
+import queue
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_utils import REPO_ROOT, setup_repo_path, ensure_display, summarize, percentile, format_ms
+from sse_benchmark import add_server_arguments, start_mock_server, SERVER_OPTIONS
+
+MODES = ("inprocess", "worker")
+
+# 交替发送纯文本和图片请求
+QUERIES = ("给我看看博雅塔的图片", "介绍一下未名湖", "用几张图片介绍燕南园")
+
+
+def create_client(mode, base_url, download_dir):
+    if mode == "worker":
+        from worker_process import ProcessAPIClient
+        return ProcessAPIClient(f"{base_url}/v1", "app-worker-benchmark", download_dir=download_dir)
+    from api_client import AgentAPIClient
+    client = AgentAPIClient(f"{base_url}/v1", "app-worker-benchmark")
+    client.download_dir = download_dir
+    return client
+
+
+def run_tk(client, args):
+    """完整界面：通过StreamHandler发送请求，after()测量帧延迟"""
+    import tkinter as tk
+    from gui import AgentGUI
+
+    root = tk.Tk()
+    root.geometry("1200x800")
+    app = AgentGUI(root, client, 1200, 800)
+    root.update()
+
+    interval = args.frame_ms / 1000
+    lags = []
+    state = {"expected": time.perf_counter() + interval}
+
+    def tick():
+        now = time.perf_counter()
+        lags.append(max(0.0, now - state["expected"]))
+        state["expected"] = now + interval
+        root.after(args.frame_ms, tick)
+
+    root.after(args.frame_ms, tick)
+    turn_times = []
+    for index in range(args.turns):
+        handler = app.stream_handler
+        app.ui_builder.input_text.delete("1.0", tk.END)
+        app.ui_builder.input_text.insert("1.0", QUERIES[index % len(QUERIES)])
+        started = time.perf_counter()
+        handler._enqueue_request()
+        while handler.is_streaming or handler.request_queue:
+            root.update()
+            time.sleep(0.001)
+        turn_times.append(time.perf_counter() - started)
+        # 清空聊天记录，各轮的界面负载相同
+        handler._clear_all()
+        root.update()
+    root.destroy()
+    return lags, turn_times
+
+
+def run_headless(client, args):
+    """无界面：主线程按帧间隔运行事件循环，执行引擎回调和界面中的图片工作"""
+    from conversation import ConversationEngine, ImagePreview, MediaReady, TurnFinished
+
+    callbacks = queue.Queue()
+    engine = ConversationEngine(client, dispatch=lambda func, *callback_args: callbacks.put((func, callback_args)))
+    finished = []
+
+    def on_event(event):
+        if isinstance(event, ImagePreview):
+            # 相当于创建PhotoImage时复制像素
+            event.image.tobytes()
+        elif isinstance(event, MediaReady) and event.item.kind == "image" and event.item.ok:
+            # 与StreamHandler._add_image_message相同：优先使用子进程生成的缩略图
+            take_thumbnail = getattr(client, "take_thumbnail", None)
+            thumbnail = take_thumbnail(event.item.file_path) if take_thumbnail else None
+            if thumbnail is None:
+                from PIL import Image
+                with Image.open(event.item.file_path) as img:
+                    thumbnail = img.resize((150, 100), Image.LANCZOS)
+            thumbnail.tobytes()
+        elif isinstance(event, TurnFinished):
+            finished.append(event)
+
+    engine.subscribe(on_event)
+    interval = args.frame_ms / 1000
+    lags = []
+    turn_times = []
+    for index in range(args.turns):
+        started = time.perf_counter()
+        engine.submit(QUERIES[index % len(QUERIES)])
+        expected = time.perf_counter() + interval
+        while not finished:
+            timeout = expected - time.perf_counter()
+            if timeout <= 0:
+                now = time.perf_counter()
+                lags.append(now - expected)
+                expected = now + interval
+                continue
+            try:
+                func, callback_args = callbacks.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            func(*callback_args)
+        finished.clear()
+        turn_times.append(time.perf_counter() - started)
+    return lags, turn_times
+
+
+def run_child(mode, args):
+    """子进程：以指定模式运行，以JSON输出结果"""
+    setup_repo_path()
+    with tempfile.TemporaryDirectory() as download_dir:
+        client = create_client(mode, args.base_url, download_dir)
+        try:
+            lags, turn_times = (run_headless if args.headless else run_tk)(client, args)
+        finally:
+            if mode == "worker":
+                client.close()
+            client.download_manager.shutdown()
+            client.audio_engine.shutdown()
+    frame = summarize(lags)
+    if frame.get("count"):
+        frame["p99"] = percentile(lags, 99)
+    print(json.dumps({
+        "mode": mode,
+        "frame_lag": frame,
+        "jank_frames": sum(1 for lag in lags if lag * 1000 > args.jank_ms),
+        "turn": summarize(turn_times),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解码子进程的界面帧延迟基准（本地模拟Dify服务）")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"逗号分隔的模式: {', '.join(MODES)}")
+    parser.add_argument("--turns", type=int, default=6, help="每种模式的对话轮数")
+    parser.add_argument("--frame-ms", type=int, default=16, help="帧间隔(毫秒)")
+    parser.add_argument("--jank-ms", type=float, default=50, help="帧延迟超过该值计为卡顿(毫秒)")
+    parser.add_argument("--headless", action="store_true", help="不创建Tk界面")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务（如 http://127.0.0.1:8765），不再启动子进程")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    parser.set_defaults(images=4, image_size="2048x1536", token_rate=400)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    names = [name.strip() for name in args.modes.split(",") if name.strip()]
+    unknown = [name for name in names if name not in MODES]
+    if unknown:
+        parser.error(f"未知模式: {', '.join(unknown)}")
+    if not args.headless:
+        ensure_display()
+
+    process = None
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        process, base_url = start_mock_server(args)
+
+    reports = {}
+    try:
+        child_args = [arg for arg in sys.argv[1:]]
+        for name in names:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *child_args, "--base-url", base_url, "--child", name],
+                cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True, check=True,
+            ).stdout
+            report = reports[name] = json.loads(output.strip().splitlines()[-1])
+            frame = report["frame_lag"]
+            print(f"[{name}] {args.turns}轮, 卡顿帧(>{args.jank_ms:.0f} ms) {report['jank_frames']}")
+            print(f"  帧延迟    {format_ms(frame)}")
+            if frame.get("count"):
+                print(f"            p99 {frame['p99'] * 1000:.1f} ms")
+            print(f"  每轮耗时  {format_ms(report['turn'])}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        options = {name: getattr(args, name) for name in SERVER_OPTIONS}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "headless": args.headless, "modes": reports}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,26 @@
 import tkinter as tk
-from PIL import Image, ImageTk
 import logging
 import time  # 新增导入
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
 class ChatBubble:
     """聊天气泡管理器，负责创建和管理聊天消息气泡"""
-    def __init__(self, ui_builder):
-        """初始化聊天气泡管理器"""
+    def __init__(self, ui_builder, chat_container=None, chat_frame=None, welcome=True):
+        """初始化聊天气泡管理器
+        Args:
+            ui_builder: UI构建器
+            chat_container, chat_frame: 管理的聊天区，默认为UI构建器当前的聊天区
+            welcome: 窗口首次显示时是否添加欢迎消息
+        """
         self.ui_builder = ui_builder
         self.root = ui_builder.root
-        self.chat_frame = ui_builder.chat_frame
-        self.chat_container = ui_builder.chat_container
+        self.chat_frame = chat_frame or ui_builder.chat_frame
+        self.chat_container = chat_container or ui_builder.chat_container
         self.can_scroll_up = False  # 初始状态下不允许上滑
         self.last_log_time = 0  # 记录最后日志输出时间
-        self.welcome_shown = False  # 新增标志变量，确保欢迎消息只显示一次
+        self.welcome_shown = not welcome  # 新增标志变量，确保欢迎消息只显示一次
 
         # 绑定滚动区域更新事件
         self.chat_frame.bind("<Configure>", self._on_chat_frame_configure)
@@ -25,7 +30,8 @@ class ChatBubble:
         self.chat_container.bind("<Leave>", self._unbind_mousewheel)
 
         # 确保UI完全加载后再添加欢迎消息
-        self.root.bind("<Map>", lambda e: self._on_window_shown())
+        if welcome:
+            self.root.bind("<Map>", lambda e: self._on_window_shown())
 
     def _on_window_shown(self):
         """窗口显示后添加欢迎消息（只执行一次）"""
@@ -78,8 +84,9 @@ class ChatBubble:
 
     def _calculate_max_width(self):
         """计算气泡的最大允许宽度"""
-        # 获取聊天容器的当前宽度
-        container_width = self.chat_container.winfo_width()
+        # 获取聊天容器的当前宽度（后台标签页的聊天区未显示，按当前显示的聊天区计算）
+        container = self.chat_container if self.chat_container.winfo_ismapped() else self.ui_builder.chat_container
+        container_width = container.winfo_width()
         
         # 计算最大宽度（减去头像、边距等空间）
         max_width = container_width - 80  
@@ -87,6 +94,7 @@ class ChatBubble:
         # 确保最小宽度（防止窗口太小时气泡太小）
         return max(max_width, 200)
 
+    @traced("ChatBubble.add_chat_message")
     def add_chat_message(self, message, is_user=True):
         """添加聊天消息气泡"""
         # 创建气泡框架
@@ -0,0 +1,410 @@
+"""与界面无关的对话引擎
+
+ConversationEngine负责请求排队、流式回复状态、媒体项的生命周期和场景切换，
+不访问任何控件，只向订阅者发出类型化的事件。Tk界面（StreamHandler）是其中一个订阅者，
+无界面服务可以直接使用同一个引擎。
+
+线程模型：请求在工作线程中发送，API客户端的回调通过dispatch交给引擎的所属线程处理
+（Tk界面传入root.after，无界面时默认在工作线程中直接处理），事件在所属线程中同步发给订阅者。
+"""
+import time
+import logging
+import threading
+from audio_engine import STATE_PLAYING
+from scene_switcher import detect_scene, switch_client_scene
+from turn_metrics import get_registry
+from tracing import span, end_flow, new_flow
+from stream_events import TextData, MediaDirective, PreviewData, ProgressData, MediaResult
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """对话事件基类，request_id为所属请求（与请求无关的事件为None）"""
+    __slots__ = ("request_id",)
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields())
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def _fields(cls):
+        return [name for klass in reversed(cls.__mro__) for name in getattr(klass, "__slots__", ())]
+
+
+class TurnStarted(Event):
+    """请求已加入队列"""
+    __slots__ = ("input_text",)
+
+    def __init__(self, request_id, input_text):
+        super().__init__(request_id)
+        self.input_text = input_text
+
+
+class TextDelta(Event):
+    """回复文本片段；buffer为到目前为止的完整回复，first表示本轮第一个片段"""
+    __slots__ = ("text", "buffer", "first")
+
+    def __init__(self, request_id, text, buffer, first):
+        super().__init__(request_id)
+        self.text = text
+        self.buffer = buffer
+        self.first = first
+
+
+class MediaDetected(Event):
+    """回复中出现媒体标记（kind为audio或image），之后的文本不再以TextDelta发出"""
+    __slots__ = ("kind", "content")
+
+    def __init__(self, request_id, kind, content):
+        super().__init__(request_id)
+        self.kind = kind
+        self.content = content
+
+
+class ImagePreview(Event):
+    """下载中图片的低分辨率预览（PIL图像）"""
+    __slots__ = ("media_index", "image")
+
+    def __init__(self, request_id, media_index, image):
+        super().__init__(request_id)
+        self.media_index = media_index
+        self.image = image
+
+
+class DownloadProgress(Event):
+    """媒体下载进度，total未知时为None"""
+    __slots__ = ("media_index", "downloaded", "total")
+
+    def __init__(self, request_id, media_index, downloaded, total):
+        super().__init__(request_id)
+        self.media_index = media_index
+        self.downloaded = downloaded
+        self.total = total
+
+
+class MediaReady(Event):
+    """媒体项下载完成或失败（item.ok区分），每个媒体项只发出一次"""
+    __slots__ = ("item", "content")
+
+    def __init__(self, request_id, item, content=""):
+        super().__init__(request_id)
+        self.item = item
+        self.content = content
+
+
+class TurnFinished(Event):
+    """本轮结束，status为ok或error，response为API客户端的最终响应"""
+    __slots__ = ("response", "status")
+
+    def __init__(self, request_id, response, status):
+        super().__init__(request_id)
+        self.response = response
+        self.status = status
+
+
+class SceneChanged(Event):
+    """回复要求切换场景，API密钥和会话已切换"""
+    __slots__ = ("garden",)
+
+    def __init__(self, request_id, garden):
+        super().__init__(request_id)
+        self.garden = garden
+
+
+class QueueChanged(Event):
+    """请求队列长度变化，depth为0表示全部请求处理完成"""
+    __slots__ = ("depth",)
+
+    def __init__(self, depth):
+        super().__init__(None)
+        self.depth = depth
+
+
+class ConversationReset(Event):
+    """开始了新会话"""
+    __slots__ = ()
+
+
+class PlaybackChanged(Event):
+    """音频播放状态变化，state为音频引擎的状态快照"""
+    __slots__ = ("file_path", "state")
+
+    def __init__(self, file_path, state):
+        super().__init__(None)
+        self.file_path = file_path
+        self.state = state
+
+
+def _call(func, *args):
+    func(*args)
+
+
+class ConversationEngine:
+    """对话引擎：请求队列、流式状态、媒体生命周期和场景切换"""
+    def __init__(self, api_client, dispatch=None, defer=None, user_id=None, stream_timeout=120, api_keys=None):
+        """初始化对话引擎
+        Args:
+            api_client: AgentAPIClient（或接口相同的对象）
+            dispatch: dispatch(func, *args)，把回调交给引擎的所属线程执行；默认在调用线程中直接执行
+            defer: defer(func, *args)，在前端完成当前绘制后执行（用于本轮统计排在首次绘制之后），默认直接执行
+            user_id: Dify用户标识
+            stream_timeout: 单个请求的最长等待时间(秒)
+            api_keys: 场景密钥名称 -> API密钥，未提供的场景从config.json读取
+        """
+        self.api_client = api_client
+        self.dispatch = dispatch or _call
+        self.defer = defer or _call
+        self.user_id = user_id or "user_" + str(int(time.time()))
+        self.stream_timeout = stream_timeout
+        self.api_keys = api_keys
+        self.subscribers = []
+
+        self.request_queue = []  # (请求ID, 流编号, 文本, 工具名, 工具参数, 文件, 本轮统计)
+        self.current_request_id = 0
+        self.current_turn = None
+        self.conversation_id = None
+        self.uploaded_files = []
+        self.is_streaming = False
+        self.closed = False
+        self.response_buffer = ""  # 当前回复的完整文本
+        self.rendered_media = set()  # 当前回复中已发出MediaReady的媒体序号
+        self._done = {}  # 请求ID -> 结束事件，工作线程据此开始下一个请求
+        self._flows = {}  # 请求ID -> 追踪的流编号（所属线程中访问）
+        self._lock = threading.Lock()
+        self._data_handlers = {
+            TextData: self._on_text,
+            MediaDirective: lambda data, request_id: self._emit(MediaDetected(request_id, data.kind, data.text)),
+            PreviewData: self._on_preview,
+            ProgressData: lambda data, request_id: self._emit(
+                DownloadProgress(request_id, data.media_index, data.downloaded, data.total)),
+            MediaResult: lambda data, request_id: self._media_ready(request_id, data.item),
+        }
+
+        self._playback_listener = lambda file_path, state: self.dispatch(self._emit, PlaybackChanged(file_path, state))
+        self.api_client.add_playback_listener(self._playback_listener)
+
+    def close(self):
+        """关闭引擎（标签页关闭、屏幕断开时）：取消订阅音频状态，放弃进行中和排队的请求
+
+        所属线程之后可能不再执行派发的回调（如渲染调度器移除了通道），因此这里直接放行工作线程，
+        不等待_handle_end
+        """
+        self.closed = True
+        self.api_client.remove_playback_listener(self._playback_listener)
+        self.subscribers = []
+        with self._lock:
+            # 正在发送的请求由工作线程出队，其余直接丢弃
+            del self.request_queue[1:]
+        self.api_client.cancel()
+        for done in list(self._done.values()):
+            done.set()
+        for flow in self._flows.values():
+            end_flow(flow)
+        self._flows.clear()
+
+    # ---- 订阅 ----
+
+    def subscribe(self, callback):
+        """注册事件回调，回调在引擎的所属线程中执行"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _emit(self, event):
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"处理对话事件{type(event).__name__}失败: {e}")
+
+    # ---- 请求 ----
+
+    def submit(self, input_text, tool_name=None, tool_params=None, files=None):
+        """把请求加入队列，返回请求ID（在所属线程中调用）"""
+        self.is_streaming = True
+
+        # 新请求开始后，未完成的旧请求不再更新前端
+        if self.current_turn and not self.current_turn.finished:
+            self.current_turn.finish("superseded")
+        self.current_turn = get_registry().start_turn()
+        # 被取代的请求不会执行_finish，回复文本和已发出的媒体序号在这里复位
+        self.response_buffer = ""
+        self.rendered_media = set()
+
+        self.current_request_id += 1
+        request_id = self.current_request_id
+        flow = self._flows[request_id] = new_flow()
+        if files is None:
+            files = self.uploaded_files
+            self.uploaded_files = []
+        self._emit(TurnStarted(request_id, input_text))
+
+        with span("queue_request", flow=flow):
+            with self._lock:
+                self.request_queue.append(
+                    (request_id, flow, input_text, tool_name, tool_params, list(files), self.current_turn)
+                )
+                start_worker = len(self.request_queue) == 1
+        self._emit(QueueChanged(len(self.request_queue)))
+
+        # 如果是队列中的第一个请求，启动处理线程
+        if start_worker:
+            threading.Thread(target=self._process_request_queue, name="ConversationWorker", daemon=True).start()
+        return request_id
+
+    def _process_request_queue(self):
+        """工作线程：依次发送队列中的请求"""
+        while True:
+            with self._lock:
+                request_id, flow, input_text, tool_name, tool_params, files, turn = self.request_queue[0]
+            done = self._done[request_id] = threading.Event()
+            if self.closed:
+                done.set()
+            ended = []
+
+            def on_end(response, request_id=request_id):
+                ended.append(True)
+                self.dispatch(self._handle_end, response, request_id)
+
+            with span("process_request", flow=flow):
+                result = self.api_client.call_agent(
+                    input_text,
+                    tool_name,
+                    tool_params,
+                    self.user_id,
+                    files,
+                    on_data=lambda data, request_id=request_id: self.dispatch(self._handle_data, data, request_id),
+                    on_end=on_end,
+                    turn=turn,
+                )
+            # 流在message_end之前结束时API客户端不回调on_end，同样按本轮结束处理
+            if not ended:
+                self.dispatch(self._handle_end, result or {}, request_id)
+
+            if not done.wait(self.stream_timeout):
+                logger.warning(f"请求{request_id}等待结束超时")
+            self._done.pop(request_id, None)
+
+            with self._lock:
+                self.request_queue.pop(0)
+                depth = len(self.request_queue)
+            self.dispatch(self._emit, QueueChanged(depth))
+            # 队列在锁内变空时线程退出，之后提交的请求会启动新的工作线程
+            if not depth:
+                break
+            # 如果队列中还有请求，等待0.5秒后继续处理
+            time.sleep(0.5)
+
+    def _handle_data(self, data, request_id):
+        """处理流式数据（所属线程），已被新请求取代的请求不再发出事件"""
+        if request_id != self.current_request_id:
+            return
+        handler = self._data_handlers.get(type(data))
+        if handler is None:
+            return
+        with span("handle_stream_data", flow=self._flows.get(request_id), type=type(data).__name__):
+            handler(data, request_id)
+
+    def _on_text(self, data, request_id):
+        if self.current_turn:
+            # 从工作线程发出到所属线程处理之间的延迟
+            get_registry().observe("ui_dispatch_lag", self.current_turn.scene, time.monotonic() - data.emitted_at)
+        first = not self.response_buffer
+        self.response_buffer += data.text
+        self._emit(TextDelta(request_id, data.text, self.response_buffer, first))
+
+    def _on_preview(self, data, request_id):
+        if data.media_index not in self.rendered_media:
+            self._emit(ImagePreview(request_id, data.media_index, data.image))
+
+    def _media_ready(self, request_id, item, content=""):
+        """发出媒体项完成事件，每项只发出一次"""
+        if item.index in self.rendered_media:
+            return
+        self.rendered_media.add(item.index)
+        self._emit(MediaReady(request_id, item, content))
+
+    def _handle_end(self, response, request_id):
+        """处理请求结束（所属线程）"""
+        done = self._done.get(request_id)
+        if done is not None:
+            done.set()
+        flow = self._flows.pop(request_id, None)
+        if request_id != self.current_request_id:
+            end_flow(flow)
+            return
+        with span("handle_stream_end", flow=flow):
+            self._finish(response, request_id)
+            end_flow(flow)
+
+    def _finish(self, response, request_id):
+        """发出剩余媒体项、结束本轮并按回复内容切换场景"""
+        original_content = response.get("original_content") or ""
+        for item in response.get("media_items") or []:
+            self._media_ready(request_id, item, original_content)
+
+        # 网关回复缓存的回放没有会话ID
+        status = "ok" if response.get("conversation_id") or response.get("cached") else "error"
+        if self.current_turn:
+            self.defer(self.current_turn.finish, status)
+        if response.get("conversation_id"):
+            self.conversation_id = response["conversation_id"]
+        self.rendered_media = set()
+        self.response_buffer = ""
+        self.is_streaming = False
+        self._emit(TurnFinished(request_id, response, status))
+
+        if "*切换地点*" in original_content:
+            garden = detect_scene(original_content)
+            if garden is None:
+                logger.info("未找到匹配的地点，不进行场景切换")
+            elif switch_client_scene(garden, self.api_client, self.api_keys):
+                self._emit(SceneChanged(request_id, garden))
+
+    # ---- 会话和文件 ----
+
+    def upload_file(self, file_path):
+        """上传文件，成功后随下一个请求发送；返回文件信息，失败时返回None"""
+        file_info = self.api_client.upload_file(file_path)
+        if file_info:
+            self.uploaded_files.append(file_info)
+        return file_info
+
+    def clear(self):
+        """清空待发送的文件并停止所有音频"""
+        self.uploaded_files = []
+        self.stop_audio()
+        self.rendered_media = set()
+
+    def new_conversation(self):
+        """开始新会话"""
+        self.api_client.current_conversation_id = None
+        self.conversation_id = None
+        self.clear()
+        self.response_buffer = ""
+        self._emit(ConversationReset())
+
+    # ---- 音频 ----
+
+    def play_audio(self, file_path):
+        """播放音频，同一时间只播放一个文件；返回是否成功"""
+        self.stop_audio(except_file=file_path)
+        return self.api_client._play_file(file_path)
+
+    def pause_audio(self, file_path):
+        return self.api_client._pause_file(file_path)
+
+    def stop_audio(self, file_path=None, except_file=None):
+        """停止指定文件，未指定时停止除except_file外所有正在播放的文件"""
+        if file_path is not None:
+            self.api_client._stop_file(file_path)
+            return
+        for path, state in self.api_client.playing_files.items():
+            if path != except_file and state.get("state") == STATE_PLAYING:
+                self.api_client._stop_file(path)
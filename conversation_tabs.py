@@ -0,0 +1,296 @@
+"""多会话标签页：每个标签页拥有独立的对话、API密钥和流式处理，多个会话的回复同时进行
+
+各标签页共用输入框、按钮和状态栏等控件：StreamHandler通过ConversationView操作这些控件，
+后台标签页的修改只记录下来，切换到该标签页时再应用；聊天区每个标签页一个，切换时替换显示。
+引擎回调经渲染调度器交给界面线程，按时间预算在各会话之间轮流执行。
+"""
+import logging
+import tkinter as tk
+from conversation import TurnStarted, TextDelta, MediaReady, TurnFinished
+from chat_bubble import ChatBubble
+from render_scheduler import RenderScheduler
+from scene_switcher import (
+    default_profile, garden_profiles, switch_client_scene, show_scene,
+)
+from stream_handler import StreamHandler
+
+logger = logging.getLogger(__name__)
+
+# 各标签页分别记录状态的共用控件
+MIRRORED_WIDGETS = (
+    "status_bar", "stream_status", "send_button", "clear_button",
+    "upload_button", "new_chat_button", "file_display",
+)
+# 新标签页从这些选项的初始值开始
+BASELINE_OPTIONS = ("text", "state", "fg")
+
+
+class _TabWidget:
+    """共用控件在一个标签页中的视图：记录该标签页设置的选项，标签页显示时才应用到控件"""
+    __slots__ = ("view", "widget", "options")
+
+    def __init__(self, view, widget, options):
+        self.view = view
+        self.widget = widget
+        self.options = dict(options)
+
+    def config(self, **options):
+        self.options.update(options)
+        if self.view.active:
+            self.widget.config(**options)
+
+    configure = config
+
+    def cget(self, key):
+        if key in self.options:
+            return self.options[key]
+        return self.widget.cget(key)
+
+    def apply(self):
+        if self.options:
+            self.widget.config(**self.options)
+
+    def __getattr__(self, name):
+        return getattr(self.widget, name)
+
+
+class ConversationView:
+    """一个标签页看到的UI构建器：聊天区、场景和共用控件的状态属于该标签页，其余委托给UI构建器"""
+    def __init__(self, tabs, pane, baseline):
+        self.tabs = tabs
+        self.ui_builder = tabs.ui_builder
+        self.pane = pane
+        self.active = False
+        self.unread = False
+        self.scene = dict(default_profile)
+        for name in MIRRORED_WIDGETS:
+            setattr(self, name, _TabWidget(self, getattr(self.ui_builder, name), baseline[name]))
+
+    def __getattr__(self, name):
+        return getattr(self.ui_builder, name)
+
+    @property
+    def chat_container(self):
+        return self.pane.chat_container
+
+    @property
+    def chat_frame(self):
+        return self.pane.chat_frame
+
+    @property
+    def chat_bubble(self):
+        return self.pane.chat_bubble
+
+    def add_chat_message(self, message, is_user=True):
+        return self.pane.chat_bubble.add_chat_message(message, is_user)
+
+    def set_background(self, image_path):
+        self.scene["background"] = image_path
+        if self.active:
+            self.ui_builder.set_background(image_path)
+
+    def add_photo(self, photo_path):
+        self.scene["photo"] = photo_path
+        if self.active:
+            self.ui_builder.add_photo(photo_path)
+
+    def set_name(self, name):
+        self.scene["name"] = name
+        if self.active:
+            self.ui_builder.set_name(name)
+        self.tabs.refresh_tab(self)
+
+    def set_intro(self, intro):
+        self.scene["intro"] = intro
+        if self.active:
+            self.ui_builder.set_intro(intro)
+
+    def activate(self):
+        """显示该标签页的聊天区、控件状态和场景"""
+        self.active = True
+        self.unread = False
+        self.ui_builder.show_chat_pane(self.pane)
+        for name in MIRRORED_WIDGETS:
+            getattr(self, name).apply()
+        # 背景和照片相同时不重新加载
+        if self.ui_builder.bg_path != self.scene["background"]:
+            self.ui_builder.set_background(self.scene["background"])
+        if self.ui_builder.info_panel.photo_path != self.scene["photo"]:
+            self.ui_builder.add_photo(self.scene["photo"])
+        self.ui_builder.set_name(self.scene["name"])
+        self.ui_builder.set_intro(self.scene["intro"])
+
+
+class ConversationTab:
+    """一个标签页：视图、流式处理和渲染通道"""
+    __slots__ = ("view", "handler", "lane", "button", "close_button", "frame")
+
+
+class ConversationTabs:
+    """标签栏和各标签页的会话"""
+    def __init__(self, ui_builder, api_client, max_tabs=6):
+        """初始化标签页
+        Args:
+            ui_builder: UI构建器
+            api_client: 第一个标签页使用的API客户端，其他标签页使用它的分支（共享连接、下载和音频）
+            max_tabs: 同时打开的标签页上限
+        """
+        self.ui_builder = ui_builder
+        self.api_client = api_client
+        self.max_tabs = max_tabs
+        self.default_api_key = getattr(api_client, "api_key", None)
+        self.scheduler = RenderScheduler(ui_builder.root)
+        self.tabs = []
+        self.active = None
+        self._baseline = {
+            name: {key: getattr(ui_builder, name).cget(key) for key in BASELINE_OPTIONS}
+            for name in MIRRORED_WIDGETS
+        }
+
+        # 标签栏，位于顶部工具栏下方
+        self.bar = tk.Frame(ui_builder.dialog_frame, bg="#f5e8d9")
+        self.bar.pack(fill=tk.X, padx=10, after=ui_builder.toolbar)
+        self.add_button = tk.Menubutton(
+            self.bar, text="+", font=("SimHei", 10), bg="#f5e8d9", fg="#333",
+            relief=tk.FLAT, cursor="hand2"
+        )
+        menu = tk.Menu(self.add_button, tearoff=0)
+        menu.add_command(label=default_profile["name"], command=lambda: self.add_tab())
+        for garden, profile in garden_profiles.items():
+            menu.add_command(label=f"{profile['name']}（{garden}）", command=lambda g=garden: self.add_tab(g))
+        self.add_button.config(menu=menu)
+        # 没有fork的客户端（如测试用的模拟客户端）只有一个会话
+        if hasattr(api_client, "fork"):
+            self.add_button.pack(side=tk.RIGHT, padx=5)
+
+        # 第一个标签页使用界面原有的聊天区和客户端
+        self._open(api_client, ui_builder.chat_pane)
+        self.activate(self.tabs[0])
+
+    @property
+    def handler(self):
+        return self.active.handler
+
+    def add_tab(self, garden=None):
+        """打开新标签页，garden为场景名称时直接进入该场景的对话"""
+        if len(self.tabs) >= self.max_tabs:
+            self.ui_builder.status_bar.config(text=f"最多同时打开{self.max_tabs}个会话")
+            return None
+        client = self.api_client.fork(self.default_api_key)
+        if garden is not None and not switch_client_scene(garden, client):
+            self.ui_builder.status_bar.config(text=f"缺少{garden}的API密钥，已打开默认会话")
+            garden = None
+
+        pane = self.ui_builder.create_chat_pane()
+        pane.chat_bubble = ChatBubble(self.ui_builder, pane.chat_container, pane.chat_frame, welcome=False)
+        tab = self._open(client, pane)
+        if garden is not None:
+            show_scene(garden, tab.view)
+        self.activate(tab)
+
+        if garden is None:
+            pane.chat_bubble._add_default_welcome_message()
+        else:
+            profile = garden_profiles[garden]
+            tab.view.add_chat_message(f"欢迎来到{garden}！我是{profile['name']}，有什么想聊的吗？", is_user=False)
+        return tab
+
+    def _open(self, client, pane):
+        tab = ConversationTab()
+        tab.view = ConversationView(self, pane, self._baseline)
+        tab.lane = self.scheduler.add_lane(f"tab{len(self.tabs) + 1}")
+        tab.handler = StreamHandler(client, tab.view, dispatch=tab.lane.dispatch)
+        tab.handler.engine.subscribe(lambda event: self._on_event(tab, event))
+
+        tab.frame = tk.Frame(self.bar, bg="#f5e8d9")
+        tab.button = tk.Button(
+            tab.frame, font=("SimHei", 10), bg="#f5e8d9", fg="#333",
+            relief=tk.FLAT, cursor="hand2", command=lambda: self.activate(tab)
+        )
+        tab.close_button = tk.Button(
+            tab.frame, text="×", font=("SimHei", 10), bg="#f5e8d9", fg="#999",
+            relief=tk.FLAT, cursor="hand2", command=lambda: self.close_tab(tab)
+        )
+        tab.button.pack(side=tk.LEFT)
+        tab.close_button.pack(side=tk.LEFT)
+        tab.frame.pack(side=tk.LEFT, padx=2)
+        self.tabs.append(tab)
+        self._refresh(tab)
+        self._update_close_buttons()
+        return tab
+
+    def activate(self, tab):
+        """切换到指定标签页"""
+        if self.active is tab:
+            return
+        if self.active is not None:
+            self.active.view.active = False
+            self.active.handler.api_client.background = True
+            self._refresh(self.active)
+        self.active = tab
+        tab.handler.api_client.background = False
+        self.scheduler.active_lane = tab.lane
+        tab.view.activate()
+        self._refresh(tab)
+
+    def close_tab(self, tab):
+        """关闭标签页：停止该会话的音频并丢弃未完成的回复（至少保留一个标签页）"""
+        if len(self.tabs) <= 1 or tab not in self.tabs:
+            return
+        index = self.tabs.index(tab)
+        if tab is self.active:
+            self.activate(self.tabs[index + 1] if index + 1 < len(self.tabs) else self.tabs[index - 1])
+        self.tabs.remove(tab)
+        # 先关闭会话（放行对话引擎的工作线程），再移除通道（丢弃未执行的回调）
+        tab.handler.close()
+        self.scheduler.remove_lane(tab.lane)
+        tab.frame.destroy()
+        if tab.view.pane is not self.ui_builder.chat_pane:
+            tab.view.pane.chat_container.destroy()
+            tab.view.pane.scrollbar.destroy()
+        self._update_close_buttons()
+
+    def _on_event(self, tab, event):
+        """引擎事件（界面线程）：更新标签上的回复中和未读标记"""
+        if isinstance(event, (TextDelta, MediaReady, TurnFinished)) and tab is not self.active:
+            tab.view.unread = True
+        if isinstance(event, (TurnStarted, TurnFinished)) or (isinstance(event, TextDelta) and event.first):
+            self._refresh(tab)
+        elif isinstance(event, MediaReady) and tab.view.unread:
+            self._refresh(tab)
+
+    def refresh_tab(self, view):
+        """角色名称变化时更新标签文字"""
+        for tab in self.tabs:
+            if tab.view is view:
+                self._refresh(tab)
+
+    def _refresh(self, tab):
+        if not hasattr(tab, "button"):
+            return  # 标签按钮尚未创建
+        text = tab.view.scene["name"]
+        if tab.handler.is_streaming:
+            text += " …"
+        if tab.view.unread:
+            text += " ●"
+        tab.button.config(
+            text=text,
+            bg="#e8d5bc" if tab is self.active else "#f5e8d9",
+            font=("SimHei", 10, "bold") if tab is self.active else ("SimHei", 10),
+        )
+
+    def _update_close_buttons(self):
+        # 只剩一个标签页时不显示关闭按钮
+        state = tk.NORMAL if len(self.tabs) > 1 else tk.DISABLED
+        for tab in self.tabs:
+            tab.close_button.config(state=state)
+
+    def get_stats(self):
+        """各会话的资源统计（性能面板使用）"""
+        stats = []
+        for tab in self.tabs:
+            entry = {"name": tab.view.scene["name"], "active": tab is self.active, "streaming": tab.handler.is_streaming}
+            entry.update(tab.handler.stats)
+            entry.update(tab.lane.get_stats())
+            stats.append(entry)
+        return stats
@@ -0,0 +1,207 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的音频
+PRIORITY_NORMAL = 1  # 回复中的图片等普通媒体
+PRIORITY_PREFETCH = 2  # 后台预取
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_PREFETCH: "prefetch",
+}
+
+
+class _DownloadJob:
+    """队列中的下载任务"""
+    __slots__ = ("key", "host", "func", "priority", "seq", "future", "enqueued_at")
+
+    def __init__(self, key, host, func, priority, seq):
+        self.key = key
+        self.host = host
+        self.func = func
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class DownloadManager:
+    """下载管理器：有界工作线程池、优先级队列、相同URL去重和按主机限流
+
+    相同URL（忽略查询参数）在下载中时再次提交会得到同一个Future；
+    更高优先级的重复提交会提升排队中任务的优先级。
+    cache_size大于0时保留最近完成的结果，相同URL再次提交时直接返回（多个客户端共享媒体时使用）。
+    """
+    def __init__(self, max_workers=4, per_host_limit=2, cache_size=0, cache_check=None):
+        """初始化下载管理器
+        Args:
+            max_workers: 工作线程数
+            per_host_limit: 同一主机的最大并发下载数
+            cache_size: 保留的已完成结果数，0表示不缓存
+            cache_check: cache_check(result)，返回False时缓存的结果作废（如文件已被删除）
+        """
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.cache_size = cache_size
+        self.cache_check = cache_check
+        self._cache = OrderedDict()  # 去重键 -> 已完成的结果
+        self._pending = []  # 排队中的任务
+        self._inflight = {}  # 去重键 -> 任务（排队或执行中）
+        self._active_hosts = {}  # 主机 -> 执行中的任务数
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._workers = []
+        self._running = True
+
+        # 统计信息
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.cache_hits = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+
+    def submit(self, url, func, priority=PRIORITY_NORMAL):
+        """提交下载任务，返回Future，结果为func的返回值
+        Args:
+            url: 下载地址，用于去重和按主机限流
+            func: 在工作线程中执行的下载函数（无参数）
+            priority: 优先级
+        """
+        key = url.split("?", 1)[0]
+        with self._cond:
+            if key in self._cache:
+                result = self._cache[key]
+                if self.cache_check is None or self.cache_check(result):
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    future = Future()
+                    future.set_result(result)
+                    return future
+                del self._cache[key]
+
+            job = self._inflight.get(key)
+            if job is not None:
+                self.deduplicated += 1
+                if priority < job.priority and job in self._pending:
+                    job.priority = priority
+                logger.info(f"复用进行中的下载: {url}")
+                return job.future
+
+            self._seq += 1
+            job = _DownloadJob(key, urlsplit(url).netloc, func, priority, self._seq)
+            self._inflight[key] = job
+            self._pending.append(job)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._ensure_workers()
+            self._cond.notify()
+            return job.future
+
+    def _ensure_workers(self):
+        """按需启动工作线程（需持有锁）"""
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers and len(self._workers) < len(self._pending) + self.active:
+            worker = threading.Thread(target=self._worker, name=f"download-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job_locked(self):
+        """取出优先级最高且所在主机未达并发上限的任务（需持有锁）"""
+        best = None
+        for job in self._pending:
+            if self._active_hosts.get(job.host, 0) >= self.per_host_limit:
+                continue
+            if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                best = job
+        if best is not None:
+            self._pending.remove(best)
+        return best
+
+    def _worker(self):
+        """工作线程主循环"""
+        while True:
+            with self._cond:
+                job = self._next_job_locked()
+                while job is None and self._running:
+                    self._cond.wait()
+                    job = self._next_job_locked()
+                if job is None:
+                    return
+                self.active += 1
+                self._active_hosts[job.host] = self._active_hosts.get(job.host, 0) + 1
+                self.total_wait_time += time.monotonic() - job.enqueued_at
+
+            if not job.future.set_running_or_notify_cancel():
+                result, error = None, None
+            else:
+                try:
+                    result, error = job.func(), None
+                except BaseException as e:
+                    result, error = None, e
+
+            with self._cond:
+                self.active -= 1
+                self._active_hosts[job.host] -= 1
+                if not self._active_hosts[job.host]:
+                    del self._active_hosts[job.host]
+                self._inflight.pop(job.key, None)
+                if error is None:
+                    self.completed += 1
+                    if self.cache_size and result:
+                        self._cache[job.key] = result
+                        self._cache.move_to_end(job.key)
+                        while len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+                else:
+                    self.failed += 1
+                # 主机并发名额释放后，其他线程可能有可执行的任务
+                self._cond.notify_all()
+
+            if job.future.cancelled():
+                continue
+            if error is None:
+                job.future.set_result(result)
+            else:
+                logger.error(f"下载任务失败: {job.key}, {error}")
+                job.future.set_exception(error)
+
+    def get_metrics(self):
+        """返回队列深度等统计信息"""
+        with self._cond:
+            depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+            for job in self._pending:
+                name = PRIORITY_NAMES.get(job.priority, str(job.priority))
+                depth_by_priority[name] = depth_by_priority.get(name, 0) + 1
+            started = self.completed + self.failed + self.active
+            return {
+                "queue_depth": len(self._pending),
+                "queue_depth_by_priority": depth_by_priority,
+                "max_queue_depth": self.max_queue_depth,
+                "active": self.active,
+                "active_by_host": dict(self._active_hosts),
+                "completed": self.completed,
+                "failed": self.failed,
+                "deduplicated": self.deduplicated,
+                "cache_hits": self.cache_hits,
+                "cached": len(self._cache),
+                "avg_wait_time": self.total_wait_time / started if started else 0.0,
+            }
+
+    def shutdown(self):
+        """停止工作线程，排队中的任务被取消"""
+        with self._cond:
+            self._running = False
+            for job in self._pending:
+                job.future.cancel()
+                self._inflight.pop(job.key, None)
+            self._pending = []
+            self._cond.notify_all()
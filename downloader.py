@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class IncompleteDownloadError(Exception):
+    """下载的数据长度与服务器声明的长度不一致"""
+
+
+class ResumableDownload:
+    """可续传的单文件下载
+
+    数据先写入下载目录中的临时文件(.part)，长度校验通过后原子重命名为最终文件，
+    因此超时或程序退出只会留下临时文件。连接中断后使用HTTP Range/If-Range从断点继续，
+    服务器不支持续传或文件已变化时从头下载。
+    """
+    def __init__(self, url, download_dir, headers=None, timeout=30, max_retries=3, chunk_size=8192,
+                 on_chunk=None, on_reset=None, on_progress=None, progress_interval=0.1, session=None):
+        """初始化下载任务
+        Args:
+            url: 下载地址
+            download_dir: 下载目录
+            headers: 额外请求头（如鉴权）
+            timeout: 单次请求超时时间(秒)
+            max_retries: 连接中断后的最大重试次数
+            chunk_size: 读取块大小
+            on_chunk: 数据回调，按文件顺序从第0字节开始收到全部数据
+            on_reset: 下载从头开始时的回调，之前通过on_chunk收到的数据作废
+            on_progress: 进度回调，参数为(已下载字节数, 总字节数或None)
+            progress_interval: 进度回调的最小间隔(秒)
+            session: 发起请求使用的requests.Session（复用连接），默认不复用
+        """
+        self.url = url
+        self.download_dir = download_dir
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.on_reset = on_reset
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.session = session or requests
+
+        # 以去掉查询参数的URL为键，同一文件重新签名后的链接也能续传
+        key = hashlib.sha1(url.split("?", 1)[0].encode("utf-8")).hexdigest()[:16]
+        self.part_path = os.path.join(download_dir, f".{key}.part")
+        self.meta_path = self.part_path + ".json"
+        self.downloaded = 0
+        self.total_size = None
+        self.attempts = 0
+        self._last_progress = 0
+
+    def run(self, name_for_response):
+        """执行下载，返回最终文件路径
+        Args:
+            name_for_response: 根据首个成功响应确定文件名的函数
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        meta = self._load_meta()
+        self.downloaded = self._resumable_offset(meta)
+        if self.downloaded:
+            logger.info(f"发现未完成的下载，从 {self.downloaded} 字节处继续: {self.url}")
+            self._replay_part()
+
+        while True:
+            try:
+                self._attempt(meta, name_for_response)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout, IncompleteDownloadError) as e:
+                self.attempts += 1
+                if self.attempts > self.max_retries:
+                    raise
+                logger.warning(f"下载中断({e})，第{self.attempts}次重试: {self.url}")
+                time.sleep(min(0.5 * 2 ** (self.attempts - 1), 4))
+                offset = self._resumable_offset(meta)
+                if offset != self.downloaded:
+                    self._restart()
+                    self.downloaded = offset
+
+        file_path = os.path.join(self.download_dir, meta["filename"])
+        os.replace(self.part_path, file_path)
+        self._remove_meta()
+        self._report_progress(force=True)
+        return file_path
+
+    def _attempt(self, meta, name_for_response):
+        """发起一次请求并把数据追加到临时文件"""
+        headers = dict(self.headers)
+        # 禁止压缩传输，保证收到的字节数可以与content-length对比
+        headers["Accept-Encoding"] = "identity"
+        if self.downloaded:
+            headers["Range"] = f"bytes={self.downloaded}-"
+            headers["If-Range"] = meta["validator"]
+
+        with self.session.get(self.url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 416:
+                # 断点超出服务器文件长度，从头下载
+                self._restart()
+                raise IncompleteDownloadError("服务器拒绝了续传范围")
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                match = CONTENT_RANGE_PATTERN.match(response.headers.get("content-range", ""))
+                if not match or int(match.group(1)) != self.downloaded:
+                    self._restart()
+                    raise IncompleteDownloadError("服务器返回的续传范围不匹配")
+                self.total_size = int(match.group(3)) if match.group(3) != "*" else None
+                mode = "ab"
+            else:
+                if self.downloaded:
+                    logger.info(f"服务器未接受续传请求，从头下载: {self.url}")
+                    self._restart()
+                length = response.headers.get("content-length")
+                self.total_size = int(length) if length and length.isdigit() else None
+                mode = "wb"
+
+            if not meta.get("filename"):
+                meta["filename"] = name_for_response(response)
+            meta["validator"] = self._validator(response) or meta.get("validator")
+            meta["total_size"] = self.total_size
+            self._save_meta(meta)
+
+            with open(self.part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    self.downloaded += len(chunk)
+                    if self.on_chunk:
+                        self.on_chunk(chunk)
+                    self._report_progress()
+
+        if self.total_size is not None and self.downloaded != self.total_size:
+            raise IncompleteDownloadError(f"已下载 {self.downloaded}/{self.total_size} 字节")
+
+    def _resumable_offset(self, meta):
+        """计算可续传的字节偏移，没有校验信息时无法安全续传"""
+        if not meta.get("validator") or not meta.get("filename"):
+            return 0
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _validator(response):
+        """获取If-Range可用的校验值：强ETag优先，其次Last-Modified"""
+        etag = response.headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("last-modified")
+
+    def _restart(self):
+        """丢弃已下载的数据，从头开始"""
+        self.downloaded = 0
+        with open(self.part_path, "wb"):
+            pass
+        if self.on_reset:
+            self.on_reset()
+
+    def _replay_part(self):
+        """续传前把临时文件中已有的数据交给on_chunk"""
+        if not self.on_chunk:
+            return
+        with open(self.part_path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size * 8)
+                if not chunk:
+                    break
+                self.on_chunk(chunk)
+
+    def _report_progress(self, force=False):
+        """按最小间隔回调下载进度"""
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        try:
+            self.on_progress(self.downloaded, self.total_size)
+        except Exception as e:
+            logger.error(f"下载进度回调失败: {e}")
+
+    def _load_meta(self):
+        """读取临时文件对应的元数据"""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("url") == self.url.split("?", 1)[0]:
+                return meta
+        except (OSError, ValueError):
+            pass
+        return {"url": self.url.split("?", 1)[0]}
+
+    def _save_meta(self, meta):
+        """保存元数据（先写临时文件再替换）"""
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+    def _remove_meta(self):
+        """下载完成后删除元数据"""
+        try:
+            os.remove(self.meta_path)
+        except OSError:
+            pass
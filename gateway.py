@@ -0,0 +1,555 @@
+"""网关模式：一个进程通过本地WebSocket/HTTP服务为多个展台屏幕提供对话
+
+每个屏幕连接 ws://<host>:<port>/ws，拥有独立的对话引擎（会话、场景、请求队列），
+所有屏幕共享到Dify的连接池、媒体下载管理器（含已完成下载的缓存）和首轮回复缓存。
+网络部分运行在asyncio事件循环中，对Dify的请求仍由对话引擎的工作线程发出。
+
+用法:
+    python gateway.py --api-key app-xxx --port 8780
+    python gateway.py --base-url http://127.0.0.1:8765/v1 --api-key app-test --scene-keys yannanyuan=app-yn
+
+屏幕发送的消息（JSON文本帧）:
+    {"type": "submit", "text": "...", "tool": null, "params": null}
+    {"type": "new_conversation"} / {"type": "clear"}
+网关发送的消息:
+    hello, turn_started, text(增量文本), media_detected, progress, media(url为 /media/<文件名>),
+    turn_finished, scene(背景和头像为 /assets/<文件名>), queue, reset, busy, error
+
+准入控制：连接数达到max_clients时握手返回503；本屏幕的上一轮尚未结束，或进行中的请求达到
+max_active_turns时，新请求返回busy。
+背压：每个连接有独立的发送队列，屏幕读取变慢时合并同一轮的连续文本和进度消息，
+其余消息积压超过max_pending时断开该连接（屏幕重连后开始新会话），不影响其他屏幕。
+HTTP接口: GET /health 返回运行统计。
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import itertools
+from collections import deque, OrderedDict
+from urllib.parse import quote, unquote
+import requests
+from requests.adapters import HTTPAdapter
+from api_client import AgentAPIClient
+from app_config import scene_for_key
+from audio_engine import AudioEngine
+from download_manager import DownloadManager
+from conversation import (
+    ConversationEngine, TurnStarted, TextDelta, MediaDetected, DownloadProgress, MediaReady,
+    TurnFinished, SceneChanged, QueueChanged, ConversationReset,
+)
+from scene_switcher import garden_background_mapping, garden_profiles
+from stream_events import TextData, MediaDirective, MediaResult
+from websocket_protocol import (
+    WebSocket, WebSocketError, read_http_head, is_upgrade_request, handshake_response, CLOSE_GOING_AWAY,
+)
+
+logger = logging.getLogger(__name__)
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+# 屏幕可以下载的场景图片（背景和头像）
+ASSET_NAMES = (
+    set(garden_background_mapping.values())
+    | {profile["photo"] for profile in garden_profiles.values()}
+    | {"background.jpg", "pm.jpg"}
+)
+
+# 回复缓存回放的回调类型（预览图和下载进度与实际下载过程有关，不缓存）
+CACHED_DATA_TYPES = (TextData, MediaDirective, MediaResult)
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".mp3": "audio/mpeg",
+}
+
+
+class ResponseCache:
+    """首轮回复缓存（LRU，带过期时间），多个屏幕提出相同的开场问题时不再请求Dify"""
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # 键 -> (写入时间, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class GatewayClient(AgentAPIClient):
+    """网关中每个屏幕使用的API客户端：共享连接池、下载管理器和回复缓存，不在本机播放音频
+
+    只有会话的第一轮经过回复缓存。命中缓存的一轮没有Dify会话ID，所以不能以会话ID判断是否为第一轮：
+    任何一轮结束后都不再使用缓存，直到新会话或切换场景（两者都会把current_conversation_id置为None）。
+    """
+    def __init__(self, gateway, api_key):
+        self.in_conversation = False  # 当前会话已有过一轮（包括命中缓存的一轮）
+        super().__init__(
+            gateway.base_url, api_key,
+            http=gateway.http,
+            download_manager=gateway.download_manager,
+            audio_engine=gateway.audio_engine,
+            download_dir=gateway.media_dir,
+        )
+        self.prefetch_audio = False
+        self.response_cache = gateway.response_cache
+
+    @property
+    def current_conversation_id(self):
+        return self._conversation_id
+
+    @current_conversation_id.setter
+    def current_conversation_id(self, conversation_id):
+        self._conversation_id = conversation_id
+        if conversation_id is None:
+            # 新会话或切换场景，下一轮重新成为第一轮
+            self.in_conversation = False
+
+    def call_agent(self, input_text, tool_name=None, tool_params=None, user_id="default_user", files=None,
+                   on_data=None, on_end=None, turn=None):
+        """与AgentAPIClient.call_agent相同，会话第一轮的回复经过回复缓存"""
+        cache = self.response_cache
+        key = None
+        # 只缓存会话的第一轮，回复与上下文无关；命中时不继承其他屏幕的会话
+        first_turn = not self.in_conversation and not self.current_conversation_id
+        self.in_conversation = True
+        if cache is not None and first_turn and not files:
+            key = (self.api_key, input_text, tool_name, json.dumps(tool_params, sort_keys=True, ensure_ascii=False))
+            cached = cache.get(key)
+            if cached is not None:
+                return self._replay_cached(cached, on_data, on_end, turn)
+
+        recorded = []
+
+        def record(data):
+            if type(data) in CACHED_DATA_TYPES:
+                recorded.append(data)
+            if on_data:
+                on_data(data)
+
+        result = super().call_agent(input_text, tool_name, tool_params, user_id, files,
+                                    on_data=record if key is not None else on_data, on_end=on_end, turn=turn)
+        if (key is not None and result and result.get("conversation_id")
+                and all(item.ok for item in result.get("media_items") or [])):
+            # 会话ID和任务ID属于发出请求的屏幕，不随缓存交给其他屏幕
+            cache.put(key, (recorded, dict(result, conversation_id=None, task_id=None)))
+        return result
+
+    def _replay_cached(self, cached, on_data, on_end, turn):
+        recorded, result = cached
+        if turn:
+            turn.scene = scene_for_key(self.api_key)
+            turn.mark("request_sent")
+            turn.mark("first_message")
+        if on_data:
+            for data in recorded:
+                if type(data) is TextData:
+                    data = TextData(data.text, time.monotonic())
+                on_data(data)
+        response = dict(result, cached=True)
+        if on_end:
+            on_end(response)
+        return response
+
+
+class ClientSession:
+    """一个屏幕的连接：对话引擎的事件转换为JSON消息，经有界发送队列发出"""
+    def __init__(self, gateway, client_id, websocket):
+        self.gateway = gateway
+        self.client_id = client_id
+        self.websocket = websocket
+        self.outbox = deque()
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        self.engine = ConversationEngine(
+            GatewayClient(gateway, gateway.api_key),
+            dispatch=gateway.dispatch,
+            user_id=f"kiosk_{client_id}",
+            api_keys=gateway.api_keys,
+        )
+        self._event_handlers = {
+            TurnStarted: lambda event: {"type": "turn_started", "request_id": event.request_id, "text": event.input_text},
+            TextDelta: lambda event: {"type": "text", "request_id": event.request_id, "text": event.text},
+            MediaDetected: lambda event: {"type": "media_detected", "request_id": event.request_id, "kind": event.kind},
+            DownloadProgress: lambda event: {"type": "progress", "request_id": event.request_id,
+                                             "media_index": event.media_index, "downloaded": event.downloaded,
+                                             "total": event.total},
+            MediaReady: self._media_message,
+            TurnFinished: lambda event: {"type": "turn_finished", "request_id": event.request_id,
+                                         "status": event.status, "cached": bool(event.response.get("cached"))},
+            SceneChanged: self._scene_message,
+            QueueChanged: lambda event: {"type": "queue", "depth": event.depth},
+            ConversationReset: lambda event: {"type": "reset"},
+        }
+        self.engine.subscribe(self._on_event)
+
+    def _on_event(self, event):
+        """对话引擎事件（事件循环线程），预览图和音频播放状态不发给屏幕"""
+        handler = self._event_handlers.get(type(event))
+        if handler is not None:
+            self.push(handler(event))
+
+    def _media_message(self, event):
+        item = event.item
+        message = {"type": "media", "request_id": event.request_id, "media_index": item.index,
+                   "kind": item.kind, "ok": item.ok}
+        if item.ok:
+            message["url"] = f"/media/{quote(os.path.basename(item.file_path))}"
+        else:
+            message["error"] = item.error
+        return message
+
+    def _scene_message(self, event):
+        profile = garden_profiles[event.garden]
+        return {
+            "type": "scene",
+            "garden": event.garden,
+            "background": f"/assets/{garden_background_mapping[event.garden]}",
+            "photo": f"/assets/{profile['photo']}",
+            "name": profile["name"],
+            "intro": profile["intro"],
+        }
+
+    def push(self, message):
+        """把消息加入发送队列；积压时合并同一轮的连续文本和同一媒体的进度"""
+        if self.closed:
+            return
+        last = self.outbox[-1] if self.outbox else None
+        if last is not None and last["type"] == message["type"] and last.get("request_id") == message.get("request_id"):
+            if message["type"] == "text":
+                last["text"] += message["text"]
+                self.gateway.stats["coalesced"] += 1
+                return
+            if message["type"] == "progress" and last["media_index"] == message["media_index"]:
+                self.outbox[-1] = message
+                self.gateway.stats["coalesced"] += 1
+                return
+        if len(self.outbox) >= self.gateway.max_pending:
+            logger.warning(f"屏幕{self.client_id}读取过慢，积压{len(self.outbox)}条消息，断开连接")
+            self.gateway.stats["dropped"] += 1
+            self.abort()
+            return
+        self.outbox.append(message)
+        self._wakeup.set()
+
+    async def write_loop(self):
+        """发送队列中的消息，屏幕读取变慢时在send中等待，期间到达的消息在队列中合并"""
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.outbox and not self.closed:
+                message = self.outbox.popleft()
+                try:
+                    await self.websocket.send(json.dumps(message, ensure_ascii=False))
+                except ConnectionError:
+                    self.abort()
+                    return
+
+    async def read_loop(self):
+        """接收屏幕的消息，连接关闭时返回"""
+        while True:
+            raw = await self.websocket.recv()
+            if raw is None:
+                return
+            try:
+                message = json.loads(raw)
+                kind = message["type"]
+            except (ValueError, TypeError, KeyError):
+                self.push({"type": "error", "message": "无效的消息"})
+                continue
+
+            if kind == "submit":
+                self._submit(message)
+            elif kind == "new_conversation":
+                self.engine.new_conversation()
+            elif kind == "clear":
+                self.engine.clear()
+            else:
+                self.push({"type": "error", "message": f"未知的消息类型: {kind}"})
+
+    def _submit(self, message):
+        text = str(message.get("text") or "").strip()
+        if not text:
+            self.push({"type": "error", "message": "请输入文本内容"})
+            return
+        # 本屏幕的上一轮未结束时不接受新请求：引擎会取代旧请求，屏幕收不到旧请求的turn_finished
+        if self.engine.is_streaming or self.gateway.active_turns() >= self.gateway.max_active_turns:
+            self.gateway.stats["busy"] += 1
+            self.push({"type": "busy", "retry_after": 1})
+            return
+        self.engine.submit(text, message.get("tool"), message.get("params"), files=[])
+
+    def abort(self):
+        """立即关闭连接（不等待对方读取）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.outbox.clear()
+        self._wakeup.set()
+        self.websocket.closed = True
+        self.websocket.writer.transport.abort()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+        self.engine.close()
+
+
+class Gateway:
+    """网关：管理屏幕连接和共享资源"""
+    def __init__(self, base_url, api_key, media_dir, api_keys=None, max_clients=64, max_active_turns=16,
+                 max_pending=256, response_cache_ttl=300, pool_size=32, download_workers=8, write_buffer=64 * 1024):
+        """初始化网关
+        Args:
+            base_url: Dify API基础地址
+            api_key: 默认场景的API密钥
+            media_dir: 媒体下载目录（所有屏幕共享）
+            api_keys: 场景密钥名称 -> API密钥，未提供的场景从config.json读取
+            max_clients: 最大屏幕连接数
+            max_active_turns: 同时进行的最大请求数
+            max_pending: 每个连接允许积压的消息数
+            response_cache_ttl: 首轮回复缓存的有效期(秒)，0表示不缓存
+            pool_size: 到Dify的连接池大小
+            download_workers: 媒体下载线程数
+            write_buffer: 每个连接的发送缓冲区上限(字节)，超过后等待屏幕读取
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.media_dir = media_dir
+        self.api_keys = api_keys
+        self.max_clients = max_clients
+        self.max_active_turns = max_active_turns
+        self.max_pending = max_pending
+        self.write_buffer = write_buffer
+        os.makedirs(media_dir, exist_ok=True)
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.download_manager = DownloadManager(
+            max_workers=download_workers,
+            per_host_limit=max(2, download_workers // 2),
+            cache_size=1024,
+            cache_check=lambda file_path: bool(file_path) and os.path.exists(file_path),
+        )
+        self.audio_engine = AudioEngine()  # 只用于满足API客户端的接口，网关不播放音频
+        self.response_cache = ResponseCache(ttl=response_cache_ttl) if response_cache_ttl > 0 else None
+
+        self.clients = {}  # 连接ID -> ClientSession
+        self.stats = {"accepted": 0, "rejected": 0, "busy": 0, "dropped": 0, "coalesced": 0}
+        self.loop = None
+        self._ids = itertools.count(1)
+        self.started_at = time.time()
+
+    def dispatch(self, func, *args):
+        """把回调交给事件循环线程执行（对话引擎的dispatch）"""
+        try:
+            self.loop.call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            # 事件循环已关闭（网关正在退出）
+            pass
+
+    def active_turns(self):
+        return sum(1 for session in self.clients.values() if session.engine.is_streaming)
+
+    def get_stats(self):
+        from perf_stats import process_rss
+        return {
+            "clients": len(self.clients),
+            "active_turns": self.active_turns(),
+            "uptime": time.time() - self.started_at,
+            "threads": threading.active_count(),
+            "rss": process_rss(),
+            **self.stats,
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None,
+            "downloads": self.download_manager.get_metrics(),
+        }
+
+    async def serve(self, host="127.0.0.1", port=8780):
+        """启动服务，返回asyncio.Server"""
+        self.loop = asyncio.get_running_loop()
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line, headers = await read_http_head(reader)
+        except WebSocketError:
+            writer.close()
+            return
+        if not request_line:
+            writer.close()
+            return
+        parts = request_line.split(" ")
+        method, path = (parts[0], parts[1]) if len(parts) >= 2 else ("", "")
+        path = path.split("?", 1)[0]
+        try:
+            if path == "/ws" and is_upgrade_request(headers):
+                await self._serve_websocket(reader, writer, headers)
+            else:
+                await self._serve_http(method, path, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_websocket(self, reader, writer, headers):
+        if len(self.clients) >= self.max_clients:
+            self.stats["rejected"] += 1
+            await self._respond(writer, 503, b"too many clients", "text/plain", {"Retry-After": "5"})
+            return
+        writer.write(handshake_response(headers))
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        websocket = WebSocket(reader, writer, max_message_size=64 * 1024)
+        client_id = next(self._ids)
+        session = ClientSession(self, client_id, websocket)
+        self.clients[client_id] = session
+        self.stats["accepted"] += 1
+        logger.info(f"屏幕{client_id}已连接，当前连接数 {len(self.clients)}")
+        session.push({"type": "hello", "client_id": client_id})
+
+        write_task = asyncio.create_task(session.write_loop())
+        try:
+            await session.read_loop()
+        finally:
+            session.close()
+            del self.clients[client_id]
+            write_task.cancel()
+            await websocket.close(CLOSE_GOING_AWAY)
+            logger.info(f"屏幕{client_id}已断开，当前连接数 {len(self.clients)}")
+
+    async def _serve_http(self, method, path, writer):
+        if method != "GET":
+            await self._respond(writer, 405, b"method not allowed", "text/plain")
+            return
+        if path == "/health":
+            body = json.dumps(self.get_stats(), ensure_ascii=False).encode("utf-8")
+            await self._respond(writer, 200, body, "application/json")
+            return
+        file_path = None
+        name = unquote(path.rsplit("/", 1)[-1])
+        if path.startswith("/media/") and name and not name.startswith("."):
+            file_path = os.path.join(self.media_dir, name)
+        elif path.startswith("/assets/") and name in ASSET_NAMES:
+            file_path = os.path.join(ASSET_DIR, name)
+        if file_path is None or os.path.basename(file_path) != name or not os.path.isfile(file_path):
+            await self._respond(writer, 404, b"not found", "text/plain")
+            return
+        content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            writer.write(self._head(200, content_type, size, {"Cache-Control": "max-age=3600"}))
+            await writer.drain()
+            # 文件内容由内核直接发送，不经过事件循环线程复制
+            await self.loop.sendfile(writer.transport, f)
+
+    @staticmethod
+    def _head(status, content_type, length, extra=None):
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}[status]
+        lines = [f"HTTP/1.1 {status} {reason}", f"Content-Type: {content_type}", f"Content-Length: {length}",
+                 "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _respond(self, writer, status, body, content_type, extra=None):
+        writer.write(self._head(status, content_type, len(body), extra) + body)
+        await writer.drain()
+
+    def shutdown(self):
+        for session in list(self.clients.values()):
+            session.close()
+        self.download_manager.shutdown()
+        self.audio_engine.shutdown()
+
+
+def parse_scene_keys(value):
+    """解析 名称=密钥,名称=密钥 形式的场景密钥"""
+    keys = {}
+    for pair in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, key = pair.partition("=")
+        keys[name.strip()] = key.strip()
+    return keys
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="对话网关：通过本地WebSocket服务为多个展台屏幕提供对话")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--base-url", default="https://api.dify.ai/v1", help="Dify API基础地址")
+    parser.add_argument("--api-key", default=os.environ.get("DIFY_API_KEY"), help="默认场景的API密钥（或环境变量DIFY_API_KEY）")
+    parser.add_argument("--scene-keys", help="场景密钥，如 yannanyuan=app-xxx,shaoyuan=app-yyy（默认读取config.json）")
+    parser.add_argument("--media-dir", default=os.path.join(ASSET_DIR, "downloads", "gateway"), help="媒体下载目录")
+    parser.add_argument("--max-clients", type=int, default=64, help="最大屏幕连接数")
+    parser.add_argument("--max-active-turns", type=int, default=16, help="同时进行的最大请求数")
+    parser.add_argument("--max-pending", type=int, default=256, help="每个连接允许积压的消息数")
+    parser.add_argument("--response-cache-ttl", type=float, default=300, help="首轮回复缓存的有效期(秒)，0表示不缓存")
+    parser.add_argument("--pool-size", type=int, default=32, help="到Dify的连接池大小")
+    parser.add_argument("--download-workers", type=int, default=8, help="媒体下载线程数")
+    return parser
+
+
+async def run_gateway(args):
+    gateway = Gateway(
+        args.base_url.rstrip("/"),
+        args.api_key,
+        args.media_dir,
+        api_keys=parse_scene_keys(args.scene_keys) or None,
+        max_clients=args.max_clients,
+        max_active_turns=args.max_active_turns,
+        max_pending=args.max_pending,
+        response_cache_ttl=args.response_cache_ttl,
+        pool_size=args.pool_size,
+        download_workers=args.download_workers,
+    )
+    server = await gateway.serve(args.host, args.port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"对话网关: ws://{host}:{port}/ws", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        gateway.shutdown()
+
+
+def main():
+    from app_config import load_config
+    from log_pipeline import setup_logging
+
+    args = build_parser().parse_args()
+    if not args.api_key:
+        build_parser().error("缺少API密钥（--api-key或环境变量DIFY_API_KEY）")
+    setup_logging(**((load_config() or {}).get("logging") or {}))
+    try:
+        asyncio.run(run_gateway(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""群聊：把同一个问题同时发给多个场景智能体，各自的回复并行流式返回
+
+每个场景智能体使用主客户端的分支（独立的API密钥和会话，共享连接、下载管理器和音频引擎），
+请求在各自的工作线程中同时发出，因此一轮群聊的总耗时接近最慢的智能体，而不是各智能体耗时之和。
+与ConversationEngine相同，API客户端的回调通过dispatch交给所属线程处理，事件在所属线程中发给订阅者。
+"""
+import time
+import logging
+import threading
+from app_config import get_api_key
+from conversation import Event
+from stream_events import TextData, MediaResult
+from scene_switcher import garden_api_key_names, garden_profiles
+from turn_metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class GroupStarted(Event):
+    """一轮群聊已发出，agents为参与的场景"""
+    __slots__ = ("input_text", "agents")
+
+    def __init__(self, request_id, input_text, agents):
+        super().__init__(request_id)
+        self.input_text = input_text
+        self.agents = agents
+
+
+class GroupDelta(Event):
+    """某个智能体的回复片段；buffer为该智能体到目前为止的完整回复"""
+    __slots__ = ("agent", "name", "text", "buffer", "first")
+
+    def __init__(self, request_id, agent, name, text, buffer, first):
+        super().__init__(request_id)
+        self.agent = agent
+        self.name = name
+        self.text = text
+        self.buffer = buffer
+        self.first = first
+
+
+class GroupMediaReady(Event):
+    """某个智能体回复中的媒体项下载完成（或失败）"""
+    __slots__ = ("agent", "item")
+
+    def __init__(self, request_id, agent, item):
+        super().__init__(request_id)
+        self.agent = agent
+        self.item = item
+
+
+class GroupReplyFinished(Event):
+    """某个智能体回复结束；elapsed为发出请求到回复结束的时间(秒)"""
+    __slots__ = ("agent", "name", "response", "status", "elapsed")
+
+    def __init__(self, request_id, agent, name, response, status, elapsed):
+        super().__init__(request_id)
+        self.agent = agent
+        self.name = name
+        self.response = response
+        self.status = status
+        self.elapsed = elapsed
+
+
+class GroupFinished(Event):
+    """所有智能体都已回复
+
+    first_response为最先回复的智能体的首个片段延迟(秒，没有任何回复时为None)，
+    wall_time为整轮群聊耗时(秒)，elapsed为各智能体的回复耗时
+    """
+    __slots__ = ("first_response", "first_agent", "wall_time", "elapsed")
+
+    def __init__(self, request_id, first_response, first_agent, wall_time, elapsed):
+        super().__init__(request_id)
+        self.first_response = first_response
+        self.first_agent = first_agent
+        self.wall_time = wall_time
+        self.elapsed = elapsed
+
+
+class _Round:
+    """一轮群聊的状态（只在所属线程中访问）"""
+    __slots__ = ("request_id", "started", "pending", "buffers", "first", "elapsed", "rendered")
+
+    def __init__(self, request_id, agents):
+        self.request_id = request_id
+        self.started = time.monotonic()
+        self.pending = set(agents)
+        self.buffers = {agent: "" for agent in agents}
+        self.first = {}  # 场景 -> 首个片段延迟
+        self.elapsed = {}  # 场景 -> 回复耗时
+        self.rendered = {agent: set() for agent in agents}  # 场景 -> 已发出的媒体序号
+
+
+class GroupChat:
+    """群聊：一轮请求并行发给多个场景智能体"""
+    def __init__(self, api_client, dispatch=None, user_id=None, api_keys=None):
+        """初始化群聊
+        Args:
+            api_client: AgentAPIClient，各智能体使用它的分支
+            dispatch: dispatch(func, *args)，把回调交给所属线程执行；默认在工作线程中加锁后直接执行
+            user_id: Dify用户标识
+            api_keys: 场景密钥名称 -> API密钥，未提供的场景从config.json读取
+        """
+        self.api_client = api_client
+        self.dispatch = dispatch or self._serialized
+        self.user_id = user_id or "group_" + str(int(time.time()))
+        self.api_keys = api_keys
+        self.subscribers = []
+        self.clients = {}  # 场景 -> API客户端（跨轮次保留会话上下文）
+        self.current = None
+        self.current_request_id = 0
+        self._lock = threading.Lock()
+
+    def _serialized(self, func, *args):
+        # 没有所属线程时，各工作线程的回调依次执行
+        with self._lock:
+            func(*args)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _emit(self, event):
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"处理群聊事件{type(event).__name__}失败: {e}")
+
+    @property
+    def is_streaming(self):
+        return self.current is not None and bool(self.current.pending)
+
+    def agents(self):
+        """有API密钥的场景（按配置顺序）"""
+        return [garden for garden, key_name in garden_api_key_names.items() if self._api_key(key_name)]
+
+    def _api_key(self, key_name):
+        return (self.api_keys or {}).get(key_name) or get_api_key(key_name)
+
+    def _client(self, garden):
+        client = self.clients.get(garden)
+        if client is None:
+            client = self.clients[garden] = self.api_client.fork(self._api_key(garden_api_key_names[garden]))
+        return client
+
+    def submit(self, input_text, agents=None):
+        """把问题同时发给各智能体（在所属线程中调用），返回请求ID；没有可用的智能体时返回None
+
+        新一轮开始后，上一轮未结束的回复不再发出事件
+        """
+        agents = list(agents) if agents is not None else self.agents()
+        if not agents:
+            logger.error("没有配置任何场景的API密钥，无法群聊")
+            return None
+
+        self.current_request_id += 1
+        request_id = self.current_request_id
+        self.current = _Round(request_id, agents)
+        self._emit(GroupStarted(request_id, input_text, agents))
+        for garden in agents:
+            threading.Thread(
+                target=self._ask, args=(request_id, garden, self._client(garden), input_text, self.current.started),
+                name=f"GroupChat-{garden_api_key_names[garden]}", daemon=True,
+            ).start()
+        return request_id
+
+    def _ask(self, request_id, garden, client, input_text, started):
+        """工作线程：向一个智能体发出请求"""
+        turn = get_registry().start_turn()
+        ended = []
+        first = []
+
+        def on_data(data):
+            if type(data) is TextData and not first:
+                first.append(time.monotonic() - started)
+            self.dispatch(self._handle_data, request_id, garden, data, first[0] if first else None)
+
+        result = None
+        try:
+            result = client.call_agent(
+                input_text, user_id=self.user_id, on_data=on_data, on_end=ended.append, turn=turn,
+            )
+        except Exception as e:
+            logger.error(f"群聊请求({garden})失败: {e}")
+        # 流在message_end之前结束时API客户端不回调on_end，同样按回复结束处理
+        response = ended[0] if ended else (result or {})
+        status = "ok" if response.get("conversation_id") else "error"
+        turn.finish(status)
+        self.dispatch(self._handle_end, request_id, garden, response, status, time.monotonic() - started)
+
+    def _handle_data(self, request_id, garden, data, first_response):
+        """处理某个智能体的流式数据（所属线程）"""
+        current = self.current
+        if current is None or current.request_id != request_id:
+            return
+        if type(data) is TextData:
+            chunk = data.text
+            first = not current.buffers[garden]
+            if first and first_response is not None:
+                current.first[garden] = first_response
+            current.buffers[garden] += chunk
+            self._emit(GroupDelta(request_id, garden, self._name(garden), chunk, current.buffers[garden], first))
+        elif type(data) is MediaResult:
+            self._media_ready(current, garden, data.item)
+
+    def _media_ready(self, current, garden, item):
+        if item.index in current.rendered[garden]:
+            return
+        current.rendered[garden].add(item.index)
+        self._emit(GroupMediaReady(current.request_id, garden, item))
+
+    def _handle_end(self, request_id, garden, response, status, elapsed):
+        """某个智能体回复结束（所属线程），全部结束时发出GroupFinished"""
+        current = self.current
+        if current is None or current.request_id != request_id or garden not in current.pending:
+            return
+        for item in response.get("media_items") or []:
+            self._media_ready(current, garden, item)
+        current.pending.discard(garden)
+        current.elapsed[garden] = elapsed
+        self._emit(GroupReplyFinished(request_id, garden, self._name(garden), response, status, elapsed))
+        if current.pending:
+            return
+
+        wall_time = time.monotonic() - current.started
+        first_agent = min(current.first, key=current.first.get) if current.first else None
+        first_response = current.first.get(first_agent)
+        registry = get_registry()
+        if first_response is not None:
+            registry.observe("group_first_response", "group", first_response)
+        registry.observe("group_wall_time", "group", wall_time)
+        logger.info(
+            f"群聊{request_id}完成: 首个回复 {first_response * 1000 if first_response is not None else 0:.0f} ms"
+            f"({first_agent}), 总耗时 {wall_time * 1000:.0f} ms, 最慢 {max(current.elapsed.values()) * 1000:.0f} ms"
+        )
+        self._emit(GroupFinished(request_id, first_response, first_agent, wall_time, dict(current.elapsed)))
+
+    @staticmethod
+    def _name(garden):
+        return garden_profiles[garden]["name"]
@@ -2,24 +2,58 @@ import tkinter as tk
 import logging
 import ctypes
 from ui_builder import UIBuilder
-from stream_handler import StreamHandler
+from conversation_tabs import ConversationTabs
+from scene_switcher import default_profile
+from stall_watchdog import StallWatchdog
+from perf_stats import collect_perf_stats
 
 logger = logging.getLogger(__name__)
 
-# 定义 Windows API 函数，用于控制任务栏显示/隐藏
-user32 = ctypes.windll.user32
+# Windows API 常量，用于控制任务栏显示/隐藏
 SW_HIDE = 0
 SW_SHOW = 5
 
+def _user32():
+    """获取 Windows user32 接口（首次调用时加载，非Windows平台返回None）"""
+    windll = getattr(ctypes, "windll", None)
+    return windll.user32 if windll else None
+
 def hide_taskbar():
     """隐藏Windows任务栏"""
-    hwnd = user32.FindWindowW("Shell_TrayWnd", None)
-    user32.ShowWindow(hwnd, SW_HIDE)
+    user32 = _user32()
+    if user32:
+        hwnd = user32.FindWindowW("Shell_TrayWnd", None)
+        user32.ShowWindow(hwnd, SW_HIDE)
 
 def show_taskbar():
     """显示Windows任务栏"""
-    hwnd = user32.FindWindowW("Shell_TrayWnd", None)
-    user32.ShowWindow(hwnd, SW_SHOW)
+    user32 = _user32()
+    if user32:
+        hwnd = user32.FindWindowW("Shell_TrayWnd", None)
+        user32.ShowWindow(hwnd, SW_SHOW)
+
+def install_startup_probe(root, app, exit_when_ready=True):
+    """启动耗时探针：根窗口首次绘制时输出first_paint，资源加载完成且事件循环空闲时输出interactive
+
+    供启动和冷启动基准测试使用（设置环境变量 AGENT_STARTUP_PROBE=1 启用）。
+    """
+    marks = set()
+
+    def mark(name):
+        if name not in marks:
+            marks.add(name)
+            print(name, flush=True)
+
+    root.bind("<Expose>", lambda e: mark("first_paint"), add="+")
+
+    def check_interactive():
+        ui = app.ui_builder
+        if ui.bg_photo is not None and ui.info_panel.photo_label is not None and ui.chat_frame.winfo_children():
+            root.after_idle(lambda: (mark("interactive"), exit_when_ready and root.after(50, root.destroy)))
+        else:
+            root.after(5, check_interactive)
+
+    root.after(0, check_interactive)
 
 class AgentGUI:
     """智能体图形用户界面类，整合界面构建和流式处理"""
@@ -42,16 +76,30 @@ class AgentGUI:
         self.ui_builder.update_tool_options(tool_options)
         
         # 在初始化流式处理器之前添加以下内容
-        self.ui_builder.add_photo("pm.jpg")  # 设置默认照片
-        self.ui_builder.set_name("派蒙")  # 设置姓名
-        self.ui_builder.set_intro("    派蒙是旅行者在提瓦特的旅途中钓到的奇妙生物，同时也是旅行者的向导与引路人。\n    年幼的小女孩外形，白色齐肩发，戴着一颗黑曜石打造的星星发饰，头顶悬浮王冠（派蒙待机动作可以看到有取下来的动作）背后的小披风有着星空纹理般的黑蓝色，披风有类似星座纹路的装饰，飘动起来似乎可以看到星辰在闪动，眼睛远处看是蓝瞳，拉近视角后也可以看见眼中的星辰，衣着镶金边的白色连衣裤，衣服中央有类似摩拉货币的图案，脚穿白镶金的靴子，身边飘动着闪闪星座纹路，派蒙贪吃爱财，也是个话痨，因为旅行者很多台词都被派蒙抢了，所以显得她话有些多。\n    派蒙非常珍视与旅行者的友谊，屡次强调自己是“最好的伙伴”，不会和旅行者分开。")  # 设置介绍
+        self.ui_builder.add_photo(default_profile["photo"])  # 设置默认照片
+        self.ui_builder.set_name(default_profile["name"])  # 设置姓名
+        self.ui_builder.set_intro(default_profile["intro"])  # 设置介绍
         # self.ui_builder.set_intro("paimenghsjakhsaksh")
-        # 初始化流式处理器
-        self.stream_handler = StreamHandler(api_client, self.ui_builder)
+        # 初始化会话标签页，每个标签页有自己的流式处理器
+        self.tabs = ConversationTabs(self.ui_builder, api_client)
         # 在UIBuilder初始化后添加：
         # 增大聊天区域高度（原高度为12行）
         self.ui_builder.response_frame.config(height=20)  # 增加聊天区域高度
 
+        # 监测界面线程卡顿，超过阈值时记录卡住的调用栈
+        self.watchdog = StallWatchdog(root)
+        self.watchdog.start()
+
+        # 性能面板，F12切换显示
+        self.ui_builder.enable_perf_hud(
+            lambda: collect_perf_stats(self.stream_handler, self.api_client, self.watchdog, self.tabs.get_stats())
+        )
+
+    @property
+    def stream_handler(self):
+        """当前标签页的流式处理器"""
+        return self.tabs.handler
+
     def on_close(self):
         """窗口关闭时的处理函数，销毁主窗口"""
         self.root.destroy()
@@ -90,6 +138,9 @@ if __name__ == "__main__":
         def get_playback_time(self, file_path):
             return 5
 
+        def add_playback_listener(self, callback):
+            pass
+
     # 配置日志
     logging.basicConfig(level=logging.INFO)
     
@@ -0,0 +1,319 @@
+"""图片资源登记与内存预算管理
+
+界面中的PhotoImage统一通过ImageRegistry创建和持有：
+- 记录每张图片被哪些控件引用，控件销毁（<Destroy>事件）后自动释放图片
+- 所有图片和缓存的原图按字节数计入总预算（累计计数，不逐项求和），超出预算时先释放不在屏幕上的
+  图片像素数据，控件改为显示同尺寸的空白占位，重新滚动到屏幕内时由加载函数透明地重新创建
+- 可见性只在聊天区滚动、滚动区域或尺寸变化时检查（track_scroll包装Canvas的yscrollcommand），
+  短时间内的多次变化合并为一次，界面静止时不做任何检查
+- 可选的tracemalloc泄漏报告，对比启动基线列出内存增长最多的代码位置
+
+所有方法都需要在界面线程中调用。
+"""
+import time
+import logging
+import tracemalloc
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 64 * 1024 * 1024
+SWEEP_DELAY = 100  # 滚动或布局变化后检查屏幕可见性的延迟(毫秒)，期间的多次变化合并为一次检查
+
+
+class ImageHandle:
+    """登记的图片：持有PhotoImage和重新加载它的函数"""
+    __slots__ = ("key", "loader", "photo", "width", "height", "widgets", "pinned", "last_used")
+
+    def __init__(self, key, loader, pinned=False):
+        self.key = key
+        self.loader = loader
+        self.photo = None
+        self.width = 0
+        self.height = 0
+        self.widgets = []
+        self.pinned = pinned  # 常驻图片（背景、头像）不会被释放
+        self.last_used = time.monotonic()
+
+    @property
+    def loaded(self):
+        return self.photo is not None
+
+    @property
+    def size(self):
+        """像素数据字节数（按每像素4字节估算）"""
+        return self.width * self.height * 4 if self.loaded else 0
+
+
+class ImageRegistry:
+    """PhotoImage和原图缓存的登记表，按总字节预算释放屏幕外的图片"""
+    def __init__(self, max_bytes=DEFAULT_BUDGET):
+        self.max_bytes = max_bytes
+        self.root = None
+        self.handles = set()
+        self.image_bytes = 0  # 已加载图片的像素数据字节数
+        self.cache = OrderedDict()  # 键 -> (对象, 字节数)，按最近使用排序
+        self.cache_bytes = 0
+        self.evictions = 0
+        self.reloads = 0
+        self._widgets = {}  # 控件 -> 它显示的图片句柄集合
+        self._sweep_pending = False
+        self._placeholder = None
+        self._baseline = None
+
+    def attach(self, root):
+        """绑定Tk根窗口"""
+        if self.root is None:
+            self.root = root
+
+    def track_scroll(self, command):
+        """包装Canvas的yscrollcommand：视图滚动、滚动区域或尺寸变化时安排一次可见性检查"""
+        def on_scroll(*args):
+            command(*args)
+            self.request_sweep()
+        return on_scroll
+
+    def request_sweep(self):
+        """安排一次可见性和预算检查，SWEEP_DELAY内的多次请求合并为一次"""
+        if self._sweep_pending or self.root is None:
+            return
+        self._sweep_pending = True
+        try:
+            self.root.after(SWEEP_DELAY, self._run_sweep)
+        except Exception:
+            # 窗口已销毁
+            self._sweep_pending = False
+
+    # ---- PhotoImage ----
+
+    def acquire(self, key, loader, widget=None, pinned=False):
+        """加载图片并登记，指定widget时同时设置到控件上
+        Args:
+            key: 图片标识（用于统计和日志）
+            loader: 无参数函数，返回PhotoImage；图片被释放后用它重新加载
+            widget: 显示该图片的控件
+            pinned: 是否常驻
+        """
+        handle = ImageHandle(key, loader, pinned)
+        self._load(handle)
+        self.handles.add(handle)
+        if widget is not None:
+            self.show(handle, widget)
+        self._enforce_budget()
+        return handle
+
+    def show(self, handle, widget):
+        """把图片设置到控件上并记录引用"""
+        if not handle.loaded:
+            self._load(handle)
+        widget.config(image=handle.photo, width=handle.width, height=handle.height)
+        if widget not in handle.widgets:
+            handle.widgets.append(widget)
+            handles = self._widgets.get(widget)
+            if handles is None:
+                handles = self._widgets[widget] = set()
+                widget.bind("<Destroy>", lambda event, widget=widget: self._on_destroy(event, widget), add="+")
+            handles.add(handle)
+        handle.last_used = time.monotonic()
+
+    def release(self, handle):
+        """释放图片（控件不再需要它时调用）"""
+        self._set_photo(handle, None)
+        for widget in handle.widgets:
+            handles = self._widgets.get(widget)
+            if handles is not None:
+                handles.discard(handle)
+        handle.widgets = []
+        self.handles.discard(handle)
+
+    def release_widget(self, widget):
+        """释放控件引用的全部图片（控件仍可用其他图片继续显示）"""
+        for handle in list(self._widgets.get(widget, ())):
+            handle.widgets.remove(widget)
+            self._widgets[widget].discard(handle)
+            if not handle.widgets:
+                self.release(handle)
+
+    def _on_destroy(self, event, widget):
+        if event.widget is not widget:
+            return
+        self.release_widget(widget)
+        self._widgets.pop(widget, None)
+
+    def _set_photo(self, handle, photo):
+        """设置句柄的PhotoImage（None表示释放像素数据）并更新字节计数"""
+        self.image_bytes -= handle.size
+        handle.photo = photo
+        if photo is not None:
+            handle.width = photo.width()
+            handle.height = photo.height()
+        self.image_bytes += handle.size
+
+    def _load(self, handle):
+        self._set_photo(handle, handle.loader())
+        handle.last_used = time.monotonic()
+
+    def _evict(self, handle):
+        """释放像素数据，控件显示同尺寸的空白占位"""
+        if self._placeholder is None:
+            import tkinter as tk
+            self._placeholder = tk.PhotoImage(master=self.root, width=1, height=1)
+        for widget in handle.widgets:
+            try:
+                # 控件有图片时width/height以像素为单位，保持布局不变
+                widget.config(image=self._placeholder, width=handle.width, height=handle.height)
+            except Exception:
+                pass
+        self._set_photo(handle, None)
+        self.evictions += 1
+        logger.debug(f"释放屏幕外图片: {handle.key}")
+
+    def _reload(self, handle):
+        """图片回到屏幕内时重新加载"""
+        try:
+            self._load(handle)
+        except Exception as e:
+            logger.error(f"重新加载图片失败: {handle.key}, {e}")
+            return
+        for widget in handle.widgets:
+            widget.config(image=handle.photo, width=handle.width, height=handle.height)
+        self.reloads += 1
+
+    @staticmethod
+    def _on_screen(widget):
+        """控件是否在屏幕可见区域内（考虑所在Canvas的滚动区域）"""
+        if not widget.winfo_exists() or not widget.winfo_viewable():
+            return False
+        top = widget.winfo_rooty()
+        bottom = top + widget.winfo_height()
+        parent = widget.master
+        while parent is not None:
+            if parent.winfo_class() in ("Canvas", "Toplevel", "Tk"):
+                parent_top = parent.winfo_rooty()
+                if bottom <= parent_top or top >= parent_top + parent.winfo_height():
+                    return False
+            parent = parent.master
+        return True
+
+    # ---- 原图等普通对象缓存 ----
+
+    def get_cached(self, key, loader, size_of):
+        """获取缓存对象，不存在或已被释放时调用loader加载
+        Args:
+            key: 缓存键
+            loader: 无参数加载函数
+            size_of: 计算对象字节数的函数
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.move_to_end(key)
+            return entry[0]
+        value = loader()
+        size = size_of(value)
+        self.cache[key] = (value, size)
+        self.cache_bytes += size
+        self._enforce_budget()
+        return value
+
+    def drop_cached(self, key):
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.cache_bytes -= entry[1]
+
+    # ---- 预算 ----
+
+    @property
+    def total_bytes(self):
+        return self.image_bytes + self.cache_bytes
+
+    def _enforce_budget(self):
+        """超出预算时先释放最久未用的缓存原图，再释放屏幕外最久未显示的图片"""
+        while self.total_bytes > self.max_bytes and self.cache:
+            key = next(iter(self.cache))
+            self.drop_cached(key)
+            self.evictions += 1
+        if self.total_bytes <= self.max_bytes:
+            return
+        candidates = sorted(
+            (handle for handle in self.handles
+             if handle.loaded and not handle.pinned and handle.widgets
+             and not any(self._on_screen(widget) for widget in handle.widgets)),
+            key=lambda handle: handle.last_used,
+        )
+        for handle in candidates:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._evict(handle)
+
+    def sweep(self):
+        """重新加载回到屏幕内的图片并执行预算（只检查已释放的图片，预算内时不检查已加载的图片）"""
+        now = time.monotonic()
+        for handle in self.handles:
+            if handle.loaded or not handle.widgets:
+                continue
+            if any(self._on_screen(widget) for widget in handle.widgets):
+                handle.last_used = now
+                self._reload(handle)
+        self._enforce_budget()
+
+    def _run_sweep(self):
+        self._sweep_pending = False
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.error(f"图片资源检查失败: {e}")
+
+    def get_stats(self):
+        """返回登记的图片数量和内存占用"""
+        return {
+            "images": len(self.handles),
+            "loaded": sum(1 for handle in self.handles if handle.loaded),
+            "image_bytes": self.image_bytes,
+            "cache_bytes": self.cache_bytes,
+            "budget": self.max_bytes,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+            "tk_images": len(self.root.image_names()) if self.root is not None else None,
+        }
+
+    # ---- 泄漏报告 ----
+
+    def start_leak_tracking(self, frames=10):
+        """开始tracemalloc跟踪并记录基线快照"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def schedule_leak_reports(self, interval):
+        """每隔interval秒把泄漏报告写入日志"""
+        def report():
+            logger.info(self.leak_report())
+            self.root.after(int(interval * 1000), report)
+        self.root.after(int(interval * 1000), report)
+
+    def leak_report(self, limit=10):
+        """与基线对比内存增长最多的代码位置，返回报告文本"""
+        lines = [f"图片资源: {self.get_stats()}"]
+        if self._baseline is None or not tracemalloc.is_tracing():
+            lines.append("未开启tracemalloc跟踪")
+            return "\n".join(lines)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"Python分配: 当前 {current / 1048576:.1f} MB, 峰值 {peak / 1048576:.1f} MB")
+        for stat in snapshot.compare_to(self._baseline, "lineno")[:limit]:
+            lines.append(f"  {stat}")
+        return "\n".join(lines)
+
+
+_registry = None
+
+
+def get_image_registry():
+    """全局图片登记表"""
+    global _registry
+    if _registry is None:
+        _registry = ImageRegistry()
+    return _registry
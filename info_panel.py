@@ -1,7 +1,8 @@
 import tkinter as tk
-from PIL import Image, ImageTk
 import os
 import logging
+from asset_bundle import get_bundle, load_bundled_photo, open_image, resolve_resource
+from image_registry import get_image_registry
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,8 @@ class InfoPanel:
         # 用于显示照片的标签
         self.photo_label = None
         self.photo_path = None
-        self.original_photo = None
+        self.photo_handle = None  # 照片在图片登记表中的句柄
+        self._photo_pending = False  # 照片是否已安排在首帧之后加载
         
         # 用于显示人物姓名的标签（不再设置固定字符宽度）
         self.name_label = tk.Label(self.info_frame, 
@@ -79,28 +81,45 @@ class InfoPanel:
         self.intro_label.pack(side="top", fill="both", expand=True)
     
     def add_photo(self, photo_path):
-        """添加人物照片，固定大小显示"""
+        """添加人物照片，固定大小显示；窗口尚未显示时推迟到首帧绘制之后加载"""
+        bundle = get_bundle()
+        if not os.path.exists(resolve_resource(photo_path)) and not (bundle and bundle.has(photo_path)):
+            return
+
+        self.photo_path = photo_path
+        if not self.info_frame.winfo_ismapped():
+            if not self._photo_pending:
+                self._photo_pending = True
+                self.info_frame.after_idle(lambda: self.info_frame.after(0, self._load_photo))
+            return
+        self._load_photo()
+
+    def _load_photo(self):
+        """加载并显示当前照片路径对应的图片"""
+        self._photo_pending = False
+        path = self.photo_path
+
+        def load():
+            # 固定照片显示尺寸为140x140（小于框架尺寸），优先使用资源包中的预缩放图片
+            photo_img = load_bundled_photo(path, (140, 140), self.info_frame)
+            if photo_img is None:
+                from PIL import Image, ImageTk  # 首次需要缩放照片时才加载PIL
+                with open_image(path) as original:
+                    photo_img = ImageTk.PhotoImage(original.resize((140, 140), Image.LANCZOS))
+            return photo_img
+
         try:
-            if not os.path.exists(photo_path):
-                return
-                
-            self.photo_path = photo_path
-            self.original_photo = Image.open(photo_path)
-            
-            # 固定照片显示尺寸为140x140（小于框架尺寸）
-            resized_photo = self.original_photo.resize((140, 140), Image.LANCZOS)
-            photo_img = ImageTk.PhotoImage(resized_photo)
-                
+            registry = get_image_registry()
+            handle = registry.acquire(f"portrait:{path}", load, pinned=True)
             if not self.photo_label:
-                self.photo_label = tk.Label(self.photo_frame, 
-                                          image=photo_img, 
-                                          bg=self.bg_color)
+                self.photo_label = tk.Label(self.photo_frame, bg=self.bg_color)
                 self.photo_label.pack(anchor="nw")
-                self.photo_label.image = photo_img
-            else:
-                self.photo_label.config(image=photo_img)
-                self.photo_label.image = photo_img
-                
+            registry.show(handle, self.photo_label)
+            # 切换人物后释放上一张照片
+            if self.photo_handle is not None:
+                registry.release(self.photo_handle)
+            self.photo_handle = handle
+
         except Exception as e:
             logger.error(f"加载照片失败: {e}")
 
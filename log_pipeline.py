@@ -0,0 +1,210 @@
+"""异步日志管道：调用线程只把日志记录放入有界队列，由后台线程完成脱敏、JSON格式化和写文件
+
+- 日志文件固定使用UTF-8编码，按大小和时间间隔轮转
+- 每条日志是一行JSON，extra中的字段作为独立字段输出
+- API密钥、Bearer令牌和URL中的签名参数在写入前脱敏
+- 标记为 extra={"sampled": True} 的每轮请求/响应内容按比例采样
+- 队列满时丢弃日志而不是阻塞调用线程，丢弃条数记录在下一条日志的dropped字段中
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_LOG_FILE = "agent_client.log"
+
+# 脱敏规则：(正则, 替换文本)
+REDACTION_PATTERNS = [
+    (re.compile(r"\bapp-[A-Za-z0-9]{4}([A-Za-z0-9]{8,})"), "app-****"),
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9\-._~+/]+=*", re.IGNORECASE), r"\1****"),
+    (re.compile(r"((?:api_key|apikey|token|sign|signature|secret)['\"]?\s*[:=]\s*['\"]?)[^'\"&\s,}]+", re.IGNORECASE),
+     r"\1****"),
+]
+
+# LogRecord自带的属性，不作为extra字段输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def redact(text):
+    """对文本中的密钥和令牌脱敏"""
+    for pattern, replacement in REDACTION_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def mask_secret(secret):
+    """密钥的可记录形式：只保留前缀和末4位"""
+    if not secret:
+        return str(secret)
+    return f"{secret[:4]}****{secret[-4:]}" if len(secret) > 12 else "****"
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为一行脱敏后的JSON"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = redact(value) if isinstance(value, str) else value
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=lambda value: redact(str(value)))
+
+
+class SamplingFilter(logging.Filter):
+    """对标记为sampled的日志按比例采样，其他日志全部保留
+
+    采样在调用线程中进行，未被采样的大段内容不会被格式化或放入队列。
+    """
+    def __init__(self, rate=0.1):
+        super().__init__()
+        self.interval = max(1, round(1 / rate)) if rate > 0 else 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        if not self.interval:
+            return False
+        with self._lock:
+            self._count += 1
+            return self._count % self.interval == 1 or self.interval == 1
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃日志的QueueHandler，调用线程从不等待磁盘IO"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._pending_dropped = 0
+
+    def prepare(self, record):
+        """合并消息参数并预先格式化异常，其余格式化工作留给后台线程"""
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        if self._pending_dropped:
+            record.dropped = self._pending_dropped
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self._pending_dropped = 0
+        except queue.Full:
+            self.dropped += 1
+            self._pending_dropped += 1
+
+
+class LogWriter(QueueListener):
+    """后台写日志线程，停止时等待队列腾出空间放入结束标记，保证已入队的日志全部写出"""
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class SizeTimeRotatingFileHandler(RotatingFileHandler):
+    """文件超过大小上限或距上次轮转超过指定间隔时轮转"""
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, interval=24 * 3600):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.interval = interval
+        self.rollover_at = self._compute_rollover_at()
+
+    def _compute_rollover_at(self):
+        """根据已有文件的最后写入时间计算下次按时间轮转的时刻"""
+        try:
+            started = os.path.getmtime(self.baseFilename) if os.path.getsize(self.baseFilename) else time.time()
+        except OSError:
+            started = time.time()
+        return started + self.interval if self.interval else float("inf")
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval if self.interval else float("inf")
+
+
+def _rollover_legacy_log(handler):
+    """旧版本以系统默认编码写入的日志无法按UTF-8读取，启动时先轮转出去"""
+    try:
+        with open(handler.baseFilename, "rb") as f:
+            head = f.read(64 * 1024)
+        head.decode("utf-8")
+    except OSError:
+        return
+    except UnicodeDecodeError as e:
+        # 读取边界可能截断多字节字符
+        if e.start < len(head) - 4:
+            handler.doRollover()
+
+
+def setup_logging(log_file=DEFAULT_LOG_FILE, level=logging.INFO, max_bytes=10 * 1024 * 1024, backup_count=5,
+                  rotate_interval=24 * 3600, payload_sample_rate=0.1, queue_size=10000):
+    """配置根日志器使用异步日志管道，重复调用时直接返回已有的后台写线程
+    Args:
+        log_file: 日志文件路径
+        level: 日志级别（名称或数值）
+        max_bytes: 单个日志文件的大小上限
+        backup_count: 保留的轮转文件数
+        rotate_interval: 按时间轮转的间隔(秒)，0表示只按大小轮转
+        payload_sample_rate: 每轮请求/响应内容的采样比例，0表示不记录
+        queue_size: 日志队列容量，队列满时丢弃新日志
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        file_handler = SizeTimeRotatingFileHandler(log_file, max_bytes, backup_count, rotate_interval)
+        file_handler.setFormatter(JsonFormatter())
+        _rollover_legacy_log(file_handler)
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(payload_sample_rate))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+
+        _listener = LogWriter(log_queue, file_handler, respect_handler_level=True)
+        _listener.queue_handler = queue_handler
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_listener.queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
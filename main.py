@@ -1,39 +1,43 @@
 import tkinter as tk
 from tkinter import messagebox, simpledialog
-import pygame
 import os
-import json
 import sys
-from PIL import Image, ImageTk
-from gui import AgentGUI
+import logging
+import importlib.util
+import multiprocessing
+from app_config import load_config
+from log_pipeline import setup_logging
+from turn_metrics import start_exporters
+import tracing
+from sampling_profiler import SamplingProfiler, install_triggers
+from image_registry import get_image_registry
+from session_archive import SessionRecorder
+from gui import AgentGUI, install_startup_probe
 from api_client import AgentAPIClient  # 假设 AgentAPIClient 定义在 api_client.py 中
 
-def load_config():
-    """加载 config.json 文件"""
-    try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("错误：缺少 config.json 文件！请复制 config.example.json 并填写密钥")
-        exit(1)
+logger = logging.getLogger(__name__)
 
-# 全局配置
-config = load_config()
-API_KEY = config["api_keys"]["default"] 
 
 def main():
     """主程序入口函数，负责初始化程序环境、创建API客户端和GUI界面"""
-    # 检查pygame和PIL库是否安装
-    try:
-        import pygame
-        from PIL import Image, ImageTk
-    except ImportError:
-        messagebox.showerror("依赖缺失", "请先安装pygame和Pillow库: pip install pygame pillow")
+    # 读取全局配置，日志管道可通过配置中的logging项调整（在程序入口配置，导入模块时不产生副作用）
+    config = load_config()
+    setup_logging(**((config or {}).get("logging") or {}))
+    if config is None:
         sys.exit(1)
 
-    # 初始化pygame及其音频模块
-    pygame.init()
-    pygame.mixer.init()
+    # 启动每轮耗时统计的导出（Prometheus端点/JSON文件），在配置的metrics项中开启
+    start_exporters(**(config.get("metrics") or {}))
+
+    # 耗时追踪（Chrome trace），未启用时没有额外开销
+    trace_path = os.environ.get("AGENT_TRACE") or (config.get("tracing") or {}).get("path")
+    if trace_path:
+        tracing.enable(trace_path)
+
+    # 检查pygame和PIL库是否安装（只查找模块，不导入，音频和图片子系统在首次使用时加载）
+    if importlib.util.find_spec("pygame") is None or importlib.util.find_spec("PIL") is None:
+        messagebox.showerror("依赖缺失", "请先安装pygame和Pillow库: pip install pygame pillow")
+        sys.exit(1)
 
     # 配置API基础URL
     base_url = "https://api.dify.ai/v1"  # Dify API基础地址
@@ -44,8 +48,7 @@ def main():
     if not API_KEY:
         api_key = simpledialog.askstring("API密钥", "请输入Dify API密钥:")
         if not api_key:
-            print("未提供API密钥，程序退出")
-            pygame.quit()
+            logger.error("未提供API密钥，程序退出")
             sys.exit(1)
     else:
         api_key = API_KEY
@@ -56,8 +59,21 @@ def main():
         os.makedirs(download_dir, exist_ok=True)
 
     # 创建API客户端实例，用于与Dify API交互
-    api_client = AgentAPIClient(base_url, api_key)
+    # 配置worker_process.enabled或环境变量AGENT_WORKER_PROCESS=1时，网络请求和图片、音频解码在子进程中进行
+    use_worker = os.environ.get("AGENT_WORKER_PROCESS") == "1" or (config.get("worker_process") or {}).get("enabled")
+    if use_worker:
+        from worker_process import ProcessAPIClient
+        api_client = ProcessAPIClient(base_url, api_key)
+    else:
+        api_client = AgentAPIClient(base_url, api_key)
 
+    # 录制每轮的SSE字节流和媒体（环境变量AGENT_RECORD或配置中的recording项），用benchmarks/replay_session.py回放
+    recording_config = config.get("recording") or {}
+    record_dir = os.environ.get("AGENT_RECORD") or recording_config.get("dir")
+    if record_dir and use_worker:
+        logger.warning("解码子进程模式下不支持录制，已忽略录制配置")
+    elif record_dir:
+        api_client.recorder = SessionRecorder(record_dir, recording_config.get("include_media", True))
 
     # 创建主窗口和GUI界面
     root = tk.Tk()
@@ -74,11 +90,33 @@ def main():
     # 创建GUI应用实例
     app = AgentGUI(root, api_client, initial_width, initial_height)
     
+    # 按需采样分析：快捷键Ctrl+Alt+P、SIGUSR1信号或配置的本机控制端点触发
+    profiler_config = dict(config.get("profiler") or {})
+    trigger_options = {key: profiler_config.pop(key) for key in ("hotkey", "control_port", "control_host") if key in profiler_config}
+    install_triggers(root, SamplingProfiler(**profiler_config), **trigger_options)
+
+    # 图片内存预算和泄漏报告（配置中的memory项）
+    memory_config = config.get("memory") or {}
+    image_registry = get_image_registry()
+    image_registry.max_bytes = int(memory_config.get("image_budget_mb", 64) * 1024 * 1024)
+    if memory_config.get("tracemalloc"):
+        image_registry.start_leak_tracking()
+    if memory_config.get("leak_report_interval"):
+        image_registry.schedule_leak_reports(memory_config["leak_report_interval"])
+
+    # 启动耗时探针（冷启动基准测试使用）
+    if os.environ.get("AGENT_STARTUP_PROBE"):
+        install_startup_probe(root, app)
+
     # 进入主事件循环
     root.mainloop()
 
-    # 程序退出时清理pygame资源
-    pygame.quit()
+    # 程序退出时停止音频引擎
+    api_client.audio_engine.shutdown()
+    if use_worker:
+        api_client.close()
 
 if __name__ == "__main__":
+    # 打包后的程序启动解码子进程时需要
+    multiprocessing.freeze_support()
     main()
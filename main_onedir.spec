@@ -0,0 +1,48 @@
+# -*- mode: python ; coding: utf-8 -*-
+# 启动优化的打包配置：onedir模式（启动时不再解压整个运行时到临时目录），
+# 场景图片打包为内存映射的资源包 assets.bundle（先运行 python asset_bundle.py 生成）。
+# 构建: pyinstaller main_onedir.spec
+
+
+a = Analysis(
+    ['main.py'],
+    pathex=[],
+    binaries=[],
+    datas=[('assets.bundle', '.')],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['numpy', 'tkinter.test', 'unittest', 'pydoc'],
+    noarchive=False,
+    optimize=1,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='AgentFromPku',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,  # UPX压缩的DLL每次启动都要解压，启动优化配置中关闭
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='AgentFromPku',
+)
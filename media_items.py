@@ -0,0 +1,57 @@
+import re
+
+# 回复中的媒体标记及对应的媒体类型
+MEDIA_MARKERS = {
+    "[音频]": "audio",
+    "[图片]": "image",
+}
+
+MEDIA_URL_PATTERN = re.compile(r"\((https?://[^\)]+)\)")
+MEDIA_MARKER_PATTERN = re.compile("|".join(re.escape(marker) for marker in MEDIA_MARKERS))
+
+# 无法从标记判断类型时按扩展名推断
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+
+class MediaItem:
+    """回复中的单个媒体项（音频或图片）及其下载结果"""
+    __slots__ = ("index", "kind", "url", "file_path", "error", "elapsed")
+
+    def __init__(self, index, kind, url):
+        self.index = index  # 在回复中的顺序
+        self.kind = kind  # "audio" 或 "image"
+        self.url = url
+        self.file_path = None  # 下载完成后的本地路径
+        self.error = None  # 下载失败时的错误信息
+        self.elapsed = 0.0  # 下载耗时(秒)
+
+    @property
+    def ok(self):
+        """是否已成功下载"""
+        return self.file_path is not None
+
+    def __repr__(self):
+        return f"MediaItem({self.index}, {self.kind!r}, {self.url!r})"
+
+
+def extract_media_items(text):
+    """从完整回复中提取全部媒体项，每个URL的类型取其前面最近的媒体标记"""
+    markers = [(m.start(), MEDIA_MARKERS[m.group(0)]) for m in MEDIA_MARKER_PATTERN.finditer(text)]
+    items = []
+    seen = set()
+    for match in MEDIA_URL_PATTERN.finditer(text):
+        url = match.group(1).strip()
+        if url in seen:
+            continue
+        seen.add(url)
+
+        kind = None
+        for pos, marker_kind in markers:
+            if pos > match.start():
+                break
+            kind = marker_kind
+        if kind is None:
+            path = url.split("?", 1)[0].lower()
+            kind = "image" if path.endswith(IMAGE_EXTENSIONS) else "audio"
+        items.append(MediaItem(len(items), kind, url))
+    return items
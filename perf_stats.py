@@ -0,0 +1,105 @@
+"""性能面板使用的运行状态汇总，只读取各组件已有的统计，不在流式处理路径上增加工作"""
+import os
+import sys
+import time
+from image_registry import get_image_registry
+
+
+def process_rss():
+    """当前进程的常驻内存(字节)，无法获取时返回None"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # 不支持/proc的系统只能取到峰值（macOS单位为字节，其他为KB）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def _format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+
+def collect_perf_stats(stream_handler, api_client, watchdog=None, sessions=None):
+    """汇总性能面板显示的各项指标，返回[(名称, 显示值), ...]
+
+    sessions为各会话（标签页）的统计，提供时每个会话一行
+    """
+    rows = []
+
+    turn = stream_handler.current_turn
+    ttft = turn.elapsed("enqueue", "first_message") if turn else None
+    rows.append(("TTFT", _format_seconds(ttft)))
+
+    tokens_per_second = None
+    if turn and "first_message" in turn.marks:
+        stream_time = turn.elapsed("first_message", "message_end") or turn.elapsed("first_message")
+        if stream_time:
+            tokens_per_second = turn.tokens / stream_time
+    rows.append(("tokens/s", f"{tokens_per_second:.1f}" if tokens_per_second is not None else "-"))
+
+    rows.append(("请求队列", str(len(stream_handler.request_queue))))
+
+    download_manager = getattr(api_client, "download_manager", None)
+    if download_manager is not None:
+        metrics = download_manager.get_metrics()
+        rows.append(("下载", f"{metrics['active']} 进行中 / {metrics['queue_depth']} 排队"))
+
+    worker = getattr(api_client, "worker", None)
+    if worker is not None:
+        state = "运行中" if worker.alive else "已退出"
+        rows.append(("解码进程", f"{state}, {worker.stats['messages']} 消息, 共享内存 {worker.stats['shared_bytes'] / 1048576:.1f} MB"))
+
+    audio_engine = getattr(api_client, "audio_engine", None)
+    if audio_engine is not None:
+        audio = audio_engine.get_summary()
+        rows.append(("音频", f"{audio['playing']} 播放 / {audio['paused']} 暂停, 缓存 {audio['cache_bytes'] / 1048576:.1f} MB"))
+
+    if watchdog is not None:
+        stats = watchdog.get_stats()
+        rows.append(("Tk延迟", f"{_format_seconds(stats['last_lag'])} (最大 {_format_seconds(stats['max_lag'])}, 卡顿 {stats['stalls']['count']})"))
+
+    for session in sessions or []:
+        state = "回复中" if session["streaming"] else "空闲"
+        rows.append((
+            f"会话 {session['name']}{'*' if session['active'] else ''}",
+            f"{state}, {session['turns']} 轮/{session['errors']} 错误, 媒体 {session['media']} ({session['media_bytes'] / 1048576:.1f} MB), "
+            f"界面 {_format_seconds(session['ui_time'])}/{session['callbacks']} 次, 积压 {session['backlog']} (最大 {session['max_backlog']}, 等待 {_format_seconds(session['max_lag'])})",
+        ))
+
+    images = get_image_registry().get_stats()
+    rows.append(("图片", f"{images['loaded']}/{images['images']} 已加载, {(images['image_bytes'] + images['cache_bytes']) / 1048576:.1f}/{images['budget'] / 1048576:.0f} MB"))
+
+    rss = process_rss()
+    rows.append(("RSS", f"{rss / 1048576:.0f} MB" if rss else "-"))
+    rows.append(("更新", time.strftime("%H:%M:%S")))
+    return rows
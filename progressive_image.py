@@ -0,0 +1,168 @@
+import io
+import time
+import logging
+from PIL import Image, ImageFile
+
+logger = logging.getLogger(__name__)
+
+# JPEG 标记：SOF2 表示渐进式编码，SOS 表示一次扫描的开始，EOI 表示图像结束
+JPEG_SOF2 = b"\xff\xc2"
+JPEG_SOS = b"\xff\xda"
+JPEG_EOI = b"\xff\xd9"
+
+
+class ProgressiveImageDecoder:
+    """渐进式图片解码器，边下载边解码，在下载过程中生成低分辨率预览"""
+    def __init__(self, preview_size=(150, 100), on_preview=None, min_interval=0.15, min_bytes=32 * 1024):
+        """初始化解码器
+        Args:
+            preview_size: 预览图尺寸，与聊天框中的缩略图一致
+            on_preview: 预览回调，参数为缩放后的PIL图片
+            min_interval: 两次预览之间的最小时间间隔(秒)
+            min_bytes: 非渐进式图片两次预览之间至少新增的字节数
+        """
+        self.preview_size = preview_size
+        self.on_preview = on_preview
+        self.min_interval = min_interval
+        self.min_bytes = min_bytes
+        self.parser = ImageFile.Parser()
+        self.parser_failed = False  # 增量解析器出错后退回到截断解码
+        self.buffer = bytearray()
+        self.is_progressive_jpeg = False
+        self.scan_count = 0  # 已收到的JPEG扫描段数量
+        self.previewed_scans = 0  # 已生成预览的扫描段数量
+        self.last_preview_time = 0
+        self.last_preview_bytes = 0
+        self.preview_count = 0
+        self._sos_search_pos = 0
+
+    def feed(self, chunk):
+        """写入一段新下载的数据，必要时触发预览回调"""
+        if not chunk:
+            return
+        self.buffer += chunk
+
+        if not self.parser_failed:
+            try:
+                self.parser.feed(chunk)
+            except Exception as e:
+                logger.debug(f"增量解析失败，改用截断解码预览: {e}")
+                self.parser_failed = True
+
+        if self.buffer[:2] == b"\xff\xd8":
+            self._scan_jpeg_markers()
+
+        if self.on_preview:
+            self._maybe_emit_preview()
+
+    def _scan_jpeg_markers(self):
+        """增量扫描JPEG标记，统计已到达的扫描段"""
+        if not self.is_progressive_jpeg and JPEG_SOF2 in self.buffer:
+            self.is_progressive_jpeg = True
+
+        # 从上次位置继续查找，回退一个字节避免标记跨块
+        pos = max(self._sos_search_pos - 1, 0)
+        while True:
+            pos = self.buffer.find(JPEG_SOS, pos)
+            if pos < 0:
+                break
+            self.scan_count += 1
+            pos += 2
+        self._sos_search_pos = len(self.buffer)
+
+    def _maybe_emit_preview(self):
+        """根据节流条件决定是否生成新的预览"""
+        now = time.monotonic()
+        if now - self.last_preview_time < self.min_interval:
+            return
+
+        preview = None
+        if self.is_progressive_jpeg:
+            # 第N+1个扫描段开始时，第N个扫描段已完整到达
+            complete_scans = self.scan_count - 1
+            if complete_scans > self.previewed_scans:
+                preview = self._decode_truncated()
+                if preview is not None:
+                    self.previewed_scans = complete_scans
+        elif self._has_incremental_image():
+            if len(self.buffer) - self.last_preview_bytes >= self.min_bytes:
+                preview = self._snapshot_parser_image()
+        elif len(self.buffer) - self.last_preview_bytes >= max(self.min_bytes, self.last_preview_bytes // 4):
+            # 每次截断解码都要重新解码全部数据，按几何级数增长的间隔触发，总开销保持线性
+            preview = self._decode_truncated()
+
+        if preview is None:
+            return
+
+        self.last_preview_time = now
+        self.last_preview_bytes = len(self.buffer)
+        self.preview_count += 1
+        try:
+            self.on_preview(preview)
+        except Exception as e:
+            logger.error(f"图片预览回调失败: {e}")
+
+    def _has_incremental_image(self):
+        """增量解析器是否正在逐块解码到内存图像中"""
+        return (
+            not self.parser_failed
+            and self.parser.decoder is not None
+            and self.parser.image is not None
+            and self.parser.image.im is not None
+        )
+
+    def _snapshot_parser_image(self):
+        """复制增量解析器中已解码的部分图像并缩放"""
+        try:
+            # 直接复制底层图像数据，避免copy()触发load()读取已关闭的文件
+            image = self.parser.image
+            return self._make_thumbnail(image._new(image.im.copy()))
+        except Exception as e:
+            logger.debug(f"复制部分解码图像失败: {e}")
+            return None
+
+    def _decode_truncated(self):
+        """解码当前已下载的部分数据，JPEG使用draft按比例降采样解码
+
+        不使用Pillow的全局开关LOAD_TRUNCATED_IMAGES（它同时作用于其他线程中的解码，
+        截断或损坏的文件会被静默接受）：JPEG在末尾补上EOI标记，与Pillow截断模式的做法相同；
+        其他格式捕获截断错误，使用已经解码的部分
+        """
+        try:
+            data = bytes(self.buffer)
+            if data[:2] == b"\xff\xd8" and not data.endswith(JPEG_EOI):
+                data += JPEG_EOI
+            img = Image.open(io.BytesIO(data))
+            if img.format == "JPEG":
+                img.draft("RGB", self.preview_size)
+            try:
+                img.load()
+            except OSError as e:
+                logger.debug(f"截断解码使用已解码的部分: {e}")
+                # 直接使用底层图像数据，避免再次load()
+                img = img._new(img.im)
+            return self._make_thumbnail(img)
+        except Exception as e:
+            logger.debug(f"截断解码预览失败: {e}")
+            return None
+
+    def _make_thumbnail(self, img):
+        """将图像缩放为预览尺寸（在下载线程中完成，避免占用Tk主线程）"""
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        return img.resize(self.preview_size, Image.BILINEAR)
+
+    def close(self, decode=False):
+        """结束解码，释放已下载的数据
+        Args:
+            decode: 为True时完成增量解析并返回完整图片（失败时返回None）；
+                只需要下载过程中的预览时不必再解码一遍完整图片
+        """
+        self.buffer = bytearray()
+        if not decode or self.parser_failed:
+            return None
+        try:
+            return self.parser.close()
+        except Exception as e:
+            logger.debug(f"结束增量解析失败: {e}")
+            return None
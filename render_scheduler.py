@@ -0,0 +1,122 @@
+"""界面渲染调度：多个会话的流式回调共享界面线程时，按时间预算公平分配
+
+每个会话（标签页）对应一条通道，工作线程通过通道的dispatch提交回调（与root.after(0, ...)用法相同）。
+界面线程每次最多执行budget秒的回调：当前标签页先执行，然后各通道轮流各执行一个，
+预算用完时把剩余回调留到interval秒之后，让Tk有机会处理输入和重绘，
+一个高速输出的会话不会让其他会话和界面操作长时间等待。
+"""
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RenderLane:
+    """一个会话的回调队列和界面时间统计"""
+    __slots__ = ("scheduler", "name", "pending", "callbacks", "ui_time", "max_backlog", "max_lag")
+
+    def __init__(self, scheduler, name):
+        self.scheduler = scheduler
+        self.name = name
+        self.pending = deque()  # (提交时间, 回调, 参数)
+        self.callbacks = 0  # 已执行的回调数
+        self.ui_time = 0.0  # 回调占用界面线程的总时间(秒)
+        self.max_backlog = 0  # 最大积压回调数
+        self.max_lag = 0.0  # 回调从提交到执行的最大等待时间(秒)
+
+    def dispatch(self, func, *args):
+        """提交回调（任意线程调用），作为对话引擎的dispatch"""
+        self.scheduler.submit(self, func, args)
+
+    def get_stats(self):
+        return {
+            "callbacks": self.callbacks,
+            "ui_time": self.ui_time,
+            "backlog": len(self.pending),
+            "max_backlog": self.max_backlog,
+            "max_lag": self.max_lag,
+        }
+
+
+class RenderScheduler:
+    """按时间预算轮流执行各通道的回调"""
+    def __init__(self, root, budget=0.008, interval=0.005):
+        """初始化渲染调度器
+        Args:
+            root: Tk根窗口
+            budget: 每次执行回调的时间预算(秒)
+            interval: 预算用完后再次执行的间隔(秒)
+        """
+        self.root = root
+        self.budget = budget
+        self.interval_ms = max(1, int(interval * 1000))
+        self.lanes = []
+        self.active_lane = None  # 当前标签页的通道，每次优先执行
+        self._start = 0  # 轮流执行的起始通道
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def add_lane(self, name):
+        lane = RenderLane(self, name)
+        with self._lock:
+            self.lanes.append(lane)
+        return lane
+
+    def remove_lane(self, lane):
+        """移除通道，未执行的回调被丢弃"""
+        with self._lock:
+            if lane in self.lanes:
+                self.lanes.remove(lane)
+            lane.pending.clear()
+        if self.active_lane is lane:
+            self.active_lane = None
+
+    def submit(self, lane, func, args):
+        with self._lock:
+            if lane not in self.lanes:
+                return
+            lane.pending.append((time.monotonic(), func, args))
+            lane.max_backlog = max(lane.max_backlog, len(lane.pending))
+            schedule = not self._scheduled
+            self._scheduled = True
+        if schedule:
+            self.root.after(0, self._pump)
+
+    def _order(self):
+        """本次执行的通道顺序：当前标签页在前，其余从上次的下一个开始轮流（需持有锁）"""
+        others = [lane for lane in self.lanes if lane is not self.active_lane]
+        if others:
+            self._start = (self._start + 1) % len(others)
+            others = others[self._start:] + others[:self._start]
+        return [self.active_lane] + others if self.active_lane in self.lanes else others
+
+    def _pump(self):
+        """在界面线程中执行回调，直到队列为空或预算用完"""
+        deadline = time.perf_counter() + self.budget
+        with self._lock:
+            order = self._order()
+        ran = True
+        while ran and time.perf_counter() < deadline:
+            ran = False
+            for lane in order:
+                with self._lock:
+                    if not lane.pending:
+                        continue
+                    submitted, func, args = lane.pending.popleft()
+                start = time.perf_counter()
+                lane.max_lag = max(lane.max_lag, time.monotonic() - submitted)
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"会话{lane.name}的界面回调失败: {e}")
+                lane.ui_time += time.perf_counter() - start
+                lane.callbacks += 1
+                ran = True
+
+        with self._lock:
+            if any(lane.pending for lane in self.lanes):
+                self.root.after(self.interval_ms, self._pump)
+            else:
+                self._scheduled = False
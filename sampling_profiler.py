@@ -0,0 +1,199 @@
+"""按需启动的采样分析器，用于在现场机器上定位卡顿
+
+采样线程按固定频率读取所有线程（界面线程、流式请求线程、下载和音频线程等）的调用栈，
+持续指定时间后写出：
+    *.folded  折叠调用栈（每行 "线程;外层函数;...;内层函数 次数"），可用flamegraph.pl或speedscope生成火焰图
+    *.txt     按自身采样数和累计采样数排序的函数列表
+
+触发方式：根窗口快捷键、SIGUSR1信号（非Windows平台）或本机控制端点
+（POST/GET http://127.0.0.1:端口/profile?seconds=10）。
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """全线程采样分析器，同一时间只运行一次采样"""
+    def __init__(self, rate=100, seconds=10, output_dir="profiles", max_depth=64, top=30):
+        """初始化分析器
+        Args:
+            rate: 采样频率(次/秒)
+            seconds: 默认采样时长(秒)
+            output_dir: 结果输出目录
+            max_depth: 每个调用栈最多记录的帧数
+            top: 汇总中列出的函数数
+        """
+        self.rate = rate
+        self.seconds = seconds
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.top = top
+        self._thread = None
+        self._stop = threading.Event()
+        self._labels = {}  # 代码对象 -> 函数标签
+        self.last_result = None  # 最近一次采样的输出文件
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        """开始采样，已在采样时忽略；返回是否开始"""
+        if self.is_running:
+            logger.info("采样分析已在进行中")
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(seconds or self.seconds,),
+                                        name="SamplingProfiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """提前结束采样（结果照常写出）"""
+        self._stop.set()
+
+    def toggle(self, seconds=None):
+        """未在采样时开始，正在采样时提前结束"""
+        if self.is_running:
+            self.stop()
+        else:
+            self.start(seconds)
+
+    def _label(self, code):
+        """函数标签：函数名(文件名:首行号)"""
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self, seconds):
+        """采样线程主循环"""
+        logger.info(f"开始采样分析: {seconds}s, {self.rate}Hz")
+        own_id = threading.get_ident()
+        stacks = Counter()
+        sample_count = 0
+        interval = 1.0 / self.rate
+        started = time.perf_counter()
+        deadline = started + seconds
+        sampling_time = 0.0
+
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            tick = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(labels))] += 1
+            sample_count += 1
+            elapsed = time.perf_counter() - tick
+            sampling_time += elapsed
+            self._stop.wait(max(0.0, interval - elapsed))
+
+        duration = time.perf_counter() - started
+        overhead = sampling_time / duration if duration else 0.0
+        try:
+            self.last_result = self._write(stacks, sample_count, duration, overhead)
+            logger.info(f"采样分析完成: {sample_count}次采样, 开销{overhead:.1%}, 结果: {self.last_result}")
+        except Exception as e:
+            logger.error(f"写入采样分析结果失败: {e}")
+
+    def _write(self, stacks, sample_count, duration, overhead):
+        """写出折叠调用栈和函数汇总，返回两个文件路径"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        folded_path = base + ".folded"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in stacks.items():
+            # 第一项为线程名
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                inclusive[label] += count
+        total = sum(stacks.values()) or 1
+
+        summary_path = base + ".txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"采样时长 {duration:.1f}s, 采样 {sample_count} 次, 频率 {self.rate}Hz, 采样开销 {overhead:.2%}\n\n")
+            f.write(f"按自身采样数排序(前{self.top}):\n")
+            for label, count in own.most_common(self.top):
+                f.write(f"{count:8d} {count / total:7.2%}  {label}\n")
+            f.write(f"\n按累计采样数排序(前{self.top}):\n")
+            for label, count in inclusive.most_common(self.top):
+                f.write(f"{count:8d} {count / total:7.2%}  {label}\n")
+        return folded_path, summary_path
+
+
+def install_triggers(root, profiler, hotkey="<Control-Alt-p>", control_port=None, control_host="127.0.0.1"):
+    """安装分析器的触发方式
+    Args:
+        root: Tk根窗口，绑定快捷键（为None时不绑定）
+        profiler: SamplingProfiler实例
+        hotkey: 切换采样的快捷键
+        control_port: 本机控制端点端口，为None时不启动
+        control_host: 控制端点监听地址
+    """
+    if root is not None and hotkey:
+        root.bind_all(hotkey, lambda event: profiler.toggle())
+
+    # 信号处理函数在主线程执行，界面线程的心跳回调保证信号能被及时处理
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle())
+        except ValueError:
+            logger.warning("只能在主线程中注册采样分析信号")
+
+    if control_port:
+        class ControlHandler(BaseHTTPRequestHandler):
+            def _handle(self):
+                parts = urlsplit(self.path)
+                if parts.path != "/profile":
+                    self.send_error(404)
+                    return
+                seconds = parse_qs(parts.query).get("seconds", [None])[0]
+                try:
+                    seconds = float(seconds) if seconds else None
+                except ValueError:
+                    self.send_error(400, "invalid seconds")
+                    return
+                started = profiler.start(seconds)
+                body = ("started\n" if started else "already running\n").encode("utf-8")
+                self.send_response(202 if started else 409)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                logger.debug("分析控制请求: " + format, *args)
+
+        try:
+            server = ThreadingHTTPServer((control_host, control_port), ControlHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="ProfilerControl", daemon=True).start()
+            logger.info(f"采样分析控制端点: http://{control_host}:{control_port}/profile")
+        except OSError as e:
+            logger.error(f"启动采样分析控制端点失败: {e}")
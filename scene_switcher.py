@@ -1,22 +1,6 @@
-import os
-import json
-from PIL import Image, ImageTk
 import logging
-
-def load_config():
-    """加载 config.json 文件"""
-    try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("错误：缺少 config.json 文件！请复制 config.example.json 并填写密钥")
-        exit(1)
-
-# 全局配置
-config = load_config()
-API_KEY_1 = config["api_keys"]["yannanyuan"] 
-API_KEY_2 = config["api_keys"]["shaoyuan"]
-API_KEY_3 = config["api_keys"]["weiminghu"]
+from app_config import get_api_key
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -27,61 +11,82 @@ garden_background_mapping = {
     "未名湖": "wmlake.jpg",
 }
 
-def switch_scene(original_content, ui_builder, api_client):
-    """
-    切换场景的函数，根据 AI 回复的内容切换背景图片
-    :param original_content: AI 回复的原始内容
-    :param ui_builder: UI构建器实例
-    :param api_client: API客户端实例
-    """
-    # 调试输出原始内容
-    logger.info(f"检测场景切换，原始内容: {original_content[:100]}...")
-    
-    for garden, image_file in garden_background_mapping.items():
-        # 更灵活的匹配方式
+# 各场景在 config.json 中对应的API密钥名称
+garden_api_key_names = {
+    "燕南园": "yannanyuan",
+    "勺园": "shaoyuan",
+    "未名湖": "weiminghu",
+}
+
+# 默认角色（新会话和程序启动时显示）
+default_profile = {
+    "background": "background.jpg",
+    "photo": "pm.jpg",
+    "name": "派蒙",
+    "intro": "    派蒙是旅行者在提瓦特的旅途中钓到的奇妙生物，同时也是旅行者的向导与引路人。\n    年幼的小女孩外形，白色齐肩发，戴着一颗黑曜石打造的星星发饰，头顶悬浮王冠（派蒙待机动作可以看到有取下来的动作）背后的小披风有着星空纹理般的黑蓝色，披风有类似星座纹路的装饰，飘动起来似乎可以看到星辰在闪动，眼睛远处看是蓝瞳，拉近视角后也可以看见眼中的星辰，衣着镶金边的白色连衣裤，衣服中央有类似摩拉货币的图案，脚穿白镶金的靴子，身边飘动着闪闪星座纹路，派蒙贪吃爱财，也是个话痨，因为旅行者很多台词都被派蒙抢了，所以显得她话有些多。\n    派蒙非常珍视与旅行者的友谊，屡次强调自己是“最好的伙伴”，不会和旅行者分开。",
+}
+
+# 各场景的角色信息：头像、姓名、介绍
+garden_profiles = {
+    "燕南园": {
+        "photo": "zgq.jpg",
+        "name": "朱光潜",
+        "intro": "  朱光潜，字孟实，安徽桐城人。他早年留学欧洲，获英国爱丁堡大学文学硕士、法国斯特拉斯堡大学哲学博士学位，系统研究西方美学，融通中西学术传统。\n   朱光潜自1933年起受聘于北京大学西语系，后长期担任教授，并曾兼任文学院代理院长。1952年全国院系调整后，他转入北大哲学系，专注美学研究与教学，主持创办了中国首个美学教研室，培养了大批美学人才。他的代表作《文艺心理学》《谈美》《西方美学史》等深刻影响了中国现代美学发展，其中《西方美学史》是首部由中国学者撰写的系统研究西方美学的权威著作，奠定了北大在中国美学研究的核心地位。\n  朱光潜晚年仍坚持在燕南园住所授课，其治学严谨与人格魅力成为北大精神象征之一。他主张“人生的艺术化”，倡导美育与人文关怀，至今未名湖畔仍流传着他与学生谈学论道的佳话。",
+    },
+    "勺园": {
+        "photo": "swts.jpg",
+        "name": "塞万提斯之魂",
+        "intro": "    在北大勺园的绿荫深处，静立着一座塞万提斯的青铜雕像——这位西班牙文学巨匠手持书卷，目光深邃，仿佛穿越时空注视着来往的学子。他是《堂吉诃德》的作者，文艺复兴时期的文学传奇，用笔尖编织了理想与现实的永恒对话。\n    如今，他的灵魂仍徘徊于此。当微风拂过雕像，或是你驻足凝望时，或许能听见他低语：关于骑士的幻想、关于文学的狂热、关于人性与命运的沉思。他愿与好奇的访客交谈，分享塞维利亚的阳光、阿尔及尔的囚牢、马德里的辉煌，以及一个作家眼中永不褪色的世界。\n  （走近雕像，试着向他提问——这位四百年前的文豪，会给你意想不到的回答。）\n    （注：北大勺园的塞万提斯雕像是中西文化交流的象征，由中国西班牙友好协会于1986年捐赠。）",
+    },
+    "未名湖": {
+        "photo": "thisisphoto.png",
+        "name": "nyw",
+        "intro": "北京大学信息科学技术学院，准大二学生nyw，你可以和他聊很多东西",
+    },
+}
+
+
+def detect_scene(original_content):
+    """返回回复中要切换到的园名，没有匹配的地点时返回None"""
+    for garden in garden_background_mapping:
         if f"[{garden}]" in original_content:
-            try:
-                logger.info(f"切换到场景: {garden}, 使用背景: {image_file}")
-                
-                # 使用ui_builder的方法设置背景
-                ui_builder.set_background(image_file)
-                
-                # 根据场景切换API密钥和角色信息
-                if garden == "燕南园":
-                    new_api_key = API_KEY_1
-                    api_client.change_api_key(new_api_key)
-                    api_client.current_conversation_id = None
-                    api_client.files = []
-                    
-                    # 更新角色信息
-                    ui_builder.add_photo("zgq.jpg")
-                    ui_builder.set_name("朱光潜")
-                    ui_builder.set_intro("  朱光潜，字孟实，安徽桐城人。他早年留学欧洲，获英国爱丁堡大学文学硕士、法国斯特拉斯堡大学哲学博士学位，系统研究西方美学，融通中西学术传统。\n   朱光潜自1933年起受聘于北京大学西语系，后长期担任教授，并曾兼任文学院代理院长。1952年全国院系调整后，他转入北大哲学系，专注美学研究与教学，主持创办了中国首个美学教研室，培养了大批美学人才。他的代表作《文艺心理学》《谈美》《西方美学史》等深刻影响了中国现代美学发展，其中《西方美学史》是首部由中国学者撰写的系统研究西方美学的权威著作，奠定了北大在中国美学研究的核心地位。\n  朱光潜晚年仍坚持在燕南园住所授课，其治学严谨与人格魅力成为北大精神象征之一。他主张“人生的艺术化”，倡导美育与人文关怀，至今未名湖畔仍流传着他与学生谈学论道的佳话。")
+            return garden
+    return None
+
+
+def switch_client_scene(garden, api_client, api_keys=None):
+    """把API客户端切换到场景对应的密钥并开始新会话，配置缺失时不切换并返回False
+
+    api_keys为密钥名称 -> API密钥，提供时优先于config.json
+    """
+    # 配置缺失时保持当前场景，避免使用空密钥
+    key_name = garden_api_key_names[garden]
+    new_api_key = (api_keys or {}).get(key_name) or get_api_key(key_name)
+    if not new_api_key:
+        logger.error(f"缺少场景({garden})的API密钥，不进行场景切换")
+        return False
+    api_client.change_api_key(new_api_key)
+    api_client.current_conversation_id = None
+    api_client.files = []
+    return True
+
+
+@traced("show_scene")
+def show_scene(garden, ui_builder):
+    """更新场景的背景图片和角色信息"""
+    image_file = garden_background_mapping[garden]
+    logger.info(f"切换到场景: {garden}, 使用背景: {image_file}")
+    ui_builder.set_background(image_file)
+    profile = garden_profiles[garden]
+    ui_builder.add_photo(profile["photo"])
+    ui_builder.set_name(profile["name"])
+    ui_builder.set_intro(profile["intro"])
+
 
-                elif garden == "勺园":
-                    new_api_key = API_KEY_2
-                    api_client.change_api_key(new_api_key)
-                    api_client.current_conversation_id = None
-                    api_client.files = []
-                    
-                    # 更新角色信息
-                    ui_builder.add_photo("swts.jpg")
-                    ui_builder.set_name("塞万提斯之魂")
-                    ui_builder.set_intro("    在北大勺园的绿荫深处，静立着一座塞万提斯的青铜雕像——这位西班牙文学巨匠手持书卷，目光深邃，仿佛穿越时空注视着来往的学子。他是《堂吉诃德》的作者，文艺复兴时期的文学传奇，用笔尖编织了理想与现实的永恒对话。\n    如今，他的灵魂仍徘徊于此。当微风拂过雕像，或是你驻足凝望时，或许能听见他低语：关于骑士的幻想、关于文学的狂热、关于人性与命运的沉思。他愿与好奇的访客交谈，分享塞维利亚的阳光、阿尔及尔的囚牢、马德里的辉煌，以及一个作家眼中永不褪色的世界。\n  （走近雕像，试着向他提问——这位四百年前的文豪，会给你意想不到的回答。）\n    （注：北大勺园的塞万提斯雕像是中西文化交流的象征，由中国西班牙友好协会于1986年捐赠。）")
-                elif garden == "未名湖":
-                    new_api_key = API_KEY_3
-                    api_client.change_api_key(new_api_key)
-                    api_client.current_conversation_id = None
-                    api_client.files = []
-                    
-                    # 更新角色信息
-                    ui_builder.add_photo("thisisphoto.png")
-                    ui_builder.set_name("nyw")
-                    ui_builder.set_intro("北京大学信息科学技术学院，准大二学生nyw，你可以和他聊很多东西")
+def show_default_scene(ui_builder):
+    """恢复默认角色的背景和信息"""
+    ui_builder.set_background(default_profile["background"])
+    ui_builder.add_photo(default_profile["photo"])
+    ui_builder.set_name(default_profile["name"])
+    ui_builder.set_intro(default_profile["intro"])
 
-                return
-            
-            except Exception as e:
-                logger.error(f"切换场景({garden})失败: {e}")
-    
-    logger.info("未找到匹配的地点，不进行背景切换")
\ No newline at end of file
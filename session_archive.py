@@ -0,0 +1,373 @@
+"""SSE会话录制与回放
+
+录制：AgentAPIClient设置recorder后，每轮对话把服务器返回的原始SSE字节流（按到达的数据块记录
+相对请求发出的时间）和下载到的媒体文件写入一个会话归档（zip）：
+    session.json  请求（脱敏）、数据块时间和长度、媒体项
+    stream.bin    脱敏后的SSE字节流
+    media/<n>.*   媒体文件
+写入前对密钥做脱敏：log_pipeline的脱敏规则，以及回复中URL的签名参数（URL整体替换为占位地址，
+媒体URL在回放时指向本地媒体服务）。URL被拆分到多个message事件中时同样会被替换。
+
+回放：ReplayClient按录制的时间（或尽快）把字节流重新送入_process_stream_response，
+媒体从归档中通过本机HTTP服务下载，解析、下载、预解码和界面回调都走真实代码路径。
+"""
+import os
+import re
+import json
+import time
+import uuid
+import bisect
+import logging
+import zipfile
+import mimetypes
+import threading
+from itertools import accumulate
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from log_pipeline import REDACTION_PATTERNS, redact
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+PLACEHOLDER_HOST = "http://replay.invalid"
+URL_PATTERN = re.compile(r"https?://[^\s()<>\"'\]]+")
+
+
+def _substitute(fragments, pattern, replace):
+    """对拼接后的文本做正则替换，结果按原来的分段返回
+
+    替换文本归入匹配开始处所在的分段，匹配在后续分段中的部分被删除，
+    用于替换被拆分到多个SSE事件中的URL和密钥。
+    """
+    text = "".join(fragments)
+    if not pattern.search(text):
+        return list(fragments)
+    starts = list(accumulate([0] + [len(fragment) for fragment in fragments]))[:-1]
+    output = [[] for _ in fragments]
+
+    def owner(pos):
+        return max(0, bisect.bisect_right(starts, pos) - 1)
+
+    def copy(begin, end):
+        # 把text[begin:end]按原分段边界写回
+        while begin < end:
+            index = owner(begin)
+            limit = starts[index + 1] if index + 1 < len(starts) else len(text)
+            piece_end = min(end, limit)
+            output[index].append(text[begin:piece_end])
+            begin = piece_end
+
+    pos = 0
+    for match in pattern.finditer(text):
+        copy(pos, match.start())
+        output[owner(match.start())].append(replace(match))
+        pos = match.end()
+    copy(pos, len(text))
+    return ["".join(pieces) for pieces in output]
+
+
+def _rewrite_stream(data, boundaries, rewrite_fragments, rewrite_text):
+    """改写SSE字节流，返回新字节流和重新映射的数据块边界
+
+    message事件的answer拼接后统一交给rewrite_fragments（处理跨事件拆分的内容），
+    其余行交给rewrite_text；数据块边界按所在行映射，落在被修改的行内时截到新行的长度。
+    """
+    lines = data.split(b"\n")
+    events = []  # (行号, 事件)
+    new_lines = list(lines)
+    for index, line in enumerate(lines):
+        if not line.startswith(b"data: "):
+            continue
+        try:
+            event = json.loads(line[6:])
+        except ValueError:
+            event = None
+        if isinstance(event, dict) and event.get("event") == "message" and isinstance(event.get("answer"), str):
+            events.append((index, event))
+        else:
+            new_lines[index] = rewrite_text(line.decode("utf-8", "replace")).encode("utf-8")
+
+    answers = rewrite_fragments([event["answer"] for _, event in events])
+    for (index, event), answer in zip(events, answers):
+        if answer != event["answer"]:
+            event["answer"] = answer
+            new_lines[index] = b"data: " + json.dumps(event, ensure_ascii=lines[index].isascii()).encode("utf-8")
+
+    old_starts = list(accumulate([0] + [len(line) + 1 for line in lines]))
+    new_starts = list(accumulate([0] + [len(line) + 1 for line in new_lines]))
+    mapped = []
+    for boundary in boundaries:
+        index = min(len(lines) - 1, bisect.bisect_right(old_starts, boundary) - 1)
+        offset = min(boundary - old_starts[index], len(new_lines[index]) + 1)
+        mapped.append(min(new_starts[index] + offset, new_starts[-1] - 1))
+    return b"\n".join(new_lines), mapped
+
+
+class SessionScrubber:
+    """SSE字节流脱敏：URL替换为占位地址，其余内容按日志脱敏规则处理"""
+    def __init__(self, media_urls=()):
+        # 媒体URL -> 编号（与归档中media/<n>对应）
+        self.media = {url: index for index, url in enumerate(media_urls)}
+        self.links = {}
+
+    def _replace_url(self, match):
+        url = match.group(0)
+        if url in self.media:
+            return f"{PLACEHOLDER_HOST}/media/{self.media[url]}"
+        index = self.links.setdefault(url.split("?", 1)[0], len(self.links))
+        return f"{PLACEHOLDER_HOST}/link/{index}"
+
+    def scrub_fragments(self, fragments):
+        fragments = _substitute(fragments, URL_PATTERN, self._replace_url)
+        for pattern, replacement in REDACTION_PATTERNS:
+            fragments = _substitute(fragments, pattern, lambda match: match.expand(replacement))
+        return fragments
+
+    def scrub_text(self, text):
+        return redact(URL_PATTERN.sub(self._replace_url, text))
+
+    def scrub_stream(self, data, boundaries):
+        return _rewrite_stream(data, boundaries, self.scrub_fragments, self.scrub_text)
+
+
+class Recording:
+    """一轮对话的录制，由SessionRecorder.start创建"""
+    def __init__(self, recorder, request_body):
+        self.recorder = recorder
+        self.request_body = request_body
+        self.started = time.monotonic()
+        self.status = None
+        self.content_type = None
+        self.error = None  # 读取响应时的异常（如连接中途断开），回放时在数据块之后重新抛出；错误状态码时为错误信息
+        self.chunks = []  # (相对请求发出的时间, 数据)
+
+    def attach(self, response):
+        """包装响应的iter_content，iter_lines读到的每个数据块都被记录"""
+        self.status = response.status_code
+        self.content_type = response.headers.get("content-type")
+        iter_content = response.iter_content
+
+        def recording_iter_content(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                self.chunks.append((time.monotonic() - self.started, chunk))
+                yield chunk
+
+        response.iter_content = recording_iter_content
+        return response
+
+    def save(self, result=None):
+        """写出会话归档，失败时只记录日志；返回归档路径"""
+        if self.status is None:
+            return None
+        try:
+            return self.recorder.write(self, result)
+        except Exception as e:
+            logger.error(f"保存会话录制失败: {e}")
+            return None
+
+
+class SessionRecorder:
+    """把每轮对话录制为会话归档"""
+    def __init__(self, output_dir="sessions", include_media=True):
+        self.output_dir = output_dir
+        self.include_media = include_media
+
+    def start(self, request_body):
+        return Recording(self, request_body)
+
+    def write(self, recording, result):
+        data = b"".join(chunk for _, chunk in recording.chunks)
+        boundaries = list(accumulate(len(chunk) for _, chunk in recording.chunks))
+        media_items = [item for item in (result or {}).get("media_items") or [] if item.ok]
+        if not self.include_media:
+            media_items = []
+
+        scrubber = SessionScrubber([item.url for item in media_items])
+        data, boundaries = scrubber.scrub_stream(data, boundaries)
+        lengths = [end - start for start, end in zip([0] + boundaries[:-1], boundaries)]
+        request = json.loads(redact(json.dumps(recording.request_body, ensure_ascii=False)))
+        manifest = {
+            "version": ARCHIVE_VERSION,
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "status": recording.status,
+            "content_type": recording.content_type,
+            "complete": bool(result and result.get("conversation_id")),
+            "error": recording.error,
+            "request": request,
+            "chunks": [[round(at, 4), length] for (at, _), length in zip(recording.chunks, lengths)],
+            "media": [],
+        }
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir,
+                            f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("stream.bin", data)
+            for index, item in enumerate(media_items):
+                ext = os.path.splitext(item.file_path)[1]
+                name = f"media/{index}{ext}"
+                archive.write(item.file_path, name)
+                manifest["media"].append({"kind": item.kind, "file": name, "elapsed": round(item.elapsed, 4)})
+            archive.writestr("session.json", json.dumps(manifest, ensure_ascii=False, indent=1))
+        logger.info(f"已保存会话录制: {path}, {len(data)} 字节, {len(media_items)} 个媒体")
+        return path
+
+
+class Session:
+    """读入内存的会话归档"""
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            self.manifest = json.loads(archive.read("session.json"))
+            self.data = archive.read("stream.bin")
+            self.media = [(entry, archive.read(entry["file"])) for entry in self.manifest["media"]]
+        chunks = []
+        offset = 0
+        for at, length in self.manifest["chunks"]:
+            chunks.append((at, self.data[offset:offset + length]))
+            offset += length
+        self.chunks = chunks
+
+    @property
+    def query(self):
+        return self.manifest["request"].get("query", "")
+
+
+class ReplayResponse:
+    """按录制的时间输出数据块的响应对象，供_process_stream_response读取
+
+    speed为回放速度倍数，为0或None时不等待（尽快回放）。
+    """
+    iter_lines = requests.Response.iter_lines
+
+    def __init__(self, chunks, speed=1.0, status_code=200, content_type="text/event-stream", error=None):
+        self.chunks = chunks
+        self.speed = speed
+        self.error = error
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict({"content-type": content_type or ""})
+        self.encoding = None
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        started = time.monotonic()
+        for at, chunk in self.chunks:
+            if self.speed:
+                delay = at / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+        if self.error:
+            raise requests.exceptions.ChunkedEncodingError(self.error)
+
+    def close(self):
+        pass
+
+
+class _MediaServer:
+    """本机HTTP服务，按编号提供归档中的媒体文件"""
+    def __init__(self):
+        self.files = {}  # 编号 -> (内容, Content-Type, 文件名)
+        media_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                entry = None
+                if self.path.startswith("/media/"):
+                    entry = media_server.files.get(self.path[len("/media/"):])
+                if entry is None:
+                    self.send_error(404)
+                    return
+                content, content_type, filename = entry
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("Content-Disposition", f'inline; filename="{filename}"')
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logger.debug("回放媒体请求: " + format, *args)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="ReplayMedia", daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def load(self, session):
+        """登记会话的媒体，返回把占位地址换成本机地址后的数据块"""
+        prefix = uuid.uuid4().hex[:8]
+        for index, (entry, content) in enumerate(session.media):
+            content_type = mimetypes.guess_type(entry["file"])[0] or "application/octet-stream"
+            filename = f"replay_{prefix}_{os.path.basename(entry['file'])}"
+            self.files[f"{prefix}-{index}"] = (content, content_type, filename)
+
+        pattern = re.compile(re.escape(f"{PLACEHOLDER_HOST}/media/") + r"(\d+)")
+        replace = lambda match: f"{self.base_url}/media/{prefix}-{match.group(1)}"
+        boundaries = list(accumulate(len(chunk) for _, chunk in session.chunks))
+        data, boundaries = _rewrite_stream(
+            session.data, boundaries,
+            lambda fragments: _substitute(fragments, pattern, replace),
+            lambda text: pattern.sub(replace, text),
+        )
+        starts = [0] + boundaries[:-1]
+        return [(at, data[start:end]) for (at, _), start, end in zip(session.chunks, starts, boundaries)]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ReplayClient:
+    """把会话归档回放给AgentAPIClient的流式处理代码
+
+    call_agent与AgentAPIClient的接口相同，每次调用回放队列中的下一个会话（循环使用），
+    可直接替换界面使用的API客户端。
+    """
+    def __init__(self, api_client, sessions, speed=1.0):
+        self.api_client = api_client
+        self.sessions = [session if isinstance(session, Session) else Session(session) for session in sessions]
+        self.speed = speed
+        self.media_server = _MediaServer()
+        self._next = 0
+
+    def __getattr__(self, name):
+        # 其余接口（音频播放、工具列表等）交给真实客户端
+        return getattr(self.api_client, name)
+
+    def next_session(self):
+        session = self.sessions[self._next % len(self.sessions)]
+        self._next += 1
+        return session
+
+    def call_agent(self, input_text=None, tool_name=None, tool_params=None, user_id="default_user",
+                   files=None, on_data=None, on_end=None, turn=None):
+        return self.replay(self.next_session(), on_data, on_end, turn)
+
+    def replay(self, session, on_data=None, on_end=None, turn=None):
+        """回放一个会话，返回_process_stream_response的结果"""
+        chunks = self.media_server.load(session)
+        manifest = session.manifest
+        if turn:
+            turn.mark("request_sent")
+        if manifest.get("status", 200) >= 400:
+            # 录制时服务返回了错误状态，error为当时给出的错误信息
+            error_msg = manifest.get("error") or f"HTTP错误 {manifest['status']}"
+            if on_end:
+                on_end({"type": "text", "content": error_msg})
+            return {"type": "text", "content": error_msg}
+        response = ReplayResponse(chunks, self.speed, manifest.get("status", 200), manifest.get("content_type"),
+                                  manifest.get("error"))
+        try:
+            return self.api_client._process_stream_response(response, on_data, on_end, turn)
+        except requests.exceptions.RequestException as e:
+            # 录制时中途断开的会话在回放时同样以异常结束
+            logger.error("回放会话失败: %s", e)
+            if on_end:
+                on_end({"type": "text", "content": f"API请求失败: {str(e)}"})
+            return {"type": "text", "content": f"API请求失败: {str(e)}"}
+
+    def close(self):
+        self.media_server.close()
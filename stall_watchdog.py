@@ -0,0 +1,127 @@
+"""Tk事件循环卡顿监测
+
+界面线程按固定间隔用after()发出心跳，实际执行时间与预定时间之差即事件循环延迟。
+后台线程在心跳超过阈值未到达时持续采样界面线程的调用栈，卡顿结束后把出现最多的调用栈
+写入日志，并把卡顿时长计入直方图。
+"""
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+from turn_metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+STALL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+
+class StallWatchdog:
+    """界面线程卡顿监测器，需要在界面线程中创建"""
+    def __init__(self, root, interval=0.1, threshold=0.25, sample_interval=0.02, max_frames=12):
+        """初始化监测器
+        Args:
+            root: Tk根窗口
+            interval: 心跳间隔(秒)
+            threshold: 心跳延迟超过该值视为卡顿(秒)
+            sample_interval: 卡顿期间采样调用栈的间隔(秒)
+            max_frames: 日志中记录的栈帧数（从最内层开始）
+        """
+        self.root = root
+        self.interval = interval
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.max_frames = max_frames
+        self.thread_id = threading.get_ident()
+
+        self.last_beat = time.monotonic()  # 最近一次心跳的执行时间
+        self.last_lag = 0.0  # 最近一次心跳的延迟
+        self.max_lag = 0.0
+        self.lag_histogram = Histogram()
+        self.stall_histogram = Histogram(STALL_BUCKETS)
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """开始发送心跳并启动采样线程"""
+        if self._running:
+            return
+        self._running = True
+        self.last_beat = time.monotonic()
+        self.root.after(int(self.interval * 1000), self._beat, self.last_beat + self.interval)
+        threading.Thread(target=self._monitor, name="StallWatchdog", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _beat(self, expected):
+        """心跳回调（界面线程），记录事件循环延迟并安排下一次心跳"""
+        if not self._running:
+            return
+        now = time.monotonic()
+        lag = max(0.0, now - expected)
+        with self._lock:
+            self.last_beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.lag_histogram.observe(lag)
+        try:
+            self.root.after(int(self.interval * 1000), self._beat, now + self.interval)
+        except Exception:
+            # 窗口已销毁
+            self._running = False
+
+    def _monitor(self):
+        """采样线程：心跳超时期间采样界面线程的调用栈"""
+        samples = Counter()
+        stall_started = None
+        while self._running:
+            time.sleep(self.sample_interval)
+            with self._lock:
+                last_beat = self.last_beat
+            overdue = time.monotonic() - last_beat - self.interval
+
+            if overdue > self.threshold:
+                if stall_started is None:
+                    stall_started = last_beat + self.interval
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    samples[self._stack_key(frame)] += 1
+            elif stall_started is not None:
+                # 心跳恢复，卡顿结束
+                self._report_stall(last_beat - stall_started, samples)
+                samples = Counter()
+                stall_started = None
+
+    def _stack_key(self, frame):
+        """把调用栈转换为可计数的键（最内层在前）"""
+        stack = traceback.extract_stack(frame)[::-1][:self.max_frames]
+        return tuple(f"{summary.filename}:{summary.lineno} {summary.name}" for summary in stack)
+
+    def _report_stall(self, duration, samples):
+        """记录一次卡顿"""
+        with self._lock:
+            self.stall_histogram.observe(duration)
+            count = self.stall_histogram.count
+        total = sum(samples.values())
+        if samples:
+            stack, hits = samples.most_common(1)[0]
+            frames = "\n".join(f"    {line}" for line in stack)
+            logger.warning(
+                f"界面线程卡顿 {duration:.2f}s（第{count}次），{total}次采样中{hits}次位于:\n{frames}",
+                extra={"stall_seconds": round(duration, 3), "stall_samples": total},
+            )
+        else:
+            logger.warning(f"界面线程卡顿 {duration:.2f}s（第{count}次），未采样到调用栈",
+                           extra={"stall_seconds": round(duration, 3)})
+
+    def get_stats(self):
+        """返回事件循环延迟和卡顿统计"""
+        with self._lock:
+            return {
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+                "lag": self.lag_histogram.to_dict(),
+                "stalls": self.stall_histogram.to_dict(),
+            }
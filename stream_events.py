@@ -0,0 +1,295 @@
+"""SSE流事件：把Dify流式响应的data行解码为带类型的事件对象，以及API客户端on_data回调的数据类型
+
+_process_stream_response只关心少数几个字段，事件对象只保存这些字段（__slots__，创建后不再修改），
+不再在每一行上对完整的dict反复get。API客户端通过on_data发出的文本片段、媒体标记、下载预览、
+下载进度和媒体完成同样是__slots__对象（StreamData的子类），接收方按类型分派。
+
+JSON解码后端可插拔，按 msgspec > orjson > json 的顺序选择已安装的库，也可以用环境变量
+AGENT_JSON_BACKEND指定。msgspec按结构体直接解码，跳过不需要的字段，不创建中间的dict；
+orjson和json解码为dict后再取字段，json使用JSONDecoder.raw_decode，省去json.loads每次调用的检查。
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("msgspec", "orjson", "json")
+
+
+def _slots_repr(self):
+    fields = ", ".join(f"{name}={getattr(self, name)!r}" for cls in type(self).__mro__
+                       for name in getattr(cls, "__slots__", ()))
+    return f"{type(self).__name__}({fields})"
+
+
+class StreamEvent:
+    """SSE事件基类，event为Dify的事件名"""
+    __slots__ = ("task_id",)
+    event = None
+    __repr__ = _slots_repr
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+
+
+# 每个事件都会创建对象，子类直接设置字段，不调用super().__init__
+
+class MessageChunk(StreamEvent):
+    """回复片段（message事件）"""
+    __slots__ = ("answer",)
+    event = "message"
+
+    def __init__(self, task_id, answer):
+        self.task_id = task_id
+        self.answer = answer
+
+
+class MessageEnd(StreamEvent):
+    """回复结束（message_end事件），completion_tokens为服务器返回的生成token数（没有时为None）"""
+    __slots__ = ("conversation_id", "completion_tokens")
+    event = "message_end"
+
+    def __init__(self, task_id, conversation_id, completion_tokens=None):
+        self.task_id = task_id
+        self.conversation_id = conversation_id
+        self.completion_tokens = completion_tokens
+
+
+class StreamError(StreamEvent):
+    """服务器在流中返回的错误（error事件）"""
+    __slots__ = ("message",)
+    event = "error"
+
+    def __init__(self, task_id, message):
+        self.task_id = task_id
+        self.message = message
+
+
+class OtherEvent(StreamEvent):
+    """不需要处理的事件（如workflow_started、ping），只保留事件名"""
+    __slots__ = ("event",)
+
+    def __init__(self, task_id, event):
+        self.task_id = task_id
+        self.event = event
+
+
+# ---- on_data回调的数据（API客户端 -> 对话引擎、群聊、解码子进程） ----
+
+class StreamData:
+    """on_data回调数据的基类"""
+    __slots__ = ()
+    __repr__ = _slots_repr
+
+
+class TextData(StreamData):
+    """回复文本片段，emitted_at为API客户端发出时的time.monotonic()，用于统计界面处理延迟"""
+    __slots__ = ("text", "emitted_at")
+
+    def __init__(self, text, emitted_at):
+        self.text = text
+        self.emitted_at = emitted_at
+
+
+class MediaDirective(StreamData):
+    """回复中首次出现某类媒体标记（kind为audio或image），text为含标记的片段；之后的文本不再以TextData发出"""
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+
+
+class PreviewData(StreamData):
+    """下载中图片的低分辨率预览（PIL图像；经过解码子进程时为SharedImage）"""
+    __slots__ = ("media_index", "image")
+
+    def __init__(self, media_index, image):
+        self.media_index = media_index
+        self.image = image
+
+
+class ProgressData(StreamData):
+    """媒体下载进度，total未知时为None"""
+    __slots__ = ("media_index", "downloaded", "total")
+
+    def __init__(self, media_index, downloaded, total):
+        self.media_index = media_index
+        self.downloaded = downloaded
+        self.total = total
+
+
+class MediaResult(StreamData):
+    """媒体项下载完成或失败（item.ok区分），thumbnail为解码子进程生成的缩略图（只在进程间传递）"""
+    __slots__ = ("item", "thumbnail")
+
+    def __init__(self, item, thumbnail=None):
+        self.item = item
+        self.thumbnail = thumbnail
+
+
+# ---- SSE事件解码 ----
+
+def _message(data):
+    return MessageChunk(data.get("task_id"), data.get("answer") or "")
+
+
+def _message_end(data):
+    usage = (data.get("metadata") or {}).get("usage") or {}
+    return MessageEnd(data.get("task_id"), data.get("conversation_id"), usage.get("completion_tokens"))
+
+
+def _error(data):
+    return StreamError(data.get("task_id"), data.get("message") or "未知错误")
+
+
+# 事件名 -> 从dict创建事件对象
+EVENT_BUILDERS = {
+    "message": _message,
+    "message_end": _message_end,
+    "error": _error,
+}
+
+
+def event_from_dict(data):
+    """由解码后的dict创建事件对象，不是JSON对象时抛出ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError(f"SSE数据不是JSON对象: {type(data).__name__}")
+    event = data.get("event")
+    builder = EVENT_BUILDERS.get(event)
+    return builder(data) if builder else OtherEvent(data.get("task_id"), event)
+
+
+def _dict_decoder(loads):
+    """由解码为dict的loads创建解码函数"""
+    def decode(payload):
+        data = loads(payload)
+        # message事件占绝大多数，直接创建，不经过event_from_dict
+        if type(data) is dict and data.get("event") == "message":
+            return MessageChunk(data.get("task_id"), data.get("answer") or "")
+        return event_from_dict(data)
+    return decode
+
+
+def _json_decoder():
+    # json.loads每次调用都检查参数类型、两次匹配首尾空白，SSE的data行直接用raw_decode解析
+    raw_decode = json.JSONDecoder().raw_decode
+    loads = json.loads
+
+    def decode(payload):
+        # json.loads对bytes要先用Python代码检测编码，SSE总是UTF-8，直接decode
+        text = payload.decode("utf-8") if type(payload) is bytes else payload
+        try:
+            data, end = raw_decode(text)
+            if end != len(text):
+                raise ValueError
+        except ValueError:
+            # 首尾有空白或多余内容时按json.loads的规则处理（无法解码时抛出同样的错误）
+            data = loads(text)
+        if type(data) is dict and data.get("event") == "message":
+            return MessageChunk(data.get("task_id"), data.get("answer") or "")
+        return event_from_dict(data)
+    return decode
+
+
+def _orjson_decoder():
+    import orjson
+    # orjson.JSONDecodeError是ValueError的子类
+    return _dict_decoder(orjson.loads)
+
+
+def _msgspec_decoder():
+    from typing import Optional
+    import msgspec
+
+    # 只声明用到的字段，其余字段在解码时直接跳过
+    class Usage(msgspec.Struct):
+        completion_tokens: Optional[int] = None
+
+    class Metadata(msgspec.Struct):
+        usage: Optional[Usage] = None
+
+    class Wire(msgspec.Struct):
+        event: Optional[str] = None
+        task_id: Optional[str] = None
+        answer: Optional[str] = None
+        conversation_id: Optional[str] = None
+        message: Optional[str] = None
+        metadata: Optional[Metadata] = None
+
+    wire_decode = msgspec.json.Decoder(Wire).decode
+    decode_error = msgspec.DecodeError
+
+    def decode(payload):
+        try:
+            wire = wire_decode(payload)
+        except decode_error as e:
+            raise ValueError(str(e)) from None
+        event = wire.event
+        if event == "message":
+            return MessageChunk(wire.task_id, wire.answer or "")
+        if event == "message_end":
+            usage = wire.metadata.usage if wire.metadata else None
+            return MessageEnd(wire.task_id, wire.conversation_id, usage.completion_tokens if usage else None)
+        if event == "error":
+            return StreamError(wire.task_id, wire.message or "未知错误")
+        return OtherEvent(wire.task_id, event)
+    return decode
+
+
+_FACTORIES = {
+    "msgspec": _msgspec_decoder,
+    "orjson": _orjson_decoder,
+    "json": _json_decoder,
+}
+
+
+class StreamDecoder:
+    """SSE data行的解码器；decode(payload)接受data行去掉"data: "前缀后的bytes或str，
+    返回StreamEvent，无法解码时抛出ValueError"""
+    def __init__(self, backend=None):
+        """初始化解码器
+        Args:
+            backend: 后端名称（msgspec/orjson/json），None时选择第一个已安装的后端
+        """
+        if backend is not None and backend not in _FACTORIES:
+            raise ValueError(f"未知的JSON解码后端: {backend}")
+        for name in (backend,) if backend else BACKENDS:
+            try:
+                self.decode = _FACTORIES[name]()
+            except ImportError:
+                if backend:
+                    raise
+                continue
+            self.backend = name
+            break
+
+
+def available_backends():
+    """已安装的JSON解码后端"""
+    names = []
+    for name in BACKENDS:
+        try:
+            _FACTORIES[name]()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+# 全局解码器（首次使用时按环境变量或已安装的库选择后端）
+_decoder = None
+
+
+def get_decoder():
+    global _decoder
+    if _decoder is None:
+        backend = os.environ.get("AGENT_JSON_BACKEND") or None
+        try:
+            _decoder = StreamDecoder(backend)
+        except (ImportError, ValueError) as e:
+            logger.warning(f"无法使用JSON解码后端{backend}，改为自动选择: {e}")
+            _decoder = StreamDecoder()
+        logger.info(f"SSE解码后端: {_decoder.backend}")
+    return _decoder
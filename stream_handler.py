@@ -1,51 +1,105 @@
-import time
-import threading
 import logging
 import os
 import tkinter as tk
 from tkinter import messagebox
-import ctypes
-from scene_switcher import switch_scene
+from conversation import (
+    ConversationEngine, TextDelta, MediaDetected, ImagePreview, DownloadProgress, MediaReady,
+    TurnFinished, SceneChanged, QueueChanged, PlaybackChanged,
+)
+from group_chat import GroupChat, GroupDelta, GroupMediaReady, GroupReplyFinished, GroupFinished
+from scene_switcher import show_scene, show_default_scene
 from ui_builder import UIBuilder
 
 logger = logging.getLogger(__name__)
 
 class StreamHandler:
-    def __init__(self, api_client, ui_builder):
-        """初始化流式处理类，绑定API客户端和UI构建器"""
+    """Tk界面：把用户操作交给对话引擎，并把引擎的事件渲染到控件上"""
+    def __init__(self, api_client, ui_builder, dispatch=None):
+        """初始化流式处理类，绑定API客户端和UI构建器
+
+        dispatch为引擎回调交给界面线程的方式（多会话时由渲染调度器分配界面时间），默认使用root.after
+        """
         self.api_client = api_client
         self.ui_builder = ui_builder
-        self.request_queue = []
-        self.current_request_id = 0
-        self.user_id = "user_" + str(int(time.time()))
-        self.conversation_id = None
-        self.uploaded_files = []
-        self.is_streaming = False
-        self.last_response_content = None
-        self.last_stream_data = ""
-        self.is_processing_chunk = False
+        self.root = self.ui_builder.root
         self.audio_buttons = {}
         self.image_widgets = {}
         self.output_to_stdout = False
-        self.current_response_buffer = ""  # 存储完整的响应内容
         self.current_bubble = None  # 当前聊天气泡的引用
-        
+        self.preview_labels = {}  # 媒体序号 -> 下载中图片的预览控件
+        self.stats = {"turns": 0, "errors": 0, "media": 0, "media_bytes": 0}  # 本会话的资源统计
+        self.group_chat = None  # 群聊，首次使用时创建
+        self.group_bubbles = {}  # 场景 -> 本轮群聊中该智能体的回复气泡
+
+        # 请求队列、流式状态和场景切换由对话引擎管理，回调在Tk线程中处理
+        self.dispatch = dispatch or (lambda func, *args: self.root.after(0, func, *args))
+        self.engine = ConversationEngine(api_client, dispatch=self.dispatch, defer=self.root.after_idle)
+        self._event_handlers = {
+            TextDelta: self._on_text,
+            MediaDetected: self._on_media_detected,
+            ImagePreview: lambda event: self._show_image_preview(event.image, event.media_index),
+            DownloadProgress: self._on_download_progress,
+            MediaReady: lambda event: self._render_media_item(event.item, event.content),
+            TurnFinished: self._on_turn_finished,
+            SceneChanged: self._on_scene_changed,
+            QueueChanged: self._on_queue_changed,
+            PlaybackChanged: lambda event: self._on_playback_state(event.file_path, event.state),
+            GroupDelta: self._on_group_text,
+            GroupMediaReady: lambda event: self._render_media_item(event.item, preview=False),
+            GroupReplyFinished: self._on_group_reply_finished,
+            GroupFinished: self._on_group_finished,
+        }
+        self.engine.subscribe(self._on_event)
+
         # 绑定UI事件处理
         self.ui_builder.send_button.config(command=self._enqueue_request)
         self.ui_builder.clear_button.config(command=self._clear_all)
         self.ui_builder.upload_button.config(command=self._upload_file)
         self.ui_builder.new_chat_button.config(command=self._new_conversation)
-        self.root = self.ui_builder.root
-        
+
         # 窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
-    
+
+    # 引擎状态（性能面板等读取）
+    @property
+    def current_turn(self):
+        return self.engine.current_turn
+
+    @property
+    def request_queue(self):
+        return self.engine.request_queue
+
+    @property
+    def is_streaming(self):
+        return self.engine.is_streaming
+
+    @property
+    def user_id(self):
+        return self.engine.user_id
+
+    @property
+    def conversation_id(self):
+        return self.engine.conversation_id
+
     def on_close(self):
         """窗口关闭时的处理函数"""
         self.root.destroy()
-    
+
+    def close(self):
+        """关闭会话（标签页关闭时）：停止本会话的音频、释放图片并不再接收引擎事件"""
+        for state in self.audio_buttons.values():
+            if state["is_playing"]:
+                self.engine.stop_audio(state["file_path"])
+        for image_label in self.image_widgets:
+            self.ui_builder.image_registry.release_widget(image_label)
+        self.audio_buttons = {}
+        self.image_widgets = {}
+        if self.group_chat is not None:
+            self.group_chat.unsubscribe(self._on_event)
+        self.engine.close()
+
     def _enqueue_request(self):
-        """将用户请求加入队列，准备发送到API"""
+        """将用户请求交给对话引擎，准备发送到API"""
         input_text = self.ui_builder.input_text.get("1.0", tk.END).strip()
         if not input_text:
             messagebox.showwarning("警告", "请输入文本内容")
@@ -53,18 +107,20 @@ class StreamHandler:
 
         # 添加用户消息
         self._add_user_input_to_response(input_text)
-        
+
         # 清空输入栏
         self.ui_builder.input_text.delete("1.0", tk.END)
 
         self.ui_builder.status_bar.config(text="请求处理中...")
         self.ui_builder.send_button.config(state=tk.DISABLED)
         self.ui_builder.stream_status.config(text="流式传输: 进行中", fg="blue")
-        self.is_streaming = True
         self.output_to_stdout = False
+        self.current_bubble = None
+
+        if self.ui_builder.group_var.get():
+            self._enqueue_group(input_text)
+            return
 
-        self.current_request_id += 1
-        request_id = self.current_request_id
         selected_tool = self.ui_builder.tool_var.get()
         tool_name = None
 
@@ -75,211 +131,161 @@ class StreamHandler:
                     break
 
         tool_params = self._get_param_values()
+        self.engine.submit(input_text, tool_name, tool_params)
+
+    def _enqueue_group(self, input_text):
+        """群聊模式：把问题同时发给所有场景智能体"""
+        if self.group_chat is None:
+            self.group_chat = GroupChat(self.api_client, dispatch=self.dispatch, user_id=self.engine.user_id)
+            self.group_chat.subscribe(self._on_event)
+        self.group_bubbles = {}
+        if self.group_chat.submit(input_text) is None:
+            self.ui_builder.add_chat_message("没有配置任何场景的API密钥，无法群聊", is_user=False)
+            self.ui_builder.stream_status.config(text="流式传输: 就绪", fg="#333")
+            self._request_complete()
+            return
+        self.ui_builder.status_bar.config(text=f"群聊中... 0/{len(self.group_chat.current.pending)}")
+
+    def _on_event(self, event):
+        """对话引擎事件（Tk线程），按事件类型分发"""
+        handler = self._event_handlers.get(type(event))
+        if handler is not None:
+            handler(event)
+
+    def _on_media_detected(self, event):
+        """检测到音频或图片，之后的回复内容输出到标准输出"""
+        self.output_to_stdout = True
+        if event.kind == "audio":
+            print("[音频响应] 检测到音频内容，已切换到标准输出")
+        else:
+            print("[图片响应] 检测到图片内容，已切换到标准输出")
+        print(event.content, end="", flush=True)
 
-        files = self.uploaded_files.copy()
-        self.uploaded_files = []
-
-        # 将请求添加到队列
-        self.request_queue.append(
-            (request_id, input_text, tool_name, tool_params, files)
-        )
+    def _on_download_progress(self, event):
+        if event.total:
+            percent = event.downloaded * 100 // event.total
+            self.ui_builder.status_bar.config(text=f"正在下载媒体文件... {percent}%")
+        else:
+            self.ui_builder.status_bar.config(text=f"正在下载媒体文件... {event.downloaded // 1024}KB")
+
+    def _on_text(self, event):
+        """回复文本片段：第一个片段创建气泡，之后更新气泡内容"""
+        if not self.current_bubble:
+            # 创建新气泡
+            self.current_bubble = self.ui_builder.add_chat_message(event.buffer, is_user=False)
+            self._mark_first_paint()
+        else:
+            # 更新现有气泡内容
+            self.ui_builder.update_chat_message(self.current_bubble, event.buffer)
 
-        # 如果是队列中的第一个请求，启动处理线程
-        if len(self.request_queue) == 1:
-            threading.Thread(target=self._process_request_queue, daemon=True).start()
-    
-    def _process_request_queue(self):
-        """处理请求队列，支持流式响应实时更新"""
-        while self.request_queue:
-            request_id, input_text, tool_name, tool_params, files = self.request_queue[0]
-
-            # 调用API客户端发送请求，设置流式响应回调函数
-            self.api_client.call_agent(
-                input_text,
-                tool_name,
-                tool_params,
-                self.user_id,
-                files,
-                on_data=lambda data: self.root.after(
-                    0, self._handle_stream_data, data, request_id
-                ),
-                on_end=lambda response: self.root.after(
-                    0, self._handle_stream_end, response, request_id
-                ),
-            )
+        # 确保气泡滚动到底部
+        self.ui_builder.chat_container.yview_moveto(1.0)
 
-            # 等待流式响应完成，超时时间120秒
-            timeout = 0
-            while self.is_streaming and timeout < 120:
-                time.sleep(0.5)
-                timeout += 0.5
+    def _on_group_text(self, event):
+        """群聊回复片段：每个智能体一个气泡，按各自的首个片段到达顺序排列"""
+        text = f"【{event.name}】\n{event.buffer}"
+        bubble = self.group_bubbles.get(event.agent)
+        if bubble is None:
+            self.group_bubbles[event.agent] = self.ui_builder.add_chat_message(text, is_user=False)
+        else:
+            self.ui_builder.update_chat_message(bubble, text)
+        self.ui_builder.chat_container.yview_moveto(1.0)
 
-            # 处理完当前请求后从队列中移除
-            self.request_queue.pop(0)
+    def _on_group_reply_finished(self, event):
+        current = self.group_chat.current
+        if event.status != "ok" and event.agent not in self.group_bubbles:
+            self.ui_builder.add_chat_message(f"【{event.name}】\n回复失败", is_user=False)
+        if current.pending:
+            total = len(current.elapsed) + len(current.pending)
+            self.ui_builder.status_bar.config(text=f"群聊中... {len(current.elapsed)}/{total}")
+
+    def _on_group_finished(self, event):
+        """群聊结束，状态栏显示首个回复延迟和总耗时"""
+        self.stats["turns"] += 1
+        self.group_bubbles = {}
+        self.ui_builder.stream_status.config(text="流式传输: 就绪", fg="#333")
+        self.ui_builder.send_button.config(state=tk.NORMAL)
+        first = f"{event.first_response * 1000:.0f} ms" if event.first_response is not None else "无"
+        self.ui_builder.status_bar.config(
+            text=f"群聊完成: 首个回复 {first}, 总耗时 {event.wall_time * 1000:.0f} ms"
+                 f"（最慢 {max(event.elapsed.values()) * 1000:.0f} ms / 合计 {sum(event.elapsed.values()) * 1000:.0f} ms）"
+        )
 
-            # 如果队列中还有请求，等待0.5秒后继续处理
-            if self.request_queue:
-                time.sleep(0.5)
-            else:
-                self.root.after(0, self._request_complete)
-    
-    def _handle_stream_data(self, data, request_id):
-        """处理流式数据更新，将数据实时显示到界面"""
-        if request_id != self.current_request_id:
-            return
+    def _on_turn_finished(self, event):
+        """本轮结束，复位界面状态"""
+        self.stats["turns"] += 1
+        if event.status != "ok":
+            self.stats["errors"] += 1
+        self.preview_labels = {}
+        self.current_bubble = None
+        self.ui_builder.stream_status.config(text="流式传输: 就绪", fg="#333")
+        self._request_complete()
 
-        # 处理音频和图片检测事件
-        if data["type"] == "audio_detected":
-            self.output_to_stdout = True
-            print("[音频响应] 检测到音频内容，已切换到标准输出")
-            print(data["content"], end="", flush=True)
-            return
+    def _on_scene_changed(self, event):
+        """引擎已切换API密钥，更新背景和角色信息"""
+        try:
+            show_scene(event.garden, self.ui_builder)
+        except Exception as e:
+            logger.error(f"切换场景({event.garden})失败: {e}")
 
-        if data["type"] == "image_detected":
-            self.output_to_stdout = True
-            print("[图片响应] 检测到图片内容，已切换到标准输出")
-            print(data["content"], end="", flush=True)
-            return
+    def _on_queue_changed(self, event):
+        if event.depth == 0:
+            self._request_complete()
 
-                # 处理文本片段
-        if data["type"] == "text":
-            chunk_content = data.get("content", "")
-            
-            # 追加到缓冲区
-            self.current_response_buffer += chunk_content
-            
-            # 更新聊天气泡
-            if not self.current_bubble:
-                # 创建新气泡
-                self.current_bubble = self.ui_builder.add_chat_message(
-                    self.current_response_buffer, 
-                    is_user=False
-                )
-            else:
-                # 更新现有气泡内容
-                self.ui_builder.update_chat_message(
-                    self.current_bubble, 
-                    self.current_response_buffer
-                )
-                
-            # 确保气泡滚动到底部
-            self.ui_builder.chat_container.yview_moveto(1.0)
-                
-            self.is_processing_chunk = False
-    
-    def _handle_stream_end(self, response, request_id):
-        """处理流式响应结束，处理最终响应内容"""
-        if request_id != self.current_request_id:
-            return
-
-        # 处理音频文件路径
-        if response.get("audio_file_path"):
-            # 添加音频消息
-            self._add_audio_message(response["audio_file_path"], response.get("original_content", ""))
-        
-        # 处理图片文件路径
-        elif response.get("image_file_path"):
-            self._add_image_message(response["image_file_path"], response.get("original_content", ""))
-        
-        # 更新会话 ID
-        if response.get("conversation_id"):
-            self.conversation_id = response["conversation_id"]
-        
-        # 重置气泡引用
-        if hasattr(self, 'current_bubble'):
-            self.current_bubble = None 
-        
-        # 更新界面状态
-        self.is_streaming = False
-        self.ui_builder.stream_status.config(text="流式传输: 就绪", fg="#333")
-        
-        # 清空缓冲区
-        self.current_response_buffer = ""
-        self._request_complete()
-        
-        # 调用场景切换 - 使用修改后的参数顺序
-        original_content = response.get("original_content", "")
-        if original_content and "*切换地点*" in original_content:
-            switch_scene(
-                original_content=original_content,
-                ui_builder=self.ui_builder,
-                api_client=self.api_client
-            )
-        
     def _request_complete(self):
         """请求处理完成，更新界面状态"""
         self.ui_builder.status_bar.config(text="就绪")
         self.ui_builder.send_button.config(state=tk.NORMAL)
-    
+
     def _add_user_input_to_response(self, input_text):
         """添加用户消息（右侧气泡）"""
         self.ui_builder.add_chat_message(input_text, is_user=True)
-    
+
     def _clear_all(self):
         """清除所有内容，包括输入、响应、上传文件等"""
+        # 清空待发送文件并停止所有正在播放的音频
+        self.engine.clear()
+        self._clear_widgets()
+
+    def _clear_widgets(self):
+        """清除输入框和聊天框中的控件"""
         # 清除输入框内容
         self.ui_builder.input_text.delete("1.0", tk.END)
-        # 清空上传文件列表
-        self.uploaded_files = []
         # 更新状态栏文本为就绪
         self.ui_builder.status_bar.config(text="就绪")
-        # 清空音频按钮状态记录
+        # 清空音频按钮状态记录（音频已由引擎停止）
         self.audio_buttons = {}
-    # 清空图片控件记录
+        # 释放图片并清空图片控件记录
+        for image_label in self.image_widgets:
+            self.ui_builder.image_registry.release_widget(image_label)
         self.image_widgets = {}
-    # 重置输出到标准输出的标志
+        self.preview_labels = {}
+        # 重置输出到标准输出的标志
         self.output_to_stdout = False
 
-    # 清除聊天框内容
+        # 清除聊天框内容
         for widget in self.ui_builder.chat_frame.winfo_children():
             widget.destroy()
 
-    # 停止所有正在播放的音频
-        for state in self.audio_buttons.values():
-            if state["is_playing"]:
-                self.api_client._stop_file(state["file_path"])
-
-    # 这里不重置与流式响应相关的状态
-        self.last_response_content = None
-        self.last_stream_data = ""
-        self.is_processing_chunk = False
     def _new_conversation(self):
         """创建新会话，重置会话状态"""
-        # 重置会话 ID
-        self.api_client.current_conversation_id = None
-        self.conversation_id = None
-
-        # 清除所有内容，包括输入、响应、上传文件等
-        self._clear_all()
-
+        # 重置会话 ID、待发送文件和音频
+        self.engine.new_conversation()
+        self._clear_widgets()
+        self.current_bubble = None
 
-        self.ui_builder.set_background("background.jpg")
-        self.ui_builder.add_photo("pm.jpg")  # 设置默认照片
-        self.ui_builder.set_name("派蒙")  # 设置姓名
-        self.ui_builder.set_intro("    派蒙是旅行者在提瓦特的旅途中钓到的奇妙生物，同时也是旅行者的向导与引路人。\n    年幼的小女孩外形，白色齐肩发，戴着一颗黑曜石打造的星星发饰，头顶悬浮王冠（派蒙待机动作可以看到有取下来的动作）背后的小披风有着星空纹理般的黑蓝色，披风有类似星座纹路的装饰，飘动起来似乎可以看到星辰在闪动，眼睛远处看是蓝瞳，拉近视角后也可以看见眼中的星辰，衣着镶金边的白色连衣裤，衣服中央有类似摩拉货币的图案，脚穿白镶金的靴子，身边飘动着闪闪星座纹路，派蒙贪吃爱财，也是个话痨，因为旅行者很多台词都被派蒙抢了，所以显得她话有些多。\n    派蒙非常珍视与旅行者的友谊，屡次强调自己是“最好的伙伴”，不会和旅行者分开。")  # 设置介绍
+        show_default_scene(self.ui_builder)
 
-    # 更新状态栏
+        # 更新状态栏
         self.ui_builder.status_bar.config(text="新会话已创建")
 
-    # 重置流式处理相关状态
-        self.last_response_content = None
-        self.last_stream_data = ""
-        self.is_processing_chunk = False
-
-    # 重置当前响应缓冲区和当前聊天气泡引用
-        self.current_response_buffer = ""
-        self.current_bubble = None
-
-    # 重置输出到标准输出的标志
-        self.output_to_stdout = False
-
-    # 重新添加欢迎消息
+        # 重新添加欢迎消息
         self.ui_builder.chat_bubble._add_default_welcome_message()
 
-    # 确保聊天区域滚动到底部
+        # 确保聊天区域滚动到底部
         self.ui_builder.chat_container.yview_moveto(1.0)
 
-    
+
     def _upload_file(self):
         """上传文件到Dify API"""
         try:
@@ -296,9 +302,9 @@ class StreamHandler:
             self.ui_builder.status_bar.config(text="文件上传中...")
             self.ui_builder.upload_button.config(state=tk.DISABLED)
 
-            file_info = self.api_client.upload_file(file_path)
+            # 上传成功的文件随下一个请求发送
+            file_info = self.engine.upload_file(file_path)
             if file_info:
-                self.uploaded_files.append(file_info)
                 file_name = os.path.basename(file_path)
                 self.ui_builder.file_display.config(text=f"已上传文件: {file_name}")
                 messagebox.showinfo("成功", f"文件 {file_name} 上传成功")
@@ -310,7 +316,7 @@ class StreamHandler:
         finally:
             self.ui_builder.status_bar.config(text="就绪")
             self.ui_builder.upload_button.config(state=tk.NORMAL)
-    
+
     def _add_audio_message(self, file_path, content):
         """在聊天框中添加音频消息"""
         # 创建包含播放按钮的框架
@@ -345,32 +351,94 @@ class StreamHandler:
         # 滚动到底部
         self.ui_builder.chat_container.yview_moveto(1.0)
     
-    def _add_image_message(self, file_path, content):
-        """在聊天框中添加图片消息"""
+    def _render_media_item(self, item, content="", preview=True):
+        """渲染下载完成（或失败）的媒体项（引擎保证每项只发出一次）
+
+        preview为False时不替换下载预览（群聊中各智能体的媒体序号会重复）
+        """
+        self.stats["media"] += 1
+        if item.ok and os.path.exists(item.file_path):
+            self.stats["media_bytes"] += os.path.getsize(item.file_path)
+        if not item.ok:
+            self.ui_builder.add_chat_message(item.error or "媒体文件下载失败", is_user=False)
+        elif item.kind == "audio":
+            self._add_audio_message(item.file_path, content)
+        else:
+            self._add_image_message(item.file_path, content, item.index if preview else None)
+        self._mark_first_paint()
+
+    def _mark_first_paint(self):
+        """回复内容首次加入界面后，在事件循环空闲（绘制完成）时记录first_paint阶段"""
+        turn = self.current_turn
+        if turn and "first_paint" not in turn.marks:
+            self.root.after_idle(turn.mark, "first_paint")
+
+    def _create_image_label(self, photo):
+        """在聊天框中创建带AI头像的图片控件"""
+        # 创建框架
+        frame = tk.Frame(self.ui_builder.chat_frame, bg="#f0f0f0")
+        frame.pack(fill="x", pady=5)
+
+        # 添加AI头像
+        avatar_label = tk.Label(frame, text="🤖", font=("Arial", 16), bg="#f0f0f0")
+        avatar_label.pack(side="left", padx=5)
+
+        image_label = tk.Label(frame, image=photo, bg="#ffffff", cursor="hand2")
+        image_label.image = photo
+        image_label.pack(side="left", padx=5)
+        return image_label
+
+    def _show_image_preview(self, preview, media_index=0):
+        """显示下载中图片的低分辨率预览，后续预览在原控件上刷新"""
         try:
+            from PIL import ImageTk
+            # 预览图同样由图片登记表持有，计入内存预算
+            registry = self.ui_builder.image_registry
+            handle = registry.acquire(f"preview:{media_index}", lambda: ImageTk.PhotoImage(preview))
+            label = self.preview_labels.get(media_index)
+            if label is None or not label.winfo_exists():
+                label = self.preview_labels[media_index] = self._create_image_label(handle.photo)
+                label.image = None
+            else:
+                # 释放上一张预览
+                registry.release_widget(label)
+            registry.show(handle, label)
+            self.ui_builder.chat_container.yview_moveto(1.0)
+        except Exception as e:
+            logger.error(f"显示图片预览失败: {e}")
+
+    def _add_image_message(self, file_path, content, media_index=0):
+        """在聊天框中添加图片消息"""
+        def load_thumbnail():
             from PIL import Image, ImageTk
-            # 创建框架
-            frame = tk.Frame(self.ui_builder.chat_frame, bg="#f0f0f0")
-            frame.pack(fill="x", pady=5)
-            
-            # 添加AI头像
-            avatar_label = tk.Label(frame, text="🤖", font=("Arial", 16), bg="#f0f0f0")
-            avatar_label.pack(side="left", padx=5)
-            
-            # 加载并显示图片缩略图
-            img = Image.open(file_path)
-            img = img.resize((150, 100), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            
-            image_label = tk.Label(frame, image=photo, bg="#ffffff", cursor="hand2")
-            image_label.image = photo
-            image_label.pack(side="left", padx=5)
+            # 解码子进程已生成缩略图时直接使用（只用于首次加载，释放后重新加载时在本进程解码）
+            take_thumbnail = getattr(self.api_client, "take_thumbnail", None)
+            thumbnail = take_thumbnail(file_path) if take_thumbnail else None
+            if thumbnail is not None:
+                return ImageTk.PhotoImage(thumbnail)
+            with Image.open(file_path) as img:
+                return ImageTk.PhotoImage(img.resize((150, 100), Image.LANCZOS))
+
+        try:
+            # 加载缩略图，由图片登记表持有，滚出屏幕且超出内存预算时释放、滚回时重新加载
+            registry = self.ui_builder.image_registry
+            handle = registry.acquire(f"thumbnail:{file_path}", load_thumbnail)
+
+            # 已有下载预览时原位替换为完整图片
+            preview_label = self.preview_labels.pop(media_index, None)
+            if preview_label is not None and preview_label.winfo_exists():
+                image_label = preview_label
+                registry.release_widget(image_label)
+            else:
+                image_label = self._create_image_label(handle.photo)
+            registry.show(handle, image_label)
+            image_label.image = None  # 不在控件上保留引用，否则释放后像素数据仍被占用
             image_label.bind("<Button-1>", lambda e, fp=file_path: self._show_large_image(fp))
             
             # 记录图片控件
             self.image_widgets[image_label] = {
                 "file_path": file_path,
-                "photo": photo
+                "handle": handle
             }
             
             # 滚动到底部
@@ -393,12 +461,11 @@ class StreamHandler:
             large_window.geometry(f"{img.width}x{img.height+50}")
             large_window.resizable(True, True)
             
-            # 转换为Tkinter可用的图片对象
-            photo = ImageTk.PhotoImage(img)
-            
-            # 创建图片标签
-            image_label = tk.Label(large_window, image=photo)
-            image_label.image = photo  # 保留引用
+            # 创建图片标签，图片由登记表持有，窗口关闭后随控件释放
+            image_label = tk.Label(large_window)
+            self.ui_builder.image_registry.acquire(
+                f"large:{file_path}", lambda: ImageTk.PhotoImage(Image.open(file_path)), widget=image_label, pinned=True
+            )
             image_label.pack(padx=10, pady=10)
             
             # 创建关闭按钮
@@ -431,17 +498,12 @@ class StreamHandler:
         # 先停止所有其他正在播放的音频
         self._stop_all_other_audios(file_path)
         
-        # 获取当前播放时间（如果之前有暂停）
-        current_time = 0
-        if file_path in self.api_client.playing_files and self.api_client.playing_files[file_path]["paused"]:
-            current_time = self.api_client.get_playback_time(file_path)
-        
         # 更新按钮状态
         button.config(text="■ 暂停", bg="#ffe0e0", fg="#b30000")
         self.audio_buttons[button]["is_playing"] = True
         
-        # 播放音频
-        result = self.api_client._play_file(file_path, current_time)
+        # 播放音频（已暂停的文件由音频引擎从暂停位置继续）
+        result = self.engine.play_audio(file_path)
         if not result:
             # 播放失败，恢复按钮状态
             button.config(text="▶ 播放音频", bg="#e0f0ff", fg="#0056b3")
@@ -454,7 +516,7 @@ class StreamHandler:
         self.ui_builder.status_bar.config(text="已暂停音频")
         
         # 暂停播放
-        result = self.api_client._pause_file(file_path)
+        result = self.engine.pause_audio(file_path)
         
         # 更新按钮状态
         if result:
@@ -463,11 +525,23 @@ class StreamHandler:
         
         self.root.after(1000, lambda: self.ui_builder.status_bar.config(text="就绪"))
     
+    def _on_playback_state(self, file_path, state):
+        """音频引擎状态变化回调（Tk线程），播放结束、停止或出错时复位对应按钮"""
+        if state["state"] not in ("ended", "stopped", "error"):
+            return
+        for btn, button_state in self.audio_buttons.items():
+            if button_state["file_path"] == file_path and button_state["is_playing"]:
+                if btn.winfo_exists():
+                    btn.config(text="▶ 播放音频", bg="#e0f0ff", fg="#0056b3")
+                button_state["is_playing"] = False
+        if state["state"] == "error":
+            self.ui_builder.status_bar.config(text="音频播放失败")
+
     def _stop_all_other_audios(self, current_file_path):
         """停止所有其他正在播放的音频"""
         for btn, state in list(self.audio_buttons.items()):
             if state["is_playing"] and state["file_path"] != current_file_path:
-                self.api_client._stop_file(state["file_path"])
+                self.engine.stop_audio(state["file_path"])
                 btn.config(text="▶ 播放音频", bg="#e0f0ff", fg="#0056b3")
                 state["is_playing"] = False
     
@@ -492,4 +566,3 @@ class StreamHandler:
                 params[param_name] = widget.get()
             elif isinstance(widget, tk.StringVar):
                 params[param_name] = widget.get()
-        return params
\ No newline at end of file
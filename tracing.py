@@ -0,0 +1,195 @@
+"""轻量级跨线程耗时追踪，输出Chrome/Perfetto可直接打开的trace JSON
+
+未启用时span()返回共享的空上下文管理器，traced装饰的函数只多一次布尔判断。
+启用后每个span记录为一个完整事件(ph="X")；带flow编号的span之间用流事件连线，
+一轮对话从界面线程到工作线程、下载线程再回到界面线程的路径可以在时间线上直接看到。
+
+启用方式：设置环境变量 AGENT_TRACE=trace.json，或在config.json中配置 "tracing": {"path": "trace.json"}；
+程序退出时写入文件，在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+"""
+import os
+import json
+import time
+import atexit
+import itertools
+import logging
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_path = None
+_max_events = 0
+_events = []
+_dropped = 0
+_local = threading.local()
+_started_flows = set()
+_flow_ids = itertools.count(1)  # 全进程唯一的流编号（多个标签页、网关屏幕的请求ID各自从1开始）
+_named_threads = set()
+_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def _now_us():
+    return time.perf_counter() * 1e6
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(path, max_events=1_000_000):
+    """开始追踪，程序退出时写入path"""
+    global _enabled, _path, _max_events
+    _path = path
+    _max_events = max_events
+    if not _enabled:
+        _enabled = True
+        atexit.register(save)
+        logger.info(f"已启用耗时追踪，退出时写入: {path}")
+
+
+def disable():
+    """停止追踪（已记录的事件保留，可继续调用save）"""
+    global _enabled
+    _enabled = False
+
+
+def new_flow():
+    """分配一个全进程唯一的流编号（可在任意线程调用）"""
+    return next(_flow_ids)
+
+
+def current_flow():
+    """当前线程所在span的流编号，用于把流传递给其他线程"""
+    return getattr(_local, "flow", None)
+
+
+def _emit(event):
+    """追加事件，首次出现的线程同时记录线程名"""
+    global _dropped
+    if len(_events) >= _max_events:
+        _dropped += 1
+        return
+    tid = threading.get_ident()
+    if tid not in _named_threads:
+        _named_threads.add(tid)
+        _events.append({"ph": "M", "name": "thread_name", "pid": _pid, "tid": tid,
+                        "args": {"name": threading.current_thread().name}})
+    event["pid"] = _pid
+    event["tid"] = tid
+    _events.append(event)
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空span"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "flow", "args", "start", "prev_flow")
+
+    def __init__(self, name, flow, args):
+        self.name = name
+        self.flow = flow
+        self.args = args
+
+    def __enter__(self):
+        self.prev_flow = getattr(_local, "flow", None)
+        explicit = self.flow is not None
+        if not explicit:
+            self.flow = self.prev_flow
+        _local.flow = self.flow
+        self.start = _now_us()
+        if explicit:
+            # 只在显式指定流编号的span上连线，流事件绑定到同一时刻开始的本span上
+            with _lock:
+                phase = "t" if self.flow in _started_flows else "s"
+                _started_flows.add(self.flow)
+            _emit({"ph": phase, "name": "turn", "cat": "turn", "id": self.flow, "ts": self.start, "bp": "e"})
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        args = dict(self.args)
+        if self.flow is not None:
+            args["flow"] = self.flow
+        if exc_type is not None:
+            args["exception"] = exc_type.__name__
+        _emit({"ph": "X", "name": self.name, "cat": "agent", "ts": self.start, "dur": end - self.start, "args": args})
+        _local.flow = self.prev_flow
+        return False
+
+
+def span(name, flow=None, **args):
+    """追踪一段代码的耗时
+    Args:
+        name: span名称
+        flow: 流编号（如请求ID），相同编号的span在时间线上连线；不指定时沿用外层span的编号
+        args: 附加在事件上的参数
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, flow, args)
+
+
+def instant(name, **args):
+    """记录瞬时事件（如收到一个SSE事件）"""
+    if not _enabled:
+        return
+    flow = current_flow()
+    if flow is not None:
+        args["flow"] = flow
+    _emit({"ph": "i", "name": name, "cat": "agent", "ts": _now_us(), "s": "t", "args": args})
+
+
+def end_flow(flow):
+    """结束一条流（对应请求处理完成）"""
+    if not _enabled or flow is None:
+        return
+    with _lock:
+        if flow not in _started_flows:
+            return
+        _started_flows.discard(flow)
+    _emit({"ph": "f", "name": "turn", "cat": "turn", "id": flow, "ts": _now_us(), "bp": "e"})
+
+
+def traced(name=None):
+    """装饰器：以span追踪函数调用，name默认为函数的限定名"""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(label, None, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def save(path=None):
+    """把已记录的事件写入trace JSON文件"""
+    path = path or _path
+    if not path or not _events:
+        return
+    try:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": list(_events), "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": _dropped}}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"已写入追踪文件: {path}, {len(_events)} 个事件")
+    except Exception as e:
+        logger.error(f"写入追踪文件失败: {e}")
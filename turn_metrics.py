@@ -0,0 +1,239 @@
+"""每轮对话的分阶段耗时统计
+
+一轮对话依次经过以下阶段，每个阶段记录首次到达的时间：
+    enqueue -> request_sent -> first_byte -> first_message -> message_end -> media_ready -> first_paint
+
+轮次结束时把阶段间隔汇总到按场景（API密钥对应的场景名）区分的直方图中，
+可通过本地HTTP端点以Prometheus文本格式导出，或定期写入JSON文件。
+"""
+import os
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("enqueue", "request_sent", "first_byte", "first_message", "message_end", "media_ready", "first_paint")
+
+# 汇总的耗时指标：名称 -> (起始阶段, 结束阶段)
+DURATIONS = {
+    "queue_wait": ("enqueue", "request_sent"),
+    "time_to_first_byte": ("request_sent", "first_byte"),
+    "time_to_first_token": ("enqueue", "first_message"),
+    "stream_duration": ("first_message", "message_end"),
+    "media_download": ("message_end", "media_ready"),
+    "first_paint_lag": ("first_message", "first_paint"),
+    "turn_total": ("enqueue", None),
+}
+
+# 直方图分桶上限(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """累积分桶直方图"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """记录一个观测值"""
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """各分桶上限及小于等于该上限的累计次数"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class TurnTimer:
+    """一轮对话的阶段时间戳，可在任意线程中调用mark"""
+    def __init__(self, registry, scene="default"):
+        self.registry = registry
+        self.scene = scene
+        self.marks = {}
+        self.tokens = 0  # 生成的token数（服务器未返回用量时为message事件数）
+        self.finished = False
+
+    def mark(self, phase):
+        """记录阶段首次到达的时间，重复调用不覆盖"""
+        self.marks.setdefault(phase, time.monotonic())
+
+    def elapsed(self, start, end=None):
+        """两个阶段之间的耗时(秒)，阶段未到达时返回None；end为None表示到当前时间"""
+        if start not in self.marks:
+            return None
+        if end is None:
+            return time.monotonic() - self.marks[start]
+        if end not in self.marks:
+            return None
+        return self.marks[end] - self.marks[start]
+
+    def finish(self, status="ok"):
+        """结束本轮并汇总到统计中，只生效一次"""
+        if self.finished:
+            return
+        self.finished = True
+        self.registry.record_turn(self, status)
+
+
+class MetricsRegistry:
+    """按场景汇总每轮对话的耗时直方图"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # (指标名, 场景) -> Histogram
+        self.turns = {}  # (场景, 状态) -> 轮数
+
+    def start_turn(self, scene="default"):
+        """开始一轮对话并记录enqueue阶段"""
+        turn = TurnTimer(self, scene)
+        turn.mark("enqueue")
+        return turn
+
+    def observe(self, name, scene, value, buckets=LATENCY_BUCKETS):
+        """记录单个观测值"""
+        with self._lock:
+            histogram = self.histograms.get((name, scene))
+            if histogram is None:
+                histogram = self.histograms[(name, scene)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_turn(self, turn, status="ok"):
+        """汇总一轮对话的各阶段耗时"""
+        for name, (start, end) in DURATIONS.items():
+            value = turn.elapsed(start, end)
+            if value is not None:
+                self.observe(name, turn.scene, value)
+        stream_duration = turn.elapsed("first_message", "message_end")
+        if turn.tokens and stream_duration:
+            self.observe("tokens_per_second", turn.scene, turn.tokens / stream_duration, RATE_BUCKETS)
+        with self._lock:
+            key = (turn.scene, status)
+            self.turns[key] = self.turns.get(key, 0) + 1
+        logger.info(
+            "轮次耗时",
+            extra={"scene": turn.scene, "status": status, "tokens": turn.tokens,
+                   "phases": {phase: round(turn.elapsed("enqueue", phase), 4)
+                              for phase in PHASES if phase in turn.marks}},
+        )
+
+    def snapshot(self):
+        """返回全部统计的JSON可序列化副本"""
+        with self._lock:
+            metrics = {}
+            for (name, scene), histogram in sorted(self.histograms.items()):
+                metrics.setdefault(name, {})[scene] = histogram.to_dict()
+            turns = {}
+            for (scene, status), count in sorted(self.turns.items()):
+                turns.setdefault(scene, {})[status] = count
+        return {"timestamp": time.time(), "turns": turns, "metrics": metrics}
+
+    def to_prometheus(self):
+        """以Prometheus文本格式导出"""
+        lines = [
+            "# HELP agent_turns_total Completed conversation turns.",
+            "# TYPE agent_turns_total counter",
+        ]
+        with self._lock:
+            for (scene, status), count in sorted(self.turns.items()):
+                lines.append(f'agent_turns_total{{scene="{scene}",status="{status}"}} {count}')
+            by_name = {}
+            for (name, scene), histogram in sorted(self.histograms.items()):
+                by_name.setdefault(name, []).append((scene, histogram))
+            for name, series in by_name.items():
+                metric = f"agent_turn_{name}" if name == "tokens_per_second" else f"agent_turn_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for scene, histogram in series:
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{metric}_bucket{{scene="{scene}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{scene="{scene}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{scene="{scene}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{scene="{scene}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        """把当前统计写入JSON文件（先写临时文件再替换）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """全局统计实例"""
+    return _registry
+
+
+def start_exporters(prometheus_port=None, prometheus_host="127.0.0.1", json_path=None, json_interval=60):
+    """启动统计导出：本地Prometheus端点和/或定期JSON文件，未配置的导出方式不启动
+    Args:
+        prometheus_port: Prometheus文本端点端口，访问 http://host:port/metrics
+        prometheus_host: 端点监听地址，默认只监听本机
+        json_path: JSON文件路径
+        json_interval: JSON文件写入间隔(秒)
+    """
+    registry = get_registry()
+    if prometheus_port:
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics请求: " + format, *args)
+
+        try:
+            server = ThreadingHTTPServer((prometheus_host, prometheus_port), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+            logger.info(f"指标端点: http://{prometheus_host}:{prometheus_port}/metrics")
+        except OSError as e:
+            logger.error(f"启动指标端点失败: {e}")
+
+    if json_path:
+        def dump_loop():
+            while True:
+                time.sleep(json_interval)
+                try:
+                    registry.dump_json(json_path)
+                except Exception as e:
+                    logger.error(f"写入指标文件失败: {e}")
+
+        threading.Thread(target=dump_loop, name="MetricsDump", daemon=True).start()
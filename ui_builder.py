@@ -1,13 +1,19 @@
 import tkinter as tk
 from tkinter import scrolledtext
 import os
-from PIL import Image, ImageTk
 import logging
 from chat_bubble import ChatBubble  # 导入聊天气泡模块
 from info_panel import InfoPanel  # 导入信息面板模块
+from asset_bundle import load_bundled_photo, open_image
+from tracing import traced
+from image_registry import get_image_registry
 
 logger = logging.getLogger(__name__)
 
+class ChatPane:
+    """一个聊天区：画布、滚动条和承载气泡的框架（多会话时每个标签页一个）"""
+    __slots__ = ("chat_container", "scrollbar", "chat_frame", "chat_container_window", "chat_bubble")
+
 class UIBuilder:
     """界面构建类，负责创建和管理用户交互界面组件"""
     def __init__(self, root, screen_width, screen_height):
@@ -41,6 +47,7 @@ class UIBuilder:
         
         # 界面元素变量
         self.tool_var = tk.StringVar(value="自动分类")
+        self.group_var = tk.BooleanVar(value=False)  # 群聊模式：问题同时发给所有场景智能体
         self.input_text = None
         self.response_text = None
         self.file_display = None
@@ -52,7 +59,19 @@ class UIBuilder:
         # 背景图片相关
         self.bg_photo = None
         self.bg_label = None
-        self.original_bg_image = None
+        self.bg_handle = None  # 背景图片在图片登记表中的句柄
+        self.bg_path = "background.jpg"  # 当前背景图片路径
+        self.bg_size = None  # 当前背景图片的显示尺寸
+
+        # 性能面板（默认隐藏，enable_perf_hud后可用快捷键切换）
+        self.perf_hud = None
+        self.perf_hud_provider = None
+        self.perf_hud_interval = 500  # 刷新间隔(毫秒)
+        self._perf_hud_after = None  # 待执行的刷新回调ID
+
+        # 界面中的图片统一由图片登记表持有，按内存预算释放屏幕外的图片
+        self.image_registry = get_image_registry()
+        self.image_registry.attach(root)
 
         # 初始化界面
         self._setup_background()
@@ -69,14 +88,43 @@ class UIBuilder:
         self.root.bind("<Configure>", self._on_resize)
         
         # 初始化聊天气泡管理器
-        self.chat_bubble = ChatBubble(self)
+        self.chat_bubble = self.chat_pane.chat_bubble = ChatBubble(self)
+
+    def create_chat_pane(self):
+        """创建聊天区（不显示），气泡管理器由调用方创建"""
+        pane = ChatPane()
+        pane.chat_container = tk.Canvas(self.response_frame, bg="#f0f0f0", highlightthickness=0)
+        pane.scrollbar = tk.Scrollbar(self.response_frame, orient="vertical", command=pane.chat_container.yview)
+        pane.chat_frame = tk.Frame(pane.chat_container, bg="#f0f0f0")
+        pane.chat_container_window = pane.chat_container.create_window((0, 0), window=pane.chat_frame, anchor="nw")
+        pane.chat_bubble = None
+
+        # 配置滚动区域（由ChatBubble类管理），滚动时由图片登记表检查图片是否回到屏幕内
+        pane.chat_container.config(yscrollcommand=self.image_registry.track_scroll(pane.scrollbar.set))
+        return pane
+
+    def show_chat_pane(self, pane):
+        """显示指定的聊天区，chat_container等属性随之指向该聊天区"""
+        if pane is self.chat_pane:
+            return
+        self.chat_container.pack_forget()
+        self.scrollbar.pack_forget()
+        self.chat_pane = pane
+        self.chat_container = pane.chat_container
+        self.scrollbar = pane.scrollbar
+        self.chat_frame = pane.chat_frame
+        self.chat_container_window = pane.chat_container_window
+        self.chat_bubble = pane.chat_bubble
+        self.chat_container.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+        self.scrollbar.pack(side="right", fill="y")
     
     def set_background(self, image_path):
         """设置新的背景图片"""
         try:
             # 加载新背景图片
-            self.original_bg_image = Image.open(image_path)
-            
+            self.bg_path = image_path
+            self.bg_size = None
+
             # 使用当前窗口尺寸
             width = self.root.winfo_width()
             height = self.root.winfo_height()
@@ -85,15 +133,8 @@ class UIBuilder:
             if width < 10 or height < 10:
                 width = self.screen_width
                 height = self.screen_height
-                
-            # 调整图片大小
-            bg_image = self.original_bg_image.resize((width, height), Image.LANCZOS)
-            self.bg_photo = ImageTk.PhotoImage(bg_image)
-            
-            # 更新背景标签
-            self.bg_label.config(image=self.bg_photo)
-            self.bg_label.image = self.bg_photo  # 保持引用
-            
+
+            self._render_background(width, height)
             logger.info(f"背景已切换到: {image_path}")
             
         except Exception as e:
@@ -102,16 +143,42 @@ class UIBuilder:
             self.root.config(bg="#f0f0f0")
 
     def _setup_background(self):
-        """设置界面背景图片"""
-        try:
-            # 尝试加载背景图片
-            self.original_bg_image = Image.open("background.jpg")  # 替换为你的图片路径
-            bg_image = self.original_bg_image.resize((self.screen_width, self.screen_height), Image.LANCZOS)
-            self.bg_photo = ImageTk.PhotoImage(bg_image)
-            self.bg_label = tk.Label(self.root, image=self.bg_photo)
-            self.bg_label.place(x=0, y=0, relwidth=1, relheight=1)
-        except Exception as e:
-            logger.error(f"加载背景图片失败: {e}")
+        """设置界面背景，先用纯色占位，窗口首次绘制后再加载并缩放背景图片"""
+        self.bg_label = tk.Label(self.root, bg="#f0f0f0")
+        self.bg_label.place(x=0, y=0, relwidth=1, relheight=1)
+        # 空闲回调在首帧布局和绘制之后执行，大图解码和缩放不再阻塞窗口显示
+        self.root.after_idle(lambda: self.root.after(0, self._load_background))
+
+    def _load_background(self):
+        """加载背景图片（由_setup_background延迟调用）"""
+        if self.bg_photo is None:
+            self.set_background(self.bg_path)
+
+    def _render_background(self, width, height):
+        """按指定尺寸显示背景：优先使用资源包中的预缩放图片，否则用PIL缩放原图"""
+        if self.bg_size == (width, height):
+            return
+        path = self.bg_path
+
+        def load():
+            photo = load_bundled_photo(path, (width, height), self.root)
+            if photo is None:
+                from PIL import Image, ImageTk  # 首次需要缩放背景时才加载PIL
+                # 原图作为可释放的缓存计入内存预算，再次缩放时按需重新打开
+                source = self.image_registry.get_cached(
+                    ("background", path),
+                    lambda: open_image(path),
+                    lambda image: image.width * image.height * len(image.getbands()),
+                )
+                photo = ImageTk.PhotoImage(source.resize((width, height), Image.LANCZOS))
+            return photo
+
+        # 更新背景标签，旧背景图片随之释放
+        if self.bg_handle is not None:
+            self.image_registry.release(self.bg_handle)
+        self.bg_handle = self.image_registry.acquire(f"background:{path}", load, widget=self.bg_label, pinned=True)
+        self.bg_photo = self.bg_handle.photo
+        self.bg_size = (width, height)
     
     def _create_widgets(self):
         """创建界面组件"""
@@ -129,6 +196,10 @@ class UIBuilder:
             bg="#f5e8d9", fg="#333", padx=5, pady=5,
             relief=tk.FLAT, cursor="hand2"
         )
+        self.group_check = tk.Checkbutton(
+            self.toolbar, text="群聊", variable=self.group_var, font=("SimHei", 10),
+            bg="#f5e8d9", fg="#333", activebackground="#f5e8d9", cursor="hand2"
+        )
         self.stream_status = tk.Label(
             self.toolbar, text="流式传输: 就绪", font=("SimHei", 10),
             bg="#f5e8d9", fg="#333"
@@ -206,13 +277,11 @@ class UIBuilder:
         )
 
         # 创建聊天消息容器
-        self.chat_container = tk.Canvas(self.response_frame, bg="#f0f0f0", highlightthickness=0)
-        self.scrollbar = tk.Scrollbar(self.response_frame, orient="vertical", command=self.chat_container.yview)
-        self.chat_frame = tk.Frame(self.chat_container, bg="#f0f0f0")
-        self.chat_container_window = self.chat_container.create_window((0, 0), window=self.chat_frame, anchor="nw")
-
-        # 配置滚动区域（由ChatBubble类管理）
-        self.chat_container.config(yscrollcommand=self.scrollbar.set)
+        self.chat_pane = self.create_chat_pane()
+        self.chat_container = self.chat_pane.chat_container
+        self.scrollbar = self.chat_pane.scrollbar
+        self.chat_frame = self.chat_pane.chat_frame
+        self.chat_container_window = self.chat_pane.chat_container_window
         
         # 状态栏
         self.status_bar = tk.Label(
@@ -240,6 +309,7 @@ class UIBuilder:
         # 布局对话框内部组件
         self.toolbar.pack(fill=tk.X, padx=10, pady=5)
         self.new_chat_button.pack(side=tk.LEFT, padx=5)
+        self.group_check.pack(side=tk.LEFT, padx=5)
         self.stream_status.pack(side=tk.RIGHT, padx=5)
         self.exit_button.pack(side=tk.RIGHT, padx=5)
         
@@ -289,14 +359,10 @@ class UIBuilder:
             self.root.grid_columnconfigure(0, minsize=total_width*2//3)
             self.root.grid_columnconfigure(1, minsize=total_width//3)
 
-            # 更新背景图片
+            # 更新背景图片（尺寸未变化时跳过）
             try:
-                if self.original_bg_image:
-                    width = event.width
-                    height = event.height
-                    bg_image = self.original_bg_image.resize((width, height), Image.LANCZOS)
-                    self.bg_photo = ImageTk.PhotoImage(bg_image)
-                    self.bg_label.config(image=self.bg_photo)
+                if self.bg_photo is not None:
+                    self._render_background(event.width, event.height)
             except Exception as e:
                 logger.error(f"调整背景图片失败: {e}")
             
@@ -383,11 +449,59 @@ class UIBuilder:
         """添加聊天消息气泡（委托给ChatBubble类处理）"""
         return self.chat_bubble.add_chat_message(message, is_user)
     
+    @traced("UIBuilder.update_chat_message")
     def update_chat_message(self, message_widget, new_text):
         """更新现有的聊天消息内容"""
         if isinstance(message_widget, tk.Label):
             message_widget.config(text=new_text)
 
+    def enable_perf_hud(self, provider, hotkey="<F12>", interval=0.5):
+        """启用性能面板
+        Args:
+            provider: 返回[(名称, 显示值), ...]的函数
+            hotkey: 切换显示的快捷键
+            interval: 显示期间的刷新间隔(秒)，隐藏时不刷新
+        """
+        self.perf_hud_provider = provider
+        self.perf_hud_interval = int(interval * 1000)
+        self.root.bind_all(hotkey, lambda event: self.toggle_perf_hud())
+
+    def toggle_perf_hud(self):
+        """显示或隐藏性能面板"""
+        if self.perf_hud is not None:
+            # 先取消待执行的刷新，避免回调在面板销毁后执行
+            if self._perf_hud_after is not None:
+                self.perf_hud.after_cancel(self._perf_hud_after)
+                self._perf_hud_after = None
+            self.perf_hud.destroy()
+            self.perf_hud = None
+            return
+        self.perf_hud = tk.Label(
+            self.root,
+            justify=tk.LEFT,
+            anchor="nw",
+            font=("Consolas", 10),
+            fg="#7CFC00",
+            bg="#1e1e1e",
+            padx=8,
+            pady=6,
+        )
+        self.perf_hud.place(relx=1.0, x=-10, y=10, anchor="ne")
+        self._refresh_perf_hud()
+
+    def _refresh_perf_hud(self):
+        """按固定间隔刷新性能面板，面板隐藏后停止"""
+        self._perf_hud_after = None
+        if self.perf_hud is None or not self.perf_hud_provider:
+            return
+        try:
+            rows = self.perf_hud_provider()
+            width = max((len(name) for name, _ in rows), default=0)
+            self.perf_hud.config(text="\n".join(f"{name.ljust(width)}  {value}" for name, value in rows))
+        except Exception as e:
+            logger.error(f"刷新性能面板失败: {e}")
+        self._perf_hud_after = self.perf_hud.after(self.perf_hud_interval, self._refresh_perf_hud)
+
 # 以下是测试代码
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,261 @@
+"""基于asyncio流的最小WebSocket实现（RFC 6455），供网关和测试客户端使用
+
+只依赖标准库：握手、帧编解码（含分片和掩码）、ping/pong和关闭握手，不支持扩展（如压缩）。
+"""
+import os
+import base64
+import struct
+import asyncio
+import hashlib
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_POLICY = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN = 1013
+
+MAX_HEAD_SIZE = 16 * 1024
+
+
+class WebSocketError(Exception):
+    """协议错误，code为关闭连接时发送的状态码"""
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    """根据客户端的Sec-WebSocket-Key计算Sec-WebSocket-Accept"""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def _apply_mask(data, mask):
+    """按4字节掩码异或（整数运算，避免逐字节循环）"""
+    length = len(data)
+    if not length:
+        return data
+    key = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+    return (int.from_bytes(data, "big") ^ key).to_bytes(length, "big")
+
+
+def encode_frame(opcode, payload, mask=False):
+    """编码一个完整帧（FIN=1），客户端发送的帧必须加掩码"""
+    length = len(payload)
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        head.append(mask_bit | length)
+    elif length < 65536:
+        head.append(mask_bit | 126)
+        head += struct.pack("!H", length)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack("!Q", length)
+    if mask:
+        key = os.urandom(4)
+        return bytes(head) + key + _apply_mask(payload, key)
+    return bytes(head) + payload
+
+
+async def read_http_head(reader):
+    """读取HTTP请求或响应头，返回(首行, 小写键的头字典)；连接关闭时返回(None, {})"""
+    try:
+        data = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None, {}
+    except asyncio.LimitOverrunError:
+        raise WebSocketError("HTTP头过长")
+    if len(data) > MAX_HEAD_SIZE:
+        raise WebSocketError("HTTP头过长")
+    lines = data.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+def is_upgrade_request(headers):
+    return (headers.get("upgrade", "").lower() == "websocket"
+            and "upgrade" in headers.get("connection", "").lower()
+            and "sec-websocket-key" in headers)
+
+
+def handshake_response(headers):
+    """返回接受WebSocket握手的101响应"""
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n"
+    ).encode("ascii")
+
+
+class WebSocket:
+    """一个已完成握手的WebSocket连接"""
+    def __init__(self, reader, writer, is_client=False, max_message_size=1024 * 1024):
+        """初始化连接
+        Args:
+            reader, writer: asyncio流
+            is_client: 客户端发送的帧加掩码，服务端要求收到的帧有掩码
+            max_message_size: 单条消息（分片合并后）的最大字节数
+        """
+        self.reader = reader
+        self.writer = writer
+        self.is_client = is_client
+        self.max_message_size = max_message_size
+        self.closed = False
+        self.close_code = None
+        self._write_lock = asyncio.Lock()
+
+    async def _read_frame(self):
+        head = await self.reader.readexactly(2)
+        fin = head[0] & 0x80
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        length = head[1] & 0x7F
+        if head[0] & 0x70:
+            raise WebSocketError("不支持的扩展位")
+        if masked == self.is_client:
+            raise WebSocketError("帧掩码不符合协议")
+        if length == 126:
+            length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+        if opcode >= OP_CLOSE and (length > 125 or not fin):
+            raise WebSocketError("控制帧过长或被分片")
+        if length > self.max_message_size:
+            raise WebSocketError("消息过长", CLOSE_TOO_BIG)
+        mask = await self.reader.readexactly(4) if masked else None
+        payload = await self.reader.readexactly(length)
+        if mask:
+            payload = _apply_mask(payload, mask)
+        return fin, opcode, payload
+
+    async def recv(self):
+        """接收一条消息（文本为str，二进制为bytes），连接关闭时返回None"""
+        fragments = []
+        message_opcode = None
+        size = 0
+        while not self.closed:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            except WebSocketError as e:
+                logger.warning(f"WebSocket协议错误: {e}")
+                await self.close(e.code, str(e))
+                return None
+
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                self.close_code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                # 回应关闭帧后结束连接
+                await self.close(self.close_code)
+                return None
+
+            if opcode == OP_CONTINUATION:
+                if message_opcode is None:
+                    await self.close(CLOSE_PROTOCOL_ERROR, "意外的续帧")
+                    return None
+            elif message_opcode is not None:
+                await self.close(CLOSE_PROTOCOL_ERROR, "分片消息未结束")
+                return None
+            else:
+                message_opcode = opcode
+            size += len(payload)
+            if size > self.max_message_size:
+                await self.close(CLOSE_TOO_BIG, "消息过长")
+                return None
+            fragments.append(payload)
+            if fin:
+                data = b"".join(fragments)
+                if message_opcode == OP_TEXT:
+                    try:
+                        return data.decode("utf-8")
+                    except UnicodeDecodeError:
+                        await self.close(CLOSE_INVALID_DATA, "文本不是有效的UTF-8")
+                        return None
+                return data
+        return None
+
+    async def _send_frame(self, opcode, payload):
+        async with self._write_lock:
+            self.writer.write(encode_frame(opcode, payload, mask=self.is_client))
+            # 对方读取变慢时在这里等待，由调用方决定积压消息的处理方式
+            await self.writer.drain()
+
+    async def send(self, message):
+        """发送文本(str)或二进制(bytes)消息"""
+        if self.closed:
+            raise ConnectionError("WebSocket已关闭")
+        if isinstance(message, str):
+            await self._send_frame(OP_TEXT, message.encode("utf-8"))
+        else:
+            await self._send_frame(OP_BINARY, message)
+
+    async def close(self, code=CLOSE_NORMAL, reason=""):
+        """发送关闭帧并关闭连接（重复调用无副作用）"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            payload = struct.pack("!H", code) + reason.encode("utf-8")[:120]
+            self.writer.write(encode_frame(OP_CLOSE, payload, mask=self.is_client))
+            await asyncio.wait_for(self.writer.drain(), 1.0)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.writer.close()
+
+
+async def connect(url, timeout=10, max_message_size=1024 * 1024):
+    """连接WebSocket服务（ws://host:port/path），返回WebSocket"""
+    parts = urlsplit(url)
+    if parts.scheme != "ws":
+        raise ValueError(f"只支持ws://地址: {url}")
+    host, port = parts.hostname, parts.port or 80
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    writer.write((
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n"
+    ).encode("ascii"))
+    await writer.drain()
+    status_line, headers = await asyncio.wait_for(read_http_head(reader), timeout)
+    if not status_line or status_line.split(" ", 2)[1:2] != ["101"]:
+        writer.close()
+        status = status_line.split(" ", 2)[1] if status_line else "连接已关闭"
+        raise WebSocketError(f"握手被拒绝: {status}", CLOSE_TRY_AGAIN)
+    if headers.get("sec-websocket-accept") != accept_key(key):
+        writer.close()
+        raise WebSocketError("握手校验失败")
+    return WebSocket(reader, writer, is_client=True, max_message_size=max_message_size)
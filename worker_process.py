@@ -0,0 +1,503 @@
+"""网络和解码子进程：SSE请求与解析、媒体下载、图片和音频解码在子进程中进行，界面进程只负责显示
+
+界面进程中的ProcessAPIClient与AgentAPIClient接口相同（对话引擎、群聊和标签页无需改动），
+call_agent把请求交给子进程，子进程中的AgentAPIClient完成请求，回调以紧凑的元组经管道传回：
+文本片段只传(类型, 调用ID, 片段, 发出时间)，解码后的像素和PCM数据放在共享内存中，
+管道中只传共享内存的名称和格式。接收方取出数据后通知子进程释放共享内存。
+
+音频仍在界面进程中播放（pygame.mixer属于界面进程），子进程按界面进程mixer的格式解码为PCM，
+界面进程直接放入音频引擎的解码缓存。文件上传和音频播放控制仍在界面进程中执行。
+子进程的日志记录同样经管道交给界面进程，由界面进程的日志管道统一脱敏、采样和写入。
+"""
+import os
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from api_client import AgentAPIClient
+from app_config import scene_for_key
+from audio_cache import DecodedClip
+from stream_events import TextData, PreviewData, MediaResult
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (150, 100)  # 与聊天框中的缩略图尺寸一致
+
+# 界面进程 -> 子进程
+MSG_CALL = "call"  # (MSG_CALL, 调用ID, API密钥, 会话ID, 文本, 工具名, 工具参数, 用户ID, 文件, 工具配置, 后台)
+MSG_DECODE_AUDIO = "decode_audio"  # (MSG_DECODE_AUDIO, 文件路径, mixer格式)
+MSG_RELEASE = "release"  # (MSG_RELEASE, 共享内存名称)
+MSG_STOP = "stop"
+# 子进程 -> 界面进程
+MSG_TEXT = "t"  # (MSG_TEXT, 调用ID, 片段, 发出时间)
+MSG_DATA = "d"  # (MSG_DATA, 调用ID, 其他on_data数据（StreamData）)
+MSG_MARK = "m"  # (MSG_MARK, 调用ID, 本轮统计的阶段)
+MSG_END = "e"  # (MSG_END, 调用ID, on_end的参数)
+MSG_RESULT = "r"  # (MSG_RESULT, 调用ID, call_agent的返回值, token数)
+MSG_AUDIO = "a"  # (MSG_AUDIO, 文件路径, 修改时间, SharedBuffer, 频率, 声道数, 帧字节数)，解码失败时SharedBuffer为None
+MSG_LOG = "l"  # (MSG_LOG, 日志记录的属性)
+
+
+class SharedBuffer:
+    """共享内存中的一段数据，创建方保留共享内存直到接收方通知释放"""
+    __slots__ = ("name", "size")
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def read(self):
+        """复制出数据（接收方调用）"""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            return bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+
+
+class SharedImage:
+    """共享内存中的解码像素"""
+    __slots__ = ("buffer", "mode", "size")
+
+    def __init__(self, buffer, mode, size):
+        self.buffer = buffer
+        self.mode = mode
+        self.size = size
+
+
+# ---- 子进程 ----
+
+class _RemoteTurn:
+    """子进程中代替TurnTimer：阶段首次到达时通知界面进程，由界面进程的TurnTimer记录"""
+    __slots__ = ("worker", "call_id", "marks", "tokens", "scene")
+
+    def __init__(self, worker, call_id):
+        self.worker = worker
+        self.call_id = call_id
+        self.marks = set()
+        self.tokens = 0
+        self.scene = "default"
+
+    def mark(self, phase):
+        if phase not in self.marks:
+            self.marks.add(phase)
+            self.worker.send((MSG_MARK, self.call_id, phase))
+
+
+class _Worker:
+    """子进程：接收请求，在各自的线程中调用API并把回调发回界面进程"""
+    def __init__(self, conn, base_url, api_key, download_dir):
+        self.conn = conn
+        self.client = AgentAPIClient(base_url, api_key)
+        self.client.prefetch_audio = False  # 音频由界面进程请求后按mixer格式解码
+        self.client.download_dir = download_dir
+        self.shared = {}  # 共享内存名称 -> 等待界面进程取出的SharedMemory
+        self.audio_queue = queue.Queue()
+        self._send_lock = threading.Lock()
+        self._shared_lock = threading.Lock()
+        self._handlers = {
+            MSG_CALL: self._start_call,
+            MSG_DECODE_AUDIO: lambda file_path, mixer_format: self.audio_queue.put((file_path, mixer_format)),
+            MSG_RELEASE: self._release,
+        }
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def run(self):
+        threading.Thread(target=self._audio_loop, name="WorkerAudioDecode", daemon=True).start()
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == MSG_STOP:
+                break
+            handler = self._handlers.get(message[0])
+            if handler is None:
+                logger.warning(f"未知消息: {message[0]}")
+                continue
+            handler(*message[1:])
+        with self._shared_lock:
+            for shm in self.shared.values():
+                shm.close()
+                shm.unlink()
+            self.shared = {}
+        self.client.download_manager.shutdown()
+
+    # ---- 共享内存 ----
+
+    def share(self, data):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        with self._shared_lock:
+            self.shared[shm.name] = shm
+        return SharedBuffer(shm.name, len(data))
+
+    def share_image(self, image):
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        return SharedImage(self.share(image.tobytes()), image.mode, image.size)
+
+    def _release(self, name):
+        with self._shared_lock:
+            shm = self.shared.pop(name, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    # ---- 请求 ----
+
+    def _start_call(self, call_id, *args):
+        threading.Thread(target=self._call, args=(call_id, *args), name=f"WorkerCall-{call_id}", daemon=True).start()
+
+    def _call(self, call_id, api_key, conversation_id, input_text, tool_name, tool_params, user_id, files, tools,
+              background):
+        client = self.client.fork(api_key)
+        client.current_conversation_id = conversation_id
+        client.tools = tools
+        client.background = background
+        turn = _RemoteTurn(self, call_id)
+        result = client.call_agent(
+            input_text,
+            tool_name,
+            tool_params,
+            user_id,
+            files,
+            on_data=lambda data: self._on_data(call_id, data),
+            on_end=lambda response: self.send((MSG_END, call_id, response)),
+            turn=turn,
+        )
+        self.send((MSG_RESULT, call_id, result, turn.tokens))
+
+    def _on_data(self, call_id, data):
+        if type(data) is TextData:
+            self.send((MSG_TEXT, call_id, data.text, data.emitted_at))
+            return
+        if type(data) is PreviewData:
+            data = PreviewData(data.media_index, self.share_image(data.image))
+        elif type(data) is MediaResult and data.item.kind == "image" and data.item.ok:
+            data = MediaResult(data.item, self._thumbnail(data.item.file_path))
+        self.send((MSG_DATA, call_id, data))
+
+    def _thumbnail(self, file_path):
+        """解码图片并缩放为聊天框缩略图"""
+        try:
+            from PIL import Image
+            with Image.open(file_path) as img:
+                return self.share_image(img.resize(THUMBNAIL_SIZE, Image.LANCZOS))
+        except Exception as e:
+            logger.warning(f"生成缩略图失败: {file_path}, {e}")
+            return None
+
+    # ---- 音频解码 ----
+
+    def _audio_loop(self):
+        while True:
+            file_path, mixer_format = self.audio_queue.get()
+            try:
+                self._decode_audio(file_path, mixer_format)
+            except Exception as e:
+                logger.warning(f"解码音频失败: {file_path}, {e}")
+                self.send((MSG_AUDIO, file_path, None, None, 0, 0, 0))
+
+    def _decode_audio(self, file_path, mixer_format):
+        """按界面进程mixer的格式解码为PCM（与DecodedAudioCache的解码相同）"""
+        import pygame
+        frequency, fmt, channels = mixer_format
+        if pygame.mixer.get_init() != tuple(mixer_format):
+            pygame.mixer.quit()
+            pygame.mixer.init(frequency=frequency, size=fmt, channels=channels)
+        mtime = os.path.getmtime(file_path)
+        raw = pygame.mixer.Sound(file_path).get_raw()
+        frame_bytes = (abs(fmt) // 8) * channels
+        self.send((MSG_AUDIO, file_path, mtime, self.share(raw), frequency, channels, frame_bytes))
+
+
+class _PipeLogHandler(logging.Handler):
+    """子进程的日志处理器：把日志记录发给界面进程"""
+    def __init__(self, worker):
+        super().__init__()
+        self.worker = worker
+
+    def emit(self, record):
+        try:
+            # 与QueueHandler.prepare相同：先合并参数和异常信息，只传可序列化的属性
+            attrs = dict(vars(record))
+            attrs["msg"] = record.getMessage()
+            attrs["args"] = None
+            if record.exc_info:
+                attrs["exc_text"] = logging.Formatter().formatException(record.exc_info)
+            attrs["exc_info"] = None
+            attrs["threadName"] = f"{record.processName}/{record.threadName}"
+            self.worker.send((MSG_LOG, attrs))
+        except Exception:
+            self.handleError(record)
+
+
+def worker_main(conn, base_url, api_key, download_dir, log_level=logging.INFO):
+    """子进程入口"""
+    # 子进程不输出声音，只用mixer解码
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    worker = _Worker(conn, base_url, api_key, download_dir)
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    root.addHandler(_PipeLogHandler(worker))
+    worker.run()
+
+
+# ---- 界面进程 ----
+
+class _Call:
+    """一个进行中的请求"""
+    __slots__ = ("client", "on_data", "on_end", "turn", "ended", "result", "done")
+
+    def __init__(self, client, on_data, on_end, turn):
+        self.client = client
+        self.on_data = on_data
+        self.on_end = on_end
+        self.turn = turn
+        self.ended = None  # message_end的回复
+        self.result = None
+        self.done = threading.Event()
+
+
+class WorkerProcess:
+    """界面进程中的子进程句柄：发送请求，在读取线程中把子进程的消息转为API客户端的回调"""
+    def __init__(self, base_url, api_key, download_dir, max_thumbnails=64):
+        """启动子进程
+        Args:
+            base_url, api_key: 子进程中API客户端的初始参数（每个请求另行指定API密钥）
+            download_dir: 媒体下载目录（两个进程共用）
+            max_thumbnails: 已生成但尚未使用的缩略图上限
+        """
+        context = multiprocessing.get_context("spawn")  # 不继承Tk和音频的状态，各平台行为一致
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child_conn, base_url, api_key, download_dir, logging.getLogger().getEffectiveLevel()),
+            name="AgentWorker", daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.max_thumbnails = max_thumbnails
+        self.calls = {}  # 调用ID -> _Call
+        self.thumbnails = OrderedDict()  # 文件路径 -> 子进程生成的缩略图(PIL图片)
+        self.audio_engines = {}  # 文件路径 -> 等待解码结果的音频引擎
+        self.alive = True
+        self.stats = {"messages": 0, "shared_bytes": 0, "calls": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._handlers = {
+            MSG_TEXT: self._on_text,
+            MSG_DATA: self._on_data,
+            MSG_MARK: self._on_mark,
+            MSG_END: self._on_end,
+            MSG_RESULT: self._on_result,
+            MSG_AUDIO: self._on_audio,
+            MSG_LOG: self._on_log,
+        }
+        threading.Thread(target=self._read_loop, name="WorkerReader", daemon=True).start()
+
+    def _send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def stop(self, timeout=2.0):
+        """通知子进程退出（释放共享内存），超时后强制结束"""
+        if self.process.is_alive():
+            try:
+                self._send((MSG_STOP,))
+            except OSError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.conn.close()
+
+    def call(self, client, args, on_data, on_end, turn, timeout):
+        """在子进程中执行call_agent并等待结束，返回值与call_agent相同"""
+        call = _Call(client, on_data, on_end, turn)
+        call_id = next(self._ids)
+        with self._lock:
+            self.calls[call_id] = call
+        try:
+            if not self.alive:
+                raise ConnectionError("解码进程已退出")
+            self._send((MSG_CALL, call_id, client.api_key, client.current_conversation_id, *args))
+            self.stats["calls"] += 1
+            if not call.done.wait(timeout):
+                raise TimeoutError("等待解码进程超时")
+            if call.result is None:
+                # 回复已结束后子进程才退出（例如关闭程序时），按正常结束处理
+                if call.ended is not None:
+                    return call.ended
+                raise ConnectionError("解码进程已退出")
+            return call.result
+        except Exception as e:
+            logger.error("处理请求时发生异常: %s", e)
+            error = {"type": "text", "content": f"处理请求异常: {str(e)}"}
+            if on_end and call.ended is None:
+                on_end(error)
+            return error
+        finally:
+            with self._lock:
+                self.calls.pop(call_id, None)
+
+    def take_thumbnail(self, file_path):
+        """取出子进程为该图片生成的缩略图，没有时返回None"""
+        with self._lock:
+            return self.thumbnails.pop(file_path, None)
+
+    def _read(self, buffer):
+        data = buffer.read()
+        self.stats["shared_bytes"] += buffer.size
+        self._send((MSG_RELEASE, buffer.name))
+        return data
+
+    def _image(self, shared):
+        from PIL import Image
+        return Image.frombytes(shared.mode, shared.size, self._read(shared.buffer))
+
+    # ---- 读取线程 ----
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            self.stats["messages"] += 1
+            try:
+                self._handlers[message[0]](*message[1:])
+            except Exception as e:
+                logger.error(f"处理解码进程消息{message[0]}失败: {e}")
+
+        # 子进程退出：结束所有等待中的请求
+        self.alive = False
+        with self._lock:
+            calls = list(self.calls.values())
+        for call in calls:
+            call.done.set()
+
+    def _get(self, call_id):
+        with self._lock:
+            return self.calls.get(call_id)
+
+    def _on_text(self, call_id, chunk, emitted_at):
+        call = self._get(call_id)
+        if call is None:
+            return
+        if call.turn:
+            call.turn.tokens += 1
+        if call.on_data:
+            call.on_data(TextData(chunk, emitted_at))
+
+    def _on_data(self, call_id, data):
+        call = self._get(call_id)
+        if type(data) is PreviewData:
+            data = PreviewData(data.media_index, self._image(data.image))
+        elif type(data) is MediaResult:
+            item = data.item
+            if data.thumbnail is not None:
+                image = self._image(data.thumbnail)
+                with self._lock:
+                    self.thumbnails[item.file_path] = image
+                    while len(self.thumbnails) > self.max_thumbnails:
+                        self.thumbnails.popitem(last=False)
+            if call is not None and item.kind == "audio" and item.ok and call.client.prefetch_audio:
+                self._decode_audio(call.client.audio_engine, item.file_path)
+            data = MediaResult(item)
+        if call is not None and call.on_data:
+            call.on_data(data)
+
+    def _on_mark(self, call_id, phase):
+        call = self._get(call_id)
+        if call is not None and call.turn:
+            call.turn.mark(phase)
+
+    def _on_end(self, call_id, response):
+        call = self._get(call_id)
+        if call is None:
+            return
+        call.ended = response
+        if call.on_end:
+            call.on_end(response)
+
+    def _on_result(self, call_id, result, tokens):
+        call = self._get(call_id)
+        if call is None:
+            return
+        if call.turn and tokens:
+            call.turn.tokens = tokens
+        call.result = result
+        call.done.set()
+
+    def _on_log(self, attrs):
+        # 经本进程的日志器处理（级别已在子进程中判断），与本进程的日志一样脱敏、采样后写入
+        record = logging.makeLogRecord(attrs)
+        logging.getLogger(record.name).handle(record)
+
+    def _decode_audio(self, audio_engine, file_path):
+        """请求子进程按mixer格式解码音频，mixer不可用时跳过（播放时再解码）"""
+        try:
+            mixer_format = audio_engine.mixer_format()
+        except Exception as e:
+            logger.debug(f"mixer不可用，不预解码音频: {e}")
+            return
+        with self._lock:
+            self.audio_engines[file_path] = audio_engine
+        self._send((MSG_DECODE_AUDIO, file_path, mixer_format))
+
+    def _on_audio(self, file_path, mtime, buffer, frequency, channels, frame_bytes):
+        with self._lock:
+            audio_engine = self.audio_engines.pop(file_path, None)
+        if buffer is None:
+            return
+        raw = self._read(buffer)
+        if audio_engine is not None:
+            audio_engine.cache.store(DecodedClip(file_path, mtime, raw, frequency, channels, frame_bytes))
+
+
+class ProcessAPIClient(AgentAPIClient):
+    """在子进程中执行请求的API客户端，接口与AgentAPIClient相同"""
+    def __init__(self, base_url, api_key, download_dir=None, worker=None):
+        super().__init__(base_url, api_key)
+        if download_dir:
+            self.download_dir = download_dir
+        self.worker = worker or WorkerProcess(base_url, api_key, self.download_dir)
+
+    def call_agent(
+        self,
+        input_text,
+        tool_name=None,
+        tool_params=None,
+        user_id="default_user",
+        files=None,
+        on_data=None,
+        on_end=None,
+        turn=None,
+    ):
+        """在子进程中调用Dify智能体API，回调在本进程的读取线程中执行"""
+        if turn:
+            turn.scene = scene_for_key(self.api_key)
+            turn.mark("request_sent")
+        tools = {tool_name: self.tools[tool_name]} if tool_name in self.tools else {}
+        args = (input_text, tool_name, tool_params, user_id, files, tools, self.background)
+        # 子进程自身有请求超时，这里多等一段时间用于媒体下载
+        result = self.worker.call(self, args, on_data, on_end, turn, self.timeout + 60)
+        if result.get("conversation_id"):
+            self.current_conversation_id = result["conversation_id"]
+        return result
+
+    def take_thumbnail(self, file_path):
+        return self.worker.take_thumbnail(file_path)
+
+    def close(self):
+        """结束子进程（程序退出时调用）"""
+        self.worker.stop()